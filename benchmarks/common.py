@@ -0,0 +1,171 @@
+"""
+基准测试的公共工具
+计时统计、结果JSON的读写，以及提供签名图片的本地HTTP服务
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional
+
+from PIL import Image, ImageDraw
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCHMARK_DIR)
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """线性插值的百分位数，samples 无需预先排序"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """耗时样本（秒）的统计，结果以毫秒为单位"""
+    return {
+        "count": len(samples),
+        "min_ms": min(samples) * 1000 if samples else 0.0,
+        "mean_ms": statistics.fmean(samples) * 1000 if samples else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "max_ms": max(samples) * 1000 if samples else 0.0,
+    }
+
+
+def measure(
+    fn: Callable[[], Any],
+    iterations: int,
+    warmup: int = 1,
+    setup: Optional[Callable[[], Any]] = None
+) -> Dict[str, float]:
+    """重复执行 fn 并统计单次耗时，setup 在每次执行前调用且不计入耗时"""
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        fn()
+    samples = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def environment_info() -> Dict[str, Any]:
+    """记录运行环境，比较结果时用于确认两次运行是否可比"""
+    import PIL
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pillow": PIL.__version__,
+    }
+
+
+def write_results(kind: str, results: Dict[str, Any], output: Optional[str] = None) -> str:
+    """把结果写入JSON文件，默认写到 benchmarks/results/<kind>-<时间>.json"""
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{kind}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    payload = {"kind": kind, "environment": environment_info(), "results": results}
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    return output
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def make_signature_png(size=(800, 300)) -> bytes:
+    """生成一张带透明背景的签名图片"""
+    image = Image.new("RGBA", size, (255, 255, 255, 0))
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    points = [(x, height // 2 + int((height // 3) * ((x * 7919) % 97 - 48) / 48)) for x in range(0, width, 20)]
+    draw.line(points, fill=(20, 20, 80, 255), width=6)
+    buffer = BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def make_signature_photo(size=(4000, 3000)) -> bytes:
+    """生成一张手机拍摄尺寸的签名照片（JPEG）"""
+    image = Image.new("RGB", size, (238, 236, 228))
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    points = [(x, height // 2 + int((height // 4) * ((x * 7919) % 97 - 48) / 48)) for x in range(0, width, 80)]
+    draw.line(points, fill=(20, 20, 80), width=24)
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class SignatureServer:
+    """在本地线程中提供签名图片的HTTP服务，支持 ETag 条件请求"""
+
+    def __init__(self, delay: float = 0.0, port: int = 0):
+        payload = make_signature_png()
+        etag = '"signature-v1"'
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if delay:
+                    time.sleep(delay)
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(payload)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/signature.png"
+
+    def __enter__(self) -> "SignatureServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,73 @@
+"""
+比较两次基准测试结果
+延迟类指标增加或吞吐量下降超过阈值时视为性能回退，返回非零退出码
+
+用法:
+    python -m benchmarks.compare 基准.json 新结果.json [--threshold 0.10]
+"""
+import argparse
+import sys
+from typing import Dict, List, Tuple
+
+from benchmarks.common import load_results
+
+# 参与比较的指标: 名称 -> 是否越大越好
+METRICS = {
+    "p50_ms": False,
+    "p95_ms": False,
+    "throughput_rps": True,
+}
+
+
+def _flatten(payload: Dict) -> Dict[str, Dict[str, float]]:
+    """把 micro/load 结果统一为 名称 -> 指标"""
+    results = payload["results"]
+    if payload["kind"] == "micro":
+        return results["cases"]
+    return {f"concurrency_{level['concurrency']}": level for level in results["levels"]}
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> Tuple[List[str], List[str]]:
+    """返回 (报告行, 回退项)"""
+    if baseline["kind"] != current["kind"]:
+        raise ValueError(f"结果类型不同: {baseline['kind']} / {current['kind']}")
+
+    old, new = _flatten(baseline), _flatten(current)
+    lines, regressions = [], []
+    for name in sorted(set(old) & set(new)):
+        for metric, higher_is_better in METRICS.items():
+            if metric not in old[name] or not old[name][metric]:
+                continue
+            change = (new[name][metric] - old[name][metric]) / old[name][metric]
+            regressed = change < -threshold if higher_is_better else change > threshold
+            marker = "  <-- 回退" if regressed else ""
+            lines.append(
+                f"{name:<24} {metric:<15} {old[name][metric]:10.3f} -> {new[name][metric]:10.3f} "
+                f"({change:+.1%}){marker}"
+            )
+            if regressed:
+                regressions.append(f"{name}.{metric}")
+    return lines, regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="比较两次基准测试结果")
+    parser.add_argument("baseline", help="基准结果JSON")
+    parser.add_argument("current", help="新的结果JSON")
+    parser.add_argument("--threshold", type=float, default=0.10, help="允许的变化比例，默认0.10")
+    args = parser.parse_args(argv)
+
+    baseline, current = load_results(args.baseline), load_results(args.current)
+    lines, regressions = compare(baseline, current, args.threshold)
+    print(f"基准: {baseline['environment'].get('git_commit')}  当前: {current['environment'].get('git_commit')}")
+    for line in lines:
+        print(line)
+    if regressions:
+        print(f"发现 {len(regressions)} 项性能回退: {', '.join(regressions)}")
+        return 1
+    print("没有发现性能回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
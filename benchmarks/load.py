@@ -0,0 +1,177 @@
+"""
+HTTP服务的端到端压测
+在子进程中启动服务，本地线程提供签名图片，按不同并发度发送请求，
+统计 p50/p95/p99 延迟、吞吐量和状态码分布
+
+用法:
+    python -m benchmarks.load [--concurrency 1,4,16] [--duration 10] [--cache] [--output 结果.json]
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from benchmarks.common import PROJECT_DIR, SignatureServer, percentile, write_results
+
+SAMPLE_REQUEST = {
+    "ngoName": "OpenLab创新实验室",
+    "contents": "兹证明该学生在我们组织完成了Python高级编程课程的学习，表现优异。",
+    "date": "2025年1月1日",
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServiceProcess:
+    """在子进程中运行 uvicorn main:app"""
+
+    def __init__(self, port: int, env: Optional[Dict[str, str]] = None):
+        self.port = port
+        self.base_url = f"http://127.0.0.1:{port}"
+        self._env = dict(os.environ, **(env or {}))
+        self._process: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> "ServiceProcess":
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--log-level", "warning"],
+            cwd=PROJECT_DIR,
+            env=self._env
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError("服务启动失败")
+            try:
+                requests.get(self.base_url + "/", timeout=1)
+                return self
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise RuntimeError("等待服务启动超时")
+
+    def __exit__(self, *exc) -> None:
+        self._process.terminate()
+        try:
+            self._process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+
+
+def run_level(
+    base_url: str,
+    concurrency: int,
+    duration: float,
+    signature_url: str,
+    unique: bool
+) -> Dict[str, Any]:
+    """以固定并发度持续发送请求 duration 秒"""
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    sequence = iter(range(10 ** 9))
+
+    def worker():
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            with lock:
+                number = next(sequence)
+            body = dict(
+                SAMPLE_REQUEST,
+                studentName=f"学生{number}" if unique else "学生",
+                ngoSignature=signature_url
+            )
+            start = time.perf_counter()
+            try:
+                response = session.post(base_url + "/generate-certificate", json=body, timeout=120)
+                status = response.status_code
+            except requests.RequestException:
+                status = "error"
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[status] += 1
+                if status == 200:
+                    latencies.append(elapsed)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "duration_s": wall,
+        "requests": sum(statuses.values()),
+        "succeeded": len(latencies),
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000 if latencies else 0.0,
+        "status_counts": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="证书服务端到端压测")
+    parser.add_argument("--concurrency", default="1,4,16", help="并发度列表，逗号分隔")
+    parser.add_argument("--duration", type=float, default=10.0, help="每个并发度的持续时间（秒）")
+    parser.add_argument("--url", help="压测已运行的服务，不再启动子进程")
+    parser.add_argument("--cache", action="store_true",
+                        help="启用结果缓存和已签发证书并发送相同请求（默认两者都关闭、每次请求不同）")
+    parser.add_argument("--signature-delay", type=float, default=0.0, help="签名服务的模拟延迟（秒）")
+    parser.add_argument("--output", help="结果JSON文件路径，默认写入 benchmarks/results/")
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.concurrency.split(",") if level]
+    # 已签发证书在结果缓存之前查找，也会直接返回保存的内容，与结果缓存一起开关
+    env = {"RESULT_CACHE_ENABLED": "1" if args.cache else "0", "ISSUED_ENABLED": "1" if args.cache else "0"}
+
+    results = {"cache": args.cache, "levels": []}
+    with SignatureServer(delay=args.signature_delay) as signature_server:
+        if args.url:
+            service = None
+            base_url = args.url.rstrip("/")
+        else:
+            service = ServiceProcess(_free_port(), env).__enter__()
+            base_url = service.base_url
+        try:
+            # 预热：字体、模板和签名缓存
+            requests.post(
+                base_url + "/generate-certificate",
+                json=dict(SAMPLE_REQUEST, studentName="预热", ngoSignature=signature_server.url),
+                timeout=120
+            )
+            for level in levels:
+                stats = run_level(base_url, level, args.duration, signature_server.url, unique=not args.cache)
+                results["levels"].append(stats)
+                print(
+                    f"并发 {level:>3}: {stats['throughput_rps']:7.2f} req/s   "
+                    f"p50 {stats['p50_ms']:8.1f} ms   p95 {stats['p95_ms']:8.1f} ms   "
+                    f"p99 {stats['p99_ms']:8.1f} ms   {stats['status_counts']}"
+                )
+        finally:
+            if service is not None:
+                service.__exit__(None, None, None)
+
+    path = write_results("load", results, args.output)
+    print(f"结果已保存: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
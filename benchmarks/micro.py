@@ -0,0 +1,247 @@
+"""
+渲染流程的微基准测试
+分别测量模板加载、字体加载、文本测量、自动换行、签名缩放、PDF编码、图片编码以及完整的单张渲染
+
+用法:
+    python -m benchmarks.micro [--iterations 50] [--only wrap,pdf] [--output 结果.json]
+"""
+import argparse
+import random
+import sys
+from io import BytesIO
+from typing import Any, Callable, Dict, List
+
+import config
+from benchmarks.common import SignatureServer, make_signature_photo, make_signature_png, measure, write_results
+from certificate import vector
+from certificate.fonts import default_font_path, load_font
+from certificate.generator import (
+    generate_certificate,
+    get_field_font,
+    get_font,
+    get_text_dimensions,
+    wrap_text,
+)
+from certificate.linebreak import clear_advance_cache, text_advance
+from certificate.output import IMAGE_FORMATS, encode_image
+from certificate.signatures import clear_signature_cache, decode_image, load_signature, resize_signature
+from certificate.templates import (
+    clear_template_cache,
+    get_scaled_template,
+    get_template,
+    get_template_jpeg,
+    load_template,
+)
+from certificate.textlayers import clear_sprite_cache
+
+# 测试用的证书内容：中英文混排的长段落
+SAMPLE_CONTENTS = (
+    "兹证明该学生在我们组织完成了Python高级编程课程的学习，表现优异，"
+    "在项目实践中展现出扎实的工程能力与团队协作精神。"
+    "This certifies outstanding contribution to the community volunteer programme. "
+) * 4
+
+
+def bench_template(iterations: int) -> Dict[str, Any]:
+    path = config.DEFAULT_TEMPLATE
+    return {
+        "template_decode_cold": measure(lambda: get_template(path), iterations, setup=clear_template_cache),
+        "template_copy_cached": measure(lambda: load_template(path), iterations),
+        "template_jpeg_cold": measure(lambda: get_template_jpeg(path), iterations, setup=clear_template_cache),
+    }
+
+
+def bench_font(iterations: int) -> Dict[str, Any]:
+    path = default_font_path()
+    if not path:
+        return {}
+    return {
+        "font_load_cold": measure(lambda: load_font(path, 40), iterations, setup=load_font.cache_clear),
+        "font_load_cached": measure(lambda: get_font(path, 40), iterations),
+    }
+
+
+def bench_measure(iterations: int) -> Dict[str, Any]:
+    font = get_font(default_font_path(), config.CERTIFICATE_CONFIG["contents"]["font_size"])
+    line = SAMPLE_CONTENTS[:60]
+    path = default_font_path()
+    name_config = config.CERTIFICATE_CONFIG["student_name"]
+    long_name = "Maximilian Alexander Bartholomew Featherstonehaugh"
+    return {
+        "text_bbox": measure(lambda: get_text_dimensions(line, font), iterations, setup=clear_sprite_cache),
+        "text_bbox_cached": measure(lambda: get_text_dimensions(line, font), iterations),
+        "text_advance_cold": measure(lambda: text_advance(line, font), iterations, setup=clear_advance_cache),
+        "text_advance_cached": measure(lambda: text_advance(line, font), iterations),
+        # 超长姓名自动缩小字号：冷启动时按字宽比例估算字号并核对，之后命中缓存
+        "text_fit_cold": measure(lambda: get_field_font(path, name_config, long_name, 40), iterations,
+                                 setup=clear_advance_cache),
+        "text_fit_cached": measure(lambda: get_field_font(path, name_config, long_name, 40), iterations),
+    }
+
+
+def bench_wrap(iterations: int) -> Dict[str, Any]:
+    contents_config = config.CERTIFICATE_CONFIG["contents"]
+    font = get_font(default_font_path(), contents_config["font_size"])
+    max_width = contents_config["max_width"]
+    long_text = SAMPLE_CONTENTS * 10
+    return {
+        "wrap_cold": measure(lambda: wrap_text(SAMPLE_CONTENTS, font, max_width), iterations, setup=clear_advance_cache),
+        "wrap_cached": measure(lambda: wrap_text(SAMPLE_CONTENTS, font, max_width), iterations),
+        "wrap_long_cold": measure(lambda: wrap_text(long_text, font, max_width), iterations, setup=clear_advance_cache),
+    }
+
+
+def bench_signature(iterations: int) -> Dict[str, Any]:
+    data = make_signature_png()
+    max_size = config.CERTIFICATE_CONFIG["ngo_signature"]["max_size"]
+    image = decode_image(data)
+    photo = make_signature_photo()
+    return {
+        "signature_decode": measure(lambda: decode_image(data), iterations),
+        "signature_resize": measure(lambda: resize_signature(image, max_size), iterations),
+        # 手机拍摄的大尺寸JPEG：解码时缩小 + 整数倍缩小 + 重采样
+        "signature_photo_jpeg": measure(lambda: load_signature(photo, max_size), iterations),
+    }
+
+
+def bench_pdf(iterations: int) -> Dict[str, Any]:
+    template = load_template(config.DEFAULT_TEMPLATE)
+
+    def save_raster():
+        template.save(BytesIO(), "PDF", resolution=100.0)
+
+    return {"pdf_encode_raster": measure(save_raster, iterations)}
+
+
+def _unique_names(seed: int = 7):
+    """不重复的中英文姓名，字符集随姓名变化"""
+    rng = random.Random(seed)
+    latin = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyzÀÉÖÜßçñ"
+    cjk = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾萧田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈"
+    for index in range(10 ** 9):
+        if index % 2:
+            yield "".join(rng.choice(cjk) for _ in range(3))
+        else:
+            yield " ".join("".join(rng.choice(latin) for _ in range(rng.randint(4, 9))) for _ in range(2))
+
+
+def bench_vector(iterations: int) -> Dict[str, Any]:
+    if not vector.is_available() or not default_font_path():
+        return {}
+    names = _unique_names()
+    path = default_font_path()
+
+    def render():
+        generate_certificate(
+            student_name=next(names),
+            ngo_name="OpenLab创新实验室",
+            contents=SAMPLE_CONTENTS,
+            date="2025年1月1日",
+            output=BytesIO(),
+            engine="vector"
+        )
+
+    return {
+        # 没有可复用的子集：每次都生成新子集（最坏情况）
+        "vector_subset_cold": measure(
+            lambda: vector.get_font_subset(path, 0, next(names)), iterations, setup=vector.clear_subset_cache
+        ),
+        # 每张证书的姓名都不同，共用字符集逐渐覆盖常用字符后不再生成子集
+        "render_vector_unique_names": measure(render, iterations, warmup=2),
+    }
+
+
+def bench_output(iterations: int) -> Dict[str, Any]:
+    template = load_template(config.DEFAULT_TEMPLATE)
+    width, height = template.size
+    half = (width // 2, height // 2)
+    results = {
+        "template_scale_cold": measure(
+            lambda: get_scaled_template(config.DEFAULT_TEMPLATE, size=half), iterations, setup=clear_template_cache
+        ),
+    }
+    for output_format in IMAGE_FORMATS:
+        results[f"{output_format}_encode"] = measure(
+            lambda: encode_image(template, BytesIO(), output_format), iterations
+        )
+    return results
+
+
+def bench_render(iterations: int) -> Dict[str, Any]:
+    results = {}
+    with SignatureServer() as server:
+        engines = ["raster"] + (["vector"] if vector.is_available() else [])
+        for engine in engines:
+            counter = iter(range(10 ** 9))
+
+            def render():
+                # 每次使用不同的姓名，避免测到任何结果级别的复用
+                generate_certificate(
+                    student_name=f"学生{next(counter)}",
+                    ngo_name="OpenLab创新实验室",
+                    contents=SAMPLE_CONTENTS,
+                    date="2025年1月1日",
+                    ngo_signature=server.url,
+                    output=BytesIO(),
+                    engine=engine
+                )
+
+            results[f"render_{engine}"] = measure(render, iterations, warmup=2)
+
+        def render_small():
+            # 缩小输出：在缩小的模板上直接渲染
+            generate_certificate(
+                student_name=f"学生{next(counter)}",
+                ngo_name="OpenLab创新实验室",
+                contents=SAMPLE_CONTENTS,
+                date="2025年1月1日",
+                ngo_signature=server.url,
+                output=BytesIO(),
+                output_format="jpeg",
+                width=800
+            )
+
+        results["render_jpeg_w800"] = measure(render_small, iterations, warmup=2)
+        clear_signature_cache()
+    return results
+
+
+BENCHMARKS: Dict[str, Callable[[int], Dict[str, Any]]] = {
+    "template": bench_template,
+    "font": bench_font,
+    "measure": bench_measure,
+    "wrap": bench_wrap,
+    "signature": bench_signature,
+    "pdf": bench_pdf,
+    "output": bench_output,
+    "render": bench_render,
+    "vector": bench_vector,
+}
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="证书渲染流程微基准测试")
+    parser.add_argument("--iterations", type=int, default=50, help="每项测试的执行次数")
+    parser.add_argument("--only", default="", help=f"只运行指定的测试组，逗号分隔: {','.join(BENCHMARKS)}")
+    parser.add_argument("--output", help="结果JSON文件路径，默认写入 benchmarks/results/")
+    args = parser.parse_args(argv)
+
+    selected = [name for name in args.only.split(",") if name] or list(BENCHMARKS)
+    unknown = [name for name in selected if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的测试组: {', '.join(unknown)}")
+
+    results: Dict[str, Any] = {}
+    for name in selected:
+        group = BENCHMARKS[name](args.iterations)
+        for case, stats in group.items():
+            print(f"{case:<24} p50 {stats['p50_ms']:9.3f} ms   p95 {stats['p95_ms']:9.3f} ms")
+        results.update(group)
+
+    path = write_results("micro", {"iterations": args.iterations, "cases": results}, args.output)
+    print(f"结果已保存: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
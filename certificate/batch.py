@@ -0,0 +1,177 @@
+"""
+批量证书生成
+同一批次中相同的字段（换行后的内容、签名图片）只处理一次，
+证书并发渲染，每完成一张就写入ZIP流或合并PDF流返回给客户端
+"""
+import json
+import re
+import zipfile
+from collections import Counter
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from certificate.executor import RenderExecutor
+from certificate.generator import open_merged_pdf, prepare_shared_fields, render_certificate_bytes, render_page_layers
+from certificate.metrics import record_failure, timed
+from certificate.models import CertificateRequest
+from certificate.output import FORMATS, resolve_format
+
+# 共享字段的键: (模板ID, 证书内容, 签名, 输出宽度, 输出DPI)
+SharedKey = Tuple[Optional[str], str, Optional[str], Optional[int], Optional[float]]
+# 每张证书完成时的回调: (序号, 异常)，成功时异常为None
+ResultCallback = Callable[[int, Optional[BaseException]], None]
+
+
+class _StreamSink:
+    """只写的内存缓冲区，ZipFile / PDF写入器写入的数据由调用方及时取走"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        """取走目前已写入的数据"""
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def certificate_filename(index: int, request: CertificateRequest, suffix: str = ".pdf", digits: int = 4) -> str:
+    """生成批量结果中的文件名，例如 0001_张三.pdf，digits 为序号的最少位数"""
+    safe_name = re.sub(r'[\\/:*?"<>|\s]+', "_", request.studentName).strip("_.") or "certificate"
+    return f"{index + 1:0{digits}d}_{safe_name}{suffix}"
+
+
+def render_kwargs(request: CertificateRequest, shared: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """把证书请求转换为 generate_certificate 的参数"""
+    return {
+        "student_name": request.studentName,
+        "ngo_signature": request.ngoSignature,
+        "ngo_name": request.ngoName,
+        "contents": request.contents,
+        "date": request.date,
+        "shared": shared,
+        "template_id": request.templateId,
+    }
+
+
+def shared_key(request: CertificateRequest, scaled: bool = True) -> SharedKey:
+    """共享字段的键，换行结果和签名尺寸取决于模板布局和输出尺寸
+
+    scaled 为False时忽略 width / dpi（合并PDF总是按模板原始尺寸渲染）。
+    """
+    if not scaled:
+        return request.templateId, request.contents, request.ngoSignature, None, None
+    return request.templateId, request.contents, request.ngoSignature, request.width, request.dpi
+
+
+def zip_render_kwargs(request: CertificateRequest, shared: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """ZIP 输出的参数：单独的证书文件可以使用矢量引擎和各自的输出格式、尺寸"""
+    kwargs = render_kwargs(request, shared)
+    kwargs.update(
+        engine=request.engine,
+        output_format=request.format,
+        quality=request.quality,
+        width=request.width,
+        dpi=request.dpi
+    )
+    return kwargs
+
+
+async def resolve_shared_fields(
+    requests: List[CertificateRequest],
+    executor: RenderExecutor,
+    scaled: bool = True
+) -> Dict[SharedKey, Dict[str, Any]]:
+    """为批次中重复出现的 (模板, 内容, 签名, 输出尺寸) 组合预先处理共享字段
+
+    只出现一次的组合没有复用价值，按普通流程渲染。
+    """
+    counts = Counter(shared_key(request, scaled) for request in requests)
+    repeated = (
+        (key, {"template_id": key[0], "contents": key[1], "ngo_signature": key[2], "width": key[3], "dpi": key[4]})
+        for key, count in counts.items() if count > 1
+    )
+
+    shared_fields: Dict[SharedKey, Dict[str, Any]] = {}
+    async for key, shared, error in executor.map_unordered(prepare_shared_fields, repeated):
+        if error is None:
+            shared_fields[key] = shared
+    return shared_fields
+
+
+async def stream_certificate_zip(
+    requests: List[CertificateRequest],
+    executor: RenderExecutor,
+    on_result: Optional[ResultCallback] = None,
+    window: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """并发渲染批量证书，按完成顺序产出ZIP数据块
+
+    单张证书渲染失败不会中断整个批次，错误汇总写入 errors.json。
+    on_result 在每张证书完成（或失败）时调用，window 限制同时提交的渲染数量。
+    """
+    shared_fields = await resolve_shared_fields(requests, executor)
+    items = (
+        (index, zip_render_kwargs(request, shared_fields.get(shared_key(request))))
+        for index, request in enumerate(requests)
+    )
+
+    sink = _StreamSink()
+    errors = []
+    # PDF和图片本身已经压缩，ZIP中直接存储
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+        async for index, data, error in executor.map_unordered(render_certificate_bytes, items, window):
+            if on_result is not None:
+                on_result(index, error)
+            if error is not None:
+                record_failure("render")
+                errors.append({
+                    "index": index,
+                    "studentName": requests[index].studentName,
+                    "error": str(error)
+                })
+                continue
+            suffix = FORMATS[resolve_format(requests[index].format)][0]
+            archive.writestr(certificate_filename(index, requests[index], suffix), data)
+            yield sink.drain()
+
+        if errors:
+            archive.writestr("errors.json", json.dumps(errors, ensure_ascii=False, indent=2))
+    yield sink.drain()
+
+
+async def stream_certificate_pdf(
+    requests: List[CertificateRequest],
+    executor: RenderExecutor,
+    on_result: Optional[ResultCallback] = None,
+    window: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """并发渲染批量证书，按请求顺序产出合并PDF的数据块
+
+    背景图只嵌入一次，每页只包含该证书自己的前景图层。
+    打印用的合并文件不能缺页，任一证书渲染失败都会中止输出。
+    """
+    shared_fields = await resolve_shared_fields(requests, executor, scaled=False)
+    items = (
+        render_kwargs(request, shared_fields.get(shared_key(request, scaled=False)))
+        for request in requests
+    )
+
+    sink = _StreamSink()
+    # 合并PDF共享同一张背景，调用方需保证批次中所有证书使用同一个模板
+    writer = open_merged_pdf(sink, template_id=requests[0].templateId if requests else None)
+    yield sink.drain()
+    async for layers in executor.map_ordered(render_page_layers, items, window):
+        with timed("pdf_encode"):
+            writer.add_page(layers)
+        if on_result is not None:
+            on_result(writer.page_count - 1, None)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
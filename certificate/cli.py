@@ -0,0 +1,314 @@
+"""
+离线批量生成证书的命令行工具
+逐条读取 CSV 或 JSONL 名单（每条记录对应一个 CertificateRequest），用多个子进程渲染，
+按序号生成确定的文件名，并定期写入检查点；中断后重新运行同一命令会从检查点继续。
+同时提交的渲染数量有上限，内存占用与名单大小无关
+
+用法:
+    python -m certificate.cli 名单.csv -o 输出目录 [--workers 4] [--format jpeg --width 1000]
+"""
+import argparse
+import csv
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Set, TextIO, Tuple
+
+from pydantic import ValidationError
+
+from certificate.batch import certificate_filename, zip_render_kwargs
+from certificate.generator import generate_certificate
+from certificate.models import CertificateRequest
+from certificate.output import FORMATS, OutputError, resolve_format, resolve_output
+from certificate.registry import get_registry
+
+CHECKPOINT_VERSION = 1
+# 文件名中序号的位数（十万级名单按序号排序）
+FILENAME_DIGITS = 6
+# 可以在命令行指定默认值的请求字段（记录中没有该字段时使用命令行的值）
+OUTPUT_OPTIONS = ("format", "quality", "width", "dpi", "engine")
+
+Record = Tuple[int, Dict[str, Any]]
+
+
+def iter_records(path: str, input_format: str, skip: Set[int], start: int) -> Iterator[Record]:
+    """逐条读取名单，返回 (序号, 原始字段)；序号小于 start 或在 skip 中的记录不解析"""
+    if input_format == "csv":
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            for index, row in enumerate(csv.DictReader(f)):
+                if index < start or index in skip:
+                    continue
+                # CSV 中的空单元格视为未填写
+                yield index, {key: value for key, value in row.items() if key and value not in ("", None)}
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        index = 0
+        for line in f:
+            if not line.strip():
+                continue
+            if index >= start and index not in skip:
+                try:
+                    fields = json.loads(line)
+                except ValueError as e:
+                    fields = {"__error__": f"JSON格式错误: {e}"}
+                if not isinstance(fields, dict):
+                    # 合法的JSON但不是对象（数组、字符串、数字等），与格式错误一样记入 errors.jsonl
+                    fields = {"__error__": "每行必须是JSON对象"}
+                yield index, fields
+            index += 1
+
+
+class Checkpoint:
+    """已处理记录的检查点
+
+    watermark 之前的记录全部处理完毕（成功或失败），watermark 之后已处理的序号单独记录；
+    同时提交的渲染数量有上限，因此单独记录的序号数量也有上限。
+    写入时先写临时文件再改名，中断时不会留下损坏的检查点。
+    """
+
+    def __init__(self, path: str, input_path: str):
+        self.path = path
+        self.input_path = input_path
+        self.watermark = 0
+        self.done: Set[int] = set()
+        self.succeeded = 0
+        self.failed = 0
+
+    @classmethod
+    def load(cls, path: str, input_path: str) -> "Checkpoint":
+        """读取检查点，不存在时返回空检查点；检查点属于其他名单时抛出 ValueError"""
+        checkpoint = cls(path, input_path)
+        if not os.path.exists(path):
+            return checkpoint
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != CHECKPOINT_VERSION or data.get("input") != input_path:
+            raise ValueError(f"检查点 {path} 属于其他名单 ({data.get('input')})，请使用 --restart 重新开始")
+        checkpoint.watermark = data["watermark"]
+        checkpoint.done = set(data["done"])
+        checkpoint.succeeded = data["succeeded"]
+        checkpoint.failed = data["failed"]
+        return checkpoint
+
+    def mark(self, index: int, ok: bool) -> None:
+        """记录一条已处理的记录，并推进 watermark"""
+        if ok:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        self.done.add(index)
+        while self.watermark in self.done:
+            self.done.remove(self.watermark)
+            self.watermark += 1
+
+    def save(self) -> None:
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": CHECKPOINT_VERSION,
+                "input": self.input_path,
+                "watermark": self.watermark,
+                "done": sorted(self.done),
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+            }, f)
+        os.replace(temp_path, self.path)
+
+
+def _init_worker() -> None:
+    """子进程忽略 Ctrl+C，由主进程统一处理中断并保存检查点"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def render_to_file(kwargs: Dict[str, Any], path: str) -> str:
+    """在子进程中渲染一张证书，先写临时文件再改名，中断时不会留下不完整的文件"""
+    temp_path = path + ".tmp"
+    generate_certificate(output=temp_path, **kwargs)
+    os.replace(temp_path, path)
+    return path
+
+
+def prepare_record(
+    index: int,
+    fields: Dict[str, Any],
+    defaults: Dict[str, Any],
+    output_dir: str
+) -> Tuple[Dict[str, Any], str]:
+    """校验一条记录并返回 (渲染参数, 输出路径)，记录无效时抛出 ValueError"""
+    if "__error__" in fields:
+        raise ValueError(fields["__error__"])
+    for name, value in defaults.items():
+        if value is not None and fields.get(name) is None:
+            fields[name] = value
+    try:
+        request = CertificateRequest(**fields)
+    except ValidationError as e:
+        raise ValueError("; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+
+    spec = get_registry().get(request.templateId)
+    if spec is None:
+        raise ValueError(f"模板不存在: {request.templateId}")
+    output_format, _ = resolve_output(spec.size, request.format, request.engine, request.width, request.dpi)
+    filename = certificate_filename(index, request, FORMATS[output_format][0], FILENAME_DIGITS)
+    return zip_render_kwargs(request), os.path.join(output_dir, filename)
+
+
+class Progress:
+    """定期输出处理进度和吞吐量"""
+
+    def __init__(self, stream: TextIO, interval: float, already_done: int):
+        self.stream = stream
+        self.interval = interval
+        self.started = time.monotonic()
+        self.already_done = already_done
+        self.count = 0
+        self._last_time = self.started
+        self._last_count = 0
+
+    def tick(self) -> None:
+        self.count += 1
+        now = time.monotonic()
+        if now - self._last_time >= self.interval:
+            self.report(now)
+
+    def report(self, now: Optional[float] = None) -> None:
+        now = now or time.monotonic()
+        elapsed = now - self.started
+        recent = (self.count - self._last_count) / (now - self._last_time) if now > self._last_time else 0.0
+        overall = self.count / elapsed if elapsed else 0.0
+        print(
+            f"已处理 {self.already_done + self.count} 条（本次 {self.count}），"
+            f"当前 {recent:.1f} 张/秒，平均 {overall:.1f} 张/秒",
+            file=self.stream, flush=True
+        )
+        self._last_time = now
+        self._last_count = self.count
+
+
+def run(
+    input_path: str,
+    output_dir: str,
+    input_format: str,
+    workers: int,
+    window: int,
+    defaults: Dict[str, Any],
+    restart: bool = False,
+    checkpoint_interval: float = 2.0,
+    report_interval: float = 5.0,
+    stream: TextIO = sys.stderr
+) -> Checkpoint:
+    """批量渲染名单中的证书，返回最终的检查点"""
+    os.makedirs(output_dir, exist_ok=True)
+    input_path = os.path.abspath(input_path)
+    checkpoint_path = os.path.join(output_dir, ".checkpoint.json")
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = Checkpoint.load(checkpoint_path, input_path)
+    resuming = bool(checkpoint.watermark or checkpoint.done)
+    if resuming:
+        print(f"从检查点继续：前 {checkpoint.watermark} 条已处理", file=stream)
+
+    progress = Progress(stream, report_interval, checkpoint.watermark + len(checkpoint.done))
+    # 提交位置领先 watermark 太多时先等待，限制检查点中单独记录的序号数量
+    max_ahead = window * 16
+    # 提交中的渲染 -> (序号, 记录字段)，失败时错误记录中带上姓名
+    in_flight: Dict[Future, Tuple[int, Dict[str, Any]]] = {}
+    records = iter_records(input_path, input_format, set(checkpoint.done), checkpoint.watermark)
+    saved_at = time.monotonic()
+
+    # 继续上次的运行时追加错误记录，重新开始时清空
+    with open(os.path.join(output_dir, "errors.jsonl"), "a" if resuming else "w", encoding="utf-8") as errors, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+
+        def finish(index: int, error: Optional[BaseException], fields: Optional[Dict[str, Any]] = None) -> None:
+            if error is not None:
+                errors.write(json.dumps({
+                    "index": index,
+                    "studentName": (fields or {}).get("studentName"),
+                    "error": str(error),
+                }, ensure_ascii=False) + "\n")
+            checkpoint.mark(index, error is None)
+            progress.tick()
+
+        def collect(block: bool) -> None:
+            if not in_flight:
+                return
+            completed, _ = wait(list(in_flight), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for future in completed:
+                index, fields = in_flight.pop(future)
+                finish(index, future.exception(), fields)
+
+        try:
+            for index, fields in records:
+                while in_flight and (len(in_flight) >= window or index - checkpoint.watermark >= max_ahead):
+                    collect(block=True)
+                try:
+                    kwargs, path = prepare_record(index, fields, defaults, output_dir)
+                except (ValueError, OutputError) as e:
+                    finish(index, e, fields)
+                    continue
+                in_flight[pool.submit(render_to_file, kwargs, path)] = (index, fields)
+
+                collect(block=False)
+                if time.monotonic() - saved_at >= checkpoint_interval:
+                    errors.flush()
+                    checkpoint.save()
+                    saved_at = time.monotonic()
+
+            while in_flight:
+                collect(block=True)
+        except KeyboardInterrupt:
+            for future in in_flight:
+                future.cancel()
+            print("已中断，下次运行同一命令会从检查点继续", file=stream)
+            raise
+        finally:
+            errors.flush()
+            checkpoint.save()
+            progress.report()
+    return checkpoint
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="从 CSV/JSONL 名单批量生成证书")
+    parser.add_argument("input", help="名单文件，CSV（首行为字段名）或 JSONL（每行一个JSON对象）")
+    parser.add_argument("-o", "--output-dir", required=True, help="输出目录，检查点和 errors.jsonl 也写在这里")
+    parser.add_argument("--input-format", choices=("csv", "jsonl"), help="名单格式，默认按扩展名判断")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="渲染子进程数量，默认CPU核数")
+    parser.add_argument("--window", type=int, help="同时提交的渲染数量上限，默认 workers*4")
+    parser.add_argument("--format", choices=tuple(FORMATS), help="记录中未指定时使用的输出格式")
+    parser.add_argument("--quality", type=int, help="记录中未指定时使用的编码质量")
+    parser.add_argument("--width", type=int, help="记录中未指定时使用的输出宽度")
+    parser.add_argument("--dpi", type=float, help="记录中未指定时使用的输出分辨率")
+    parser.add_argument("--engine", choices=("raster", "vector"), help="记录中未指定时使用的渲染引擎")
+    parser.add_argument("--restart", action="store_true", help="忽略已有的检查点，从头开始")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="输出进度的间隔（秒）")
+    args = parser.parse_args(argv)
+
+    input_format = args.input_format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    workers = max(1, args.workers)
+    defaults = {name: getattr(args, name) for name in OUTPUT_OPTIONS}
+
+    try:
+        if args.format:
+            resolve_format(args.format)
+        checkpoint = run(
+            args.input, args.output_dir, input_format, workers, args.window or workers * 4, defaults,
+            restart=args.restart, report_interval=args.report_interval
+        )
+    except KeyboardInterrupt:
+        return 130
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 2
+
+    print(f"完成：成功 {checkpoint.succeeded} 张，失败 {checkpoint.failed} 张", file=sys.stderr)
+    return 1 if checkpoint.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
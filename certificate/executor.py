@@ -0,0 +1,239 @@
+"""
+证书渲染执行器
+把CPU密集、会阻塞的渲染工作放到线程池或进程池中执行，
+并限制同时渲染和排队等待的请求数量，队列满时快速失败
+"""
+import asyncio
+import contextvars
+import functools
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+import config
+from certificate import tracing
+from certificate.metrics import REGISTRY, CallbackMetric, capture_call, replay
+
+
+class QueueFullError(Exception):
+    """渲染队列已满"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("渲染队列已满，请稍后重试")
+        self.retry_after = retry_after
+
+
+def _call_in_child(fn: Callable[..., Any], trace_enabled: bool, args: tuple, kwargs: dict) -> tuple:
+    """在子进程中执行 fn，指标观测值和追踪事件随结果一起返回"""
+    if not trace_enabled:
+        result, observations = capture_call(fn, *args, **kwargs)
+        return result, observations, None
+    with tracing.start_trace() as trace:
+        result, observations = capture_call(fn, *args, **kwargs)
+    return result, observations, trace.events
+
+
+class RenderExecutor:
+    """带并发上限和等待队列的渲染执行器
+
+    同一时刻最多 max_workers 个渲染在池中执行，最多 max_queue 个请求排队等待，
+    超出部分直接抛出 QueueFullError。计数只在事件循环线程中修改，不需要加锁。
+    """
+
+    def __init__(self, kind: str = "thread", max_workers: int = 4, max_queue: int = 32, retry_after: int = 5):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"不支持的执行器类型: {kind}")
+        self.kind = kind
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.waiting = 0
+        self._pool: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @classmethod
+    def from_config(cls) -> "RenderExecutor":
+        """根据 config.RENDER_SETTINGS 创建执行器"""
+        settings = config.RENDER_SETTINGS
+        return cls(
+            kind=settings["executor"],
+            max_workers=settings["max_workers"],
+            max_queue=settings["max_queue"],
+            retry_after=settings["retry_after"],
+        )
+
+    def _get_pool(self) -> Executor:
+        """延迟创建线程池/进程池"""
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="render")
+        return self._pool
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        return self._semaphore
+
+    def check_capacity(self) -> None:
+        """检查是否还能接收新的渲染请求，否则抛出 QueueFullError"""
+        if self.in_flight >= self.max_workers and self.waiting >= self.max_queue:
+            raise QueueFullError(self.retry_after)
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """在池中执行 fn(*args, **kwargs) 并等待结果
+
+        Raises:
+            QueueFullError: 正在渲染和排队的请求都已达到上限
+        """
+        self.check_capacity()
+        return await self._submit(fn, args, kwargs)
+
+    async def _submit(self, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        """等待空闲名额后把任务交给池执行"""
+        semaphore = self._get_semaphore()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+
+        def _release(_):
+            self.in_flight -= 1
+            semaphore.release()
+
+        loop = asyncio.get_running_loop()
+        trace = tracing.current_trace()
+        submitted = time.perf_counter()
+        if self.kind == "process":
+            # 子进程中的指标和追踪事件随结果一起带回
+            call = functools.partial(_call_in_child, fn, trace is not None, args, kwargs)
+        else:
+            # 线程池不会继承调用方的上下文，复制一份使追踪和指标采集在线程中生效
+            call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        future = loop.run_in_executor(self._get_pool(), call)
+        # 渲染真正结束后才释放名额，客户端断开也不会让池中任务超过上限
+        future.add_done_callback(_release)
+        result = await asyncio.shield(future)
+        if self.kind == "process":
+            result, observations, events = result
+            replay(observations)
+            if trace is not None and events:
+                trace.extend(events, submitted - trace.started)
+        return result
+
+    async def warm_up(self, fn: Callable[..., Any]) -> None:
+        """创建线程池/进程池并提交 max_workers 次 fn，使所有工作进程在首个请求之前启动
+
+        进程池的子进程由已预热的父进程 fork 而来，继承已加载的模板和字体；
+        fn 用于完成子进程中剩余的初始化（例如试渲染）。
+        """
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        await asyncio.gather(*(loop.run_in_executor(pool, fn) for _ in range(self.max_workers)))
+
+    async def map_unordered(
+        self,
+        fn: Callable[..., Any],
+        items: Iterable[Tuple[Any, Dict[str, Any]]],
+        window: Optional[int] = None
+    ) -> AsyncIterator[Tuple[Any, Any, Optional[BaseException]]]:
+        """批量执行 fn(**kwargs)，按完成顺序产出 (key, 结果, 异常)
+
+        调用方应先用 check_capacity 做准入检查。批量任务与单个请求共享并发上限，
+        但自身最多同时提交 window 个任务，不占用等待队列名额。
+        """
+        window = window or self.max_workers
+        iterator = iter(items)
+        pending: Dict[asyncio.Task, Any] = {}
+
+        def _fill():
+            while len(pending) < window:
+                try:
+                    key, kwargs = next(iterator)
+                except StopIteration:
+                    return
+                task = asyncio.ensure_future(self._submit(fn, (), kwargs))
+                pending[task] = key
+
+        try:
+            _fill()
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    key = pending.pop(task)
+                    error = task.exception()
+                    yield key, (None if error else task.result()), error
+                _fill()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def map_ordered(
+        self,
+        fn: Callable[..., Any],
+        items: Iterable[Dict[str, Any]],
+        window: Optional[int] = None
+    ) -> AsyncIterator[Any]:
+        """批量执行 fn(**kwargs)，按输入顺序产出结果
+
+        最多提前提交 window 个任务，等待结果的缓冲区大小因此有上限。
+        任一任务失败时抛出其异常。
+        """
+        window = window or self.max_workers
+        iterator = iter(items)
+        pending: Deque[asyncio.Task] = deque()
+
+        def _fill():
+            while len(pending) < window:
+                try:
+                    kwargs = next(iterator)
+                except StopIteration:
+                    return
+                pending.append(asyncio.ensure_future(self._submit(fn, (), kwargs)))
+
+        try:
+            _fill()
+            while pending:
+                result = await pending[0]
+                pending.popleft()
+                _fill()
+                yield result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def shutdown(self) -> None:
+        """关闭线程池/进程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+        self._semaphore = None
+
+
+# 进程内共享的渲染执行器
+_executor: Optional[RenderExecutor] = None
+
+
+def _collect_executor_state() -> Dict[Tuple[str], float]:
+    if _executor is None:
+        return {}
+    return {("in_flight",): _executor.in_flight, ("waiting",): _executor.waiting}
+
+
+REGISTRY.register(CallbackMetric(
+    "certificate_renders", "正在渲染和排队等待的证书数量", "gauge", _collect_executor_state, ("state",)
+))
+
+
+def get_executor() -> RenderExecutor:
+    """返回进程内共享的渲染执行器"""
+    global _executor
+    if _executor is None:
+        _executor = RenderExecutor.from_config()
+    return _executor
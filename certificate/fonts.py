@@ -0,0 +1,153 @@
+"""
+字体发现与缓存
+启动时扫描一次字体目录建立索引，之后按 (路径, 大小, 索引) 缓存已加载的字体对象
+"""
+import os
+import sys
+import threading
+from functools import lru_cache
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from PIL import ImageFont
+
+import config
+from certificate.metrics import REGISTRY, CallbackMetric
+
+# 支持的字体文件扩展名
+FONT_EXTENSIONS = (".ttf", ".ttc", ".otf", ".otc")
+
+# 字体索引: 小写文件名 -> 绝对路径
+_font_index: Optional[Dict[str, str]] = None
+# 已解析的字体名称: 名称 -> 绝对路径（None 表示找不到）
+_resolved_fonts: Dict[str, Optional[str]] = {}
+# 自动发现的默认字体
+_default_font: Optional[str] = None
+_default_font_identity: Tuple[Optional[str], int] = (None, 0)
+_discovery_lock = threading.Lock()
+
+
+def _scan_font_dirs(search_dirs: List[str]) -> Dict[str, str]:
+    """扫描字体目录，先出现的目录优先"""
+    index: Dict[str, str] = {}
+    for font_dir in search_dirs:
+        if not font_dir or not os.path.isdir(font_dir):
+            continue
+        for root, _, files in os.walk(font_dir):
+            for filename in files:
+                if filename.lower().endswith(FONT_EXTENSIONS):
+                    index.setdefault(filename.lower(), os.path.join(root, filename))
+    return index
+
+
+def _lookup(font_name: str, index: Dict[str, str]) -> Optional[str]:
+    """在索引中查找字体，绝对路径直接检查是否存在"""
+    if os.path.isfile(font_name):
+        return os.path.abspath(font_name)
+    return index.get(os.path.basename(font_name).lower())
+
+
+def _can_load(font_path: str) -> bool:
+    """检查字体文件能否被FreeType加载"""
+    try:
+        ImageFont.truetype(font_path, size=12)
+        return True
+    except Exception:
+        return False
+
+
+def discover_fonts(refresh: bool = False) -> Dict[str, str]:
+    """扫描字体目录并确定默认字体，整个进程只执行一次
+
+    Args:
+        refresh: 是否强制重新扫描
+
+    Returns:
+        Dict[str, str]: 字体索引（小写文件名 -> 绝对路径）
+    """
+    global _font_index, _default_font, _default_font_identity
+
+    if _font_index is not None and not refresh:
+        return _font_index
+
+    with _discovery_lock:
+        if _font_index is not None and not refresh:
+            return _font_index
+
+        index = _scan_font_dirs(config.FONT_SEARCH_DIRS)
+
+        # 优先级: 环境变量 > config.DEFAULT_FONT > 候选字体列表
+        candidates = [os.environ.get("CERTIFICATE_FONT"), config.DEFAULT_FONT]
+        candidates.extend(config.FONT_CANDIDATES)
+
+        default_font = None
+        for candidate in candidates:
+            if not candidate:
+                continue
+            font_path = _lookup(candidate, index)
+            if font_path and _can_load(font_path):
+                default_font = font_path
+                break
+
+        if default_font is None:
+            print("警告：未找到任何可用字体，将使用PIL默认字体", file=sys.stderr)
+
+        _resolved_fonts.clear()
+        load_font.cache_clear()
+        _default_font = default_font
+        _default_font_identity = (default_font, os.stat(default_font).st_mtime_ns if default_font else 0)
+        _font_index = index
+        return index
+
+
+def resolve_font_path(font_name: Optional[str]) -> Optional[str]:
+    """把字体名称或路径解析为绝对路径，结果会被缓存"""
+    if not font_name:
+        return None
+    if font_name in _resolved_fonts:
+        return _resolved_fonts[font_name]
+
+    font_path = _lookup(font_name, discover_fonts())
+    _resolved_fonts[font_name] = font_path
+    return font_path
+
+
+def default_font_path() -> Optional[str]:
+    """返回自动发现的默认字体路径，找不到时返回None"""
+    discover_fonts()
+    return _default_font
+
+
+def font_identity() -> Tuple[Optional[str], int]:
+    """返回默认字体的标识（路径、发现时的修改时间），用于结果缓存的键"""
+    discover_fonts()
+    return _default_font_identity
+
+
+@lru_cache(maxsize=config.FONT_SETTINGS["cache_size"])
+def load_font(font_path: str, size: int, index: int = 0) -> ImageFont.FreeTypeFont:
+    """加载字体文件，按 (路径, 大小, 索引) 缓存"""
+    return ImageFont.truetype(font_path, size=size, index=index)
+
+
+def font_key(font) -> Hashable:
+    """字体对象的缓存标识，FreeType字体按 (路径, 大小, 索引)，其他字体（PIL默认字体）按对象本身"""
+    path = getattr(font, "path", None)
+    if isinstance(path, str):
+        return (path, font.size, getattr(font, "index", 0))
+    return id(font)
+
+
+def _collect_font_cache() -> Dict[Tuple[str], float]:
+    info = load_font.cache_info()
+    return {("hit",): info.hits, ("miss",): info.misses}
+
+
+REGISTRY.register(CallbackMetric(
+    "certificate_font_cache_total", "字体对象缓存的命中/未命中次数", "counter", _collect_font_cache, ("result",)
+))
+
+
+@lru_cache(maxsize=1)
+def load_default_font():
+    """加载PIL默认字体"""
+    return ImageFont.load_default()
@@ -1,40 +1,44 @@
 import os
 import uuid
-import requests
-import sys
 from io import BytesIO
 from datetime import datetime
 from PIL import Image, ImageDraw, ImageFont
-from typing import Optional, Tuple, Dict, Any
+from typing import Optional, Tuple, Dict, Any, List, BinaryIO, Iterable, Union
 
 import config
-
-# 判断是否在调试模式
-DEBUG_FONT = os.environ.get('DEBUG_FONT', '0') == '1'
-
-def log_debug(message):
-    """打印调试信息"""
-    if DEBUG_FONT:
-        print(f"[DEBUG] {message}", file=sys.stderr)
+from certificate import tracing, vector
+from certificate.fonts import default_font_path, load_default_font, load_font, resolve_font_path
+from certificate.linebreak import fit_font_size, wrap_lines
+from certificate.metrics import record_failure, timed
+from certificate.output import FORMATS, OutputError, encode_image, resolve_output, resolve_scale, scaled_size
+from certificate.pdf import LayerCanvas, MergedPdfWriter, PdfLayer
+from certificate.registry import TemplateSpec, get_registry, get_template_spec, load_template_spec, scale_layout
+from certificate.signatures import decode_image, fetch_image_bytes, get_signature_image, is_image_signature
+from certificate.storage import get_storage
+from certificate.templates import get_scaled_template, get_template, get_template_jpeg, load_template
+from certificate.textlayers import get_text_sprite
 
 def download_image(url: str) -> Image.Image:
-    """从URL下载图片"""
-    response = requests.get(url)
-    if response.status_code != 200:
-        raise ValueError(f"无法下载图片，HTTP状态码: {response.status_code}")
-    return Image.open(BytesIO(response.content))
+    """从URL下载图片（使用共享连接池，带超时和大小限制）"""
+    data, _ = fetch_image_bytes(url)
+    return decode_image(data)
+
+def load_signature_image(url: str, max_size: Tuple[int, int]) -> Image.Image:
+    """获取按最大尺寸等比缩放后的签名图片（URL、data URL 或 signature:<id>，带缓存，只读）"""
+    return get_signature_image(url, max_size)
 
 def get_text_dimensions(text: str, font: ImageFont.FreeTypeFont) -> Tuple[int, int]:
-    """计算文本尺寸"""
+    """计算文本尺寸（宽度来自文字图层缓存，重复的文本不会再次光栅化）"""
     try:
         ascent, descent = font.getmetrics()
-        width = font.getmask(text).getbbox()[2]
-        height = ascent + descent
-        return width, height
+        width = get_text_sprite(text, font).ink_width
     except Exception as e:
-        log_debug(f"获取文本尺寸时出错: {e}")
-        # 返回估计值
+        tracing.event("text_measure_error", text=text, error=str(e))
+        width = None
+    if width is None:
+        # 无法测量或没有可见字符时返回估计值
         return len(text) * font.size // 2, font.size
+    return width, ascent + descent
 
 def draw_text_aligned(
     draw: ImageDraw.ImageDraw,
@@ -45,16 +49,31 @@ def draw_text_aligned(
     align: str = "left"
 ) -> None:
     """绘制对齐的文本"""
-    x, y = position
-    width, height = get_text_dimensions(text, font)
-    
-    if align == "center":
-        x -= width // 2
-    elif align == "right":
-        x -= width
-    
-    log_debug(f"绘制文本: '{text}' 在位置 ({x}, {y})，字体大小: {font.size}，对齐方式: {align}")
-    draw.text((x, y), text, font=font, fill=fill)
+    with timed("text_draw"):
+        x, y = position
+        width, height = get_text_dimensions(text, font)
+        
+        if align == "center":
+            x -= width // 2
+        elif align == "right":
+            x -= width
+        
+        tracing.event("text", text=text, x=x, y=y, width=width, size=getattr(font, "size", None), align=align)
+        if isinstance(draw, ImageDraw.ImageDraw):
+            # 光栅引擎：按字段颜色粘贴缓存的文字遮罩，与 draw.text 的结果逐像素相同
+            sprite = get_text_sprite(text, font)
+            if sprite.mask is not None:
+                draw.bitmap((x + sprite.offset[0], y + sprite.offset[1]), sprite.mask, fill=fill)
+        else:
+            draw.text((x, y), text, font=font, fill=fill)
+
+def wrap_text(text: str, font: ImageFont.FreeTypeFont, max_width: int) -> List[str]:
+    """按最大宽度把文本拆分为多行
+
+    西文按单词、中文按字符断行，每个片段的宽度只测量一次并按字体缓存，
+    换行时逐段累加宽度，耗时与文本长度成线性关系。
+    """
+    return wrap_lines(text, font, max_width)
 
 def draw_multiline_text(
     draw: ImageDraw.ImageDraw,
@@ -64,79 +83,50 @@ def draw_multiline_text(
     fill: Tuple[int, int, int],
     align: str = "left",
     max_width: int = None,
-    line_spacing: int = 0
+    line_spacing: int = 0,
+    lines: Optional[List[str]] = None
 ) -> None:
-    """绘制多行文本，支持自动换行"""
-    if not max_width:
-        # 如果没有指定最大宽度，直接绘制
-        draw_text_aligned(draw, position, text, font, fill, align)
-        return
+    """绘制多行文本，支持自动换行
+
+    如果传入了已经换好行的 lines，则不再重新计算换行。
+    """
+    if lines is None:
+        if not max_width:
+            # 如果没有指定最大宽度，直接绘制
+            draw_text_aligned(draw, position, text, font, fill, align)
+            return
+        lines = wrap_text(text, font, max_width)
     
     x, y = position
-    words = text.split()
-    lines = []
-    current_line = []
-    
-    for word in words:
-        # 尝试添加单词到当前行
-        test_line = " ".join(current_line + [word])
-        width, _ = get_text_dimensions(test_line, font)
-        
-        if width <= max_width:
-            current_line.append(word)
-        else:
-            # 如果添加单词后超过最大宽度，保存当前行并开始新行
-            if current_line:
-                lines.append(" ".join(current_line))
-                current_line = [word]
-            else:
-                # 如果单词本身就超过最大宽度，直接添加
-                lines.append(word)
-    
-    # 添加最后一行
-    if current_line:
-        lines.append(" ".join(current_line))
     
     # 绘制所有行
     _, line_height = get_text_dimensions("A", font)
-    log_debug(f"多行文本共 {len(lines)} 行，行高 {line_height}，行间距 {line_spacing}")
     for i, line in enumerate(lines):
         line_y = y + i * (line_height + line_spacing)
         draw_text_aligned(draw, (x, line_y), line, font, fill, align)
 
 def get_font(font_path, size, style=None):
-    """获取字体，处理样式并提供回退机制"""
-    try:
-        # 尝试从指定路径获取字体
-        if font_path and os.path.exists(font_path):
-            font = ImageFont.truetype(font_path, size=size)
-            log_debug(f"使用字体: {font_path}，大小: {size}")
-            return font
-    except Exception as e:
-        log_debug(f"加载指定字体出错: {e}")
-    
-    # 尝试使用系统字体
-    system_fonts = [
-        # Windows字体
-        "arial.ttf", "simsun.ttc", "simhei.ttf", "msyh.ttf",
-        # Linux字体
-        "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc",
-        "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
-        # MacOS字体
-        "/System/Library/Fonts/PingFang.ttc"
-    ]
-    
-    for font_name in system_fonts:
-        try:
-            font = ImageFont.truetype(font_name, size=size)
-            log_debug(f"使用系统字体: {font_name}，大小: {size}")
-            return font
-        except Exception:
-            pass
+    """获取字体，处理样式并提供回退机制
+
+    字体路径在启动时的字体发现阶段解析，加载过的字体对象会被缓存，
+    重复调用不会再读取或解析字体文件。
+    """
+    with timed("font_resolution"):
+        # 先尝试指定字体，再回退到自动发现的默认字体
+        for candidate in (resolve_font_path(font_path), default_font_path()):
+            if not candidate:
+                continue
+            try:
+                font = load_font(candidate, size)
+                tracing.event("font", path=candidate, size=size)
+                return font
+            except Exception as e:
+                record_failure("font_load")
+                tracing.event("font_load_error", path=candidate, size=size, error=str(e))
     
     # 如果以上都失败，使用PIL默认字体
-    log_debug(f"使用PIL默认字体，大小: {size}")
-    default_font = ImageFont.load_default()
+    tracing.event("font_fallback", size=size)
+    default_font = load_default_font()
     
     # 为默认字体添加size属性
     if not hasattr(default_font, 'size'):
@@ -144,63 +134,103 @@ def get_font(font_path, size, style=None):
     
     return default_font
 
-def generate_certificate(
-    student_name: str,
-    ngo_name: str,
+def get_field_font(font_path, field_config: Dict[str, Any], text: str, default_size: int):
+    """单行字段使用的字体
+
+    字段设置了 max_width 时，文本在 font_size 下放不下就自动缩小字号，
+    不小于 min_font_size（默认为 font_size 的一半）；字号按字宽与字号成正比估算，不试渲染。
+    """
+    font_size = field_config.get("font_size", default_size)
+    max_width = field_config.get("max_width")
+    if max_width and text:
+        min_size = min(field_config.get("min_font_size") or max(1, font_size // 2), font_size)
+        with timed("text_fit"):
+            font_size = fit_font_size(text, max_width, font_size, min_size, lambda size: get_font(font_path, size))
+    return get_font(font_path, font_size)
+
+def prepare_shared_fields(
     contents: str,
-    date: str,
     ngo_signature: Optional[str] = None,
-    template_path: str = None
-) -> str:
-    """生成证书并返回文件路径
-    
-    Args:
-        student_name: 学生姓名
-        ngo_name: 组织名称
-        contents: 证书内容
-        date: 颁发日期
-        ngo_signature: 签名图片URL或文本
-        template_path: 自定义模板路径
-        
-    Returns:
-        str: 生成的证书文件路径
+    template_id: Optional[str] = None,
+    width: Optional[int] = None,
+    dpi: Optional[float] = None
+) -> Dict[str, Any]:
+    """预先处理批量证书中相同的字段（换行后的内容、签名图片）
+
+    返回结果可以作为 generate_certificate 的 shared 参数重复使用
+    （必须使用同一个模板和相同的 width / dpi）。
     """
-    log_debug("开始生成证书")
-    log_debug(f"输入参数: student_name={student_name}, ngo_name={ngo_name}, contents={contents}, date={date}")
+    shared: Dict[str, Any] = {}
+    font_path = default_font_path()
+    spec = get_template_spec(template_id)
+    layout = scale_layout(spec.layout, resolve_scale(spec.size, width, dpi))
+    
+    contents_config = layout["contents"]
+    max_width = contents_config.get("max_width")
+    if max_width:
+        contents_font = get_font(font_path, contents_config.get("font_size", 24))
+        shared["contents_lines"] = wrap_text(contents, contents_font, max_width)
+    
+    if is_image_signature(ngo_signature):
+        signature_config = layout["ngo_signature"]
+        try:
+            shared["signature_image"] = load_signature_image(ngo_signature, signature_config["max_size"])
+        except Exception as e:
+            # 与单张生成一致：签名出错时不绘制签名
+            record_failure("signature")
+            tracing.event("signature_error", signature=ngo_signature, error=str(e))
+            shared["signature_image"] = None
     
+    return shared
+
+def resolve_template_path(template_path: Optional[str] = None) -> str:
+    """返回要使用的模板路径，模板不存在时抛出 FileNotFoundError"""
     # 使用默认模板或自定义模板
     template_path = template_path or config.DEFAULT_TEMPLATE
-    log_debug(f"使用模板: {template_path}")
     
     # 检查模板是否存在
     if not os.path.exists(template_path):
         error_msg = f"模板文件不存在: {template_path}"
-        log_debug(error_msg)
         raise FileNotFoundError(error_msg)
     
-    # 加载模板
-    template = Image.open(template_path)
-    log_debug(f"模板尺寸: {template.size}")
-    draw = ImageDraw.Draw(template)
-    
-    # 尝试获取字体
-    font_path = config.DEFAULT_FONT
-    log_debug(f"配置的默认字体: {font_path}")
+    return template_path
+
+def resolve_template(template_path: Optional[str] = None, template_id: Optional[str] = None) -> TemplateSpec:
+    """返回要使用的模板和布局
+
+    指定 template_path 时使用该图片和 config.CERTIFICATE_CONFIG 布局；
+    否则从模板注册表按ID查找（不传ID时为默认模板）。
+    """
+    if template_path:
+        template_path = resolve_template_path(template_path)
+        return load_template_spec(template_path, template_path, None)
+    return get_template_spec(template_id)
+
+def draw_certificate_fields(
+    canvas,
+    draw,
+    student_name: str,
+    ngo_name: str,
+    contents: str,
+    date: str,
+    ngo_signature: Optional[str] = None,
+    shared: Optional[Dict[str, Any]] = None,
+    layout: Optional[Dict[str, Dict[str, Any]]] = None
+) -> None:
+    """按布局在画布上绘制证书的所有字段
     
-    # 处理字体环境变量设置
-    env_font = os.environ.get('CERTIFICATE_FONT')
-    if env_font:
-        if os.path.exists(env_font):
-            font_path = env_font
-            log_debug(f"使用环境变量指定的字体: {font_path}")
-        else:
-            log_debug(f"环境变量指定的字体不存在: {env_font}")
+    Args:
+        canvas: 用于粘贴签名图片的对象（Image 或 LayerCanvas）
+        draw: 用于绘制文本的对象（ImageDraw 或 LayerCanvas）
+        layout: 模板的布局，默认为 config.CERTIFICATE_CONFIG
+    """
+    layout = layout or config.CERTIFICATE_CONFIG
+    # 获取字体（环境变量 CERTIFICATE_FONT 和 config.DEFAULT_FONT 已在字体发现阶段处理）
+    font_path = default_font_path()
     
     # 处理学生姓名 - 主标题
-    student_config = config.CERTIFICATE_CONFIG["student_name"]
-    student_font_size = student_config.get("font_size", 40)
-    log_debug(f"学生姓名字体大小: {student_font_size}")
-    student_font = get_font(font_path, student_font_size)
+    student_config = layout["student_name"]
+    student_font = get_field_font(font_path, student_config, student_name, 40)
     
     draw_text_aligned(
         draw,
@@ -212,11 +242,9 @@ def generate_certificate(
     )
     
     # 处理学生姓名 - 文中使用 (如果配置中存在)
-    if "student_name_text" in config.CERTIFICATE_CONFIG:
-        student_text_config = config.CERTIFICATE_CONFIG["student_name_text"]
-        student_text_font_size = student_text_config.get("font_size", 40)
-        log_debug(f"学生姓名文本字体大小: {student_text_font_size}")
-        student_text_font = get_font(font_path, student_text_font_size)
+    if "student_name_text" in layout:
+        student_text_config = layout["student_name_text"]
+        student_text_font = get_field_font(font_path, student_text_config, student_name, 40)
         
         draw_text_aligned(
             draw,
@@ -228,10 +256,8 @@ def generate_certificate(
         )
     
     # 处理NGO名称
-    ngo_config = config.CERTIFICATE_CONFIG["ngo_name"]
-    ngo_font_size = ngo_config.get("font_size", 30)
-    log_debug(f"NGO名称字体大小: {ngo_font_size}")
-    ngo_font = get_font(font_path, ngo_font_size)
+    ngo_config = layout["ngo_name"]
+    ngo_font = get_field_font(font_path, ngo_config, ngo_name, 30)
     
     draw_text_aligned(
         draw,
@@ -243,9 +269,8 @@ def generate_certificate(
     )
     
     # 处理证书内容
-    contents_config = config.CERTIFICATE_CONFIG["contents"]
+    contents_config = layout["contents"]
     contents_font_size = contents_config.get("font_size", 24)
-    log_debug(f"证书内容字体大小: {contents_font_size}")
     contents_font = get_font(font_path, contents_font_size)
     
     draw_multiline_text(
@@ -256,14 +281,13 @@ def generate_certificate(
         contents_config["color"],
         contents_config["align"],
         contents_config.get("max_width"),
-        contents_config.get("line_spacing", 0)
+        contents_config.get("line_spacing", 0),
+        lines=shared.get("contents_lines") if shared is not None else None
     )
     
     # 处理日期
-    date_config = config.CERTIFICATE_CONFIG["date"]
-    date_font_size = date_config.get("font_size", 20)
-    log_debug(f"日期字体大小: {date_font_size}")
-    date_font = get_font(font_path, date_font_size)
+    date_config = layout["date"]
+    date_font = get_field_font(font_path, date_config, date, 20)
     
     draw_text_aligned(
         draw,
@@ -276,32 +300,19 @@ def generate_certificate(
     
     # 处理签名（如果提供）
     if ngo_signature:
-        signature_config = config.CERTIFICATE_CONFIG["ngo_signature"]
+        signature_config = layout["ngo_signature"]
         try:
-            # 尝试判断是否为URL
-            if ngo_signature.startswith(('http://', 'https://')):
-                log_debug(f"下载签名图片: {ngo_signature}")
-                # 下载签名图片
-                signature_img = download_image(ngo_signature)
+            # 图片签名（URL、data URL 或已注册的签名ID）
+            if is_image_signature(ngo_signature):
+                # 批量生成时签名图片已经预先下载并缩放
+                if shared is not None and "signature_image" in shared:
+                    signature_img = shared["signature_image"]
+                else:
+                    signature_img = load_signature_image(ngo_signature, signature_config["max_size"])
                 
-                # 调整签名尺寸
-                max_width, max_height = signature_config["max_size"]
+                if signature_img is None:
+                    raise ValueError("签名图片不可用")
                 width, height = signature_img.size
-                log_debug(f"原始签名尺寸: {width}x{height}，最大尺寸: {max_width}x{max_height}")
-                
-                # 保持宽高比
-                if width > max_width:
-                    ratio = max_width / width
-                    width = max_width
-                    height = int(height * ratio)
-                
-                if height > max_height:
-                    ratio = max_height / height
-                    height = max_height
-                    width = int(width * ratio)
-                
-                log_debug(f"调整后签名尺寸: {width}x{height}")
-                signature_img = signature_img.resize((width, height), Image.LANCZOS)
                 
                 # 计算粘贴位置
                 sig_x, sig_y = signature_config["position"]
@@ -310,14 +321,11 @@ def generate_certificate(
                 elif signature_config["align"] == "right":
                     sig_x -= width
                 
-                log_debug(f"粘贴签名位置: ({sig_x}, {sig_y})")
                 # 粘贴签名
-                template.paste(signature_img, (sig_x, sig_y), signature_img if signature_img.mode == 'RGBA' else None)
+                canvas.paste(signature_img, (sig_x, sig_y), signature_img if signature_img.mode == 'RGBA' else None)
             else:
                 # 如果不是URL，假设是文本签名
-                signature_font_size = signature_config.get("font_size", 30)
-                log_debug(f"签名文本字体大小: {signature_font_size}")
-                signature_font = get_font(font_path, signature_font_size)
+                signature_font = get_field_font(font_path, signature_config, ngo_signature, 30)
                 
                 draw_text_aligned(
                     draw,
@@ -328,16 +336,231 @@ def generate_certificate(
                     signature_config["align"]
                 )
         except Exception as e:
-            log_debug(f"处理签名时出错: {e}")
+            record_failure("signature")
+            tracing.event("signature_error", signature=ngo_signature, error=str(e))
+
+def generate_certificate(
+    student_name: str,
+    ngo_name: str,
+    contents: str,
+    date: str,
+    ngo_signature: Optional[str] = None,
+    template_path: str = None,
+    shared: Optional[Dict[str, Any]] = None,
+    output: Union[str, BinaryIO, None] = None,
+    engine: Optional[str] = None,
+    template_id: Optional[str] = None,
+    output_format: Optional[str] = None,
+    quality: Optional[int] = None,
+    width: Optional[int] = None,
+    dpi: Optional[float] = None
+) -> Union[str, BinaryIO]:
+    """生成证书并返回文件路径
+    
+    Args:
+        student_name: 学生姓名
+        ngo_name: 组织名称
+        contents: 证书内容
+        date: 颁发日期
+        ngo_signature: 签名图片URL或文本
+        template_path: 自定义模板路径
+        shared: prepare_shared_fields 预先处理好的共享字段（批量生成时使用），
+            必须与本次的 contents 和 ngo_signature 对应
+        output: 输出位置。可写的二进制流（如 BytesIO）时直接写入内存，不落盘；
+            文件路径时写入该文件；为None时写入渲染结果存储（certificate.storage）
+        engine: 渲染引擎，raster（整页光栅图片）或 vector（矢量文字+字体子集），
+            默认使用 config.RENDER_SETTINGS["engine"]
+        template_id: 模板注册表中的模板ID，与 template_path 二选一，都不传时使用默认模板
+        output_format: 输出格式 pdf、png、jpeg 或 webp，默认使用 config.OUTPUT_SETTINGS["format"]
+        quality: JPEG/WebP（以及光栅PDF中背景图）的编码质量 1-100
+        width: 输出的像素宽度，与 dpi 二选一；小于模板宽度时直接按比例缩小渲染
+        dpi: 输出分辨率，模板原始尺寸对应 config.OUTPUT_SETTINGS["base_dpi"]
+        
+    Returns:
+        Union[str, BinaryIO]: 生成的证书文件路径；output 为流时返回该流；
+            output 为None时返回存储中的本地文件路径，存储后端不是本地目录时返回存储键
+    """
+    spec = resolve_template(template_path, template_id)
+    output_format, scale = resolve_output(spec.size, output_format, engine, width, dpi)
+    
+    # 图片格式只能使用光栅引擎；PDF未指定引擎时使用配置的默认引擎
+    engine = engine or (config.RENDER_SETTINGS["engine"] if output_format == "pdf" else "raster")
+    if engine not in ("raster", "vector"):
+        raise ValueError(f"不支持的渲染引擎: {engine}")
+    if engine == "vector" and not vector.is_available():
+        raise vector.VectorEngineUnavailable("矢量渲染引擎需要安装 fonttools")
+    
+    # 按比例缩小的画布、布局和分辨率（PDF页面物理尺寸不变）
+    size = scaled_size(spec.size, scale)
+    layout = scale_layout(spec.layout, scale)
+    resolution = config.OUTPUT_SETTINGS["base_dpi"] * scale
+    tracing.event(
+        "certificate", engine=engine, template=spec.template_id, image=spec.image_path,
+        format=output_format, size=list(size)
+    )
+    
+    # output 为None时先在内存中渲染，再整体写入渲染结果存储
+    target = BytesIO() if output is None else output
+    with timed("render"):
+        if engine == "vector":
+            # 矢量引擎：背景使用缓存的JPEG，文字写为PDF文本
+            with timed("template_load"):
+                canvas = vector.VectorCanvas(size)
+                background = get_template_jpeg(spec.image_path, spec.image_signature, size)
+            draw_certificate_fields(
+                canvas, canvas, student_name, ngo_name, contents, date, ngo_signature, shared, layout
+            )
+            with timed("pdf_encode"):
+                if isinstance(target, str):
+                    with open(target, "wb") as f:
+                        vector.write_vector_pdf(f, canvas, background, resolution)
+                else:
+                    vector.write_vector_pdf(target, canvas, background, resolution)
+        else:
+            # 加载模板（缓存中已解码为RGB，这里只复制一份）
+            with timed("template_load"):
+                template = load_template(spec.image_path, spec.image_signature, size)
+            draw = ImageDraw.Draw(template)
+
+            draw_certificate_fields(
+                template, draw, student_name, ngo_name, contents, date, ngo_signature, shared, layout
+            )
+
+            if output_format != "pdf":
+                with timed("image_encode"):
+                    encode_image(template, target, output_format, quality, resolution)
+            else:
+                # 保存为PDF（整页图片以JPEG嵌入，quality 控制其质量）
+                with timed("pdf_encode"):
+                    params = {"quality": quality} if quality else {}
+                    template.save(target, "PDF", resolution=resolution, **params)
+
+    if output is None:
+        return save_to_storage(target.getvalue(), output_format)
+    return output
+
+def save_to_storage(data: bytes, output_format: str) -> str:
+    """把生成的证书整体写入渲染结果存储（原子写入，过期后由存储清理器删除）
+
+    返回存储中的本地文件路径，存储后端不是本地目录时返回存储键。
+    """
+    storage = get_storage()
+    key = f"certificates/certificate_{uuid.uuid4().hex}{FORMATS[output_format][0]}"
+    storage.put(key, data)
+    return storage.local_path(key) or key
+
+def render_certificate_bytes(**kwargs: Any) -> bytes:
+    """在内存中生成证书并返回文件内容，不使用临时文件（可在进程池中调用）"""
+    buffer = BytesIO()
+    generate_certificate(output=buffer, **kwargs)
+    return buffer.getvalue()
+
+
+def preview_width(spec: TemplateSpec, width: Optional[int] = None) -> int:
+    """预览宽度：默认 config.PREVIEW_SETTINGS["width"]，不超过模板原始宽度"""
+    return min(width or config.PREVIEW_SETTINGS["width"], spec.size[0])
+
+def render_preview_bytes(
+    student_name: str,
+    ngo_name: str,
+    contents: str,
+    date: str,
+    ngo_signature: Optional[str] = None,
+    template_id: Optional[str] = None,
+    output_format: Optional[str] = None,
+    quality: Optional[int] = None,
+    width: Optional[int] = None
+) -> bytes:
+    """渲染低分辨率的预览图（JPEG/WebP）
+
+    在预先缩小的模板上按比例缩小的布局直接渲染，不经过PDF编码，用于输入时的实时预览。
+    """
+    settings = config.PREVIEW_SETTINGS
+    spec = get_template_spec(template_id)
+    return render_certificate_bytes(
+        student_name=student_name,
+        ngo_name=ngo_name,
+        contents=contents,
+        date=date,
+        ngo_signature=ngo_signature,
+        template_id=template_id,
+        engine="raster",
+        output_format=output_format or settings["format"],
+        quality=quality or settings["quality"],
+        width=preview_width(spec, width)
+    )
+
+def prepare_preview_templates() -> None:
+    """预先缩小所有已注册模板的默认预览尺寸，首次预览不需要承担缩放开销"""
+    for spec in get_registry().list():
+        try:
+            size = scaled_size(spec.size, resolve_scale(spec.size, preview_width(spec)))
+        except OutputError:
+            # 模板本身比最小输出宽度还小，无法预览
+            continue
+        get_scaled_template(spec.image_path, spec.image_signature, size)
+
+
+def render_page_layers(
+    student_name: str,
+    ngo_name: str,
+    contents: str,
+    date: str,
+    ngo_signature: Optional[str] = None,
+    template_path: str = None,
+    shared: Optional[Dict[str, Any]] = None,
+    template_id: Optional[str] = None
+) -> List[PdfLayer]:
+    """渲染合并PDF中一页的前景图层（不含背景），结果可以跨进程传递"""
+    with timed("render"):
+        spec = resolve_template(template_path, template_id)
+        canvas = LayerCanvas(spec.size)
+        draw_certificate_fields(
+            canvas, canvas, student_name, ngo_name, contents, date, ngo_signature, shared, spec.layout
+        )
+        with timed("pdf_encode"):
+            return canvas.encode()
+
+def open_merged_pdf(
+    output: BinaryIO,
+    template_path: str = None,
+    template_id: Optional[str] = None
+) -> MergedPdfWriter:
+    """创建合并PDF写入器，模板背景只嵌入一次"""
+    spec = resolve_template(template_path, template_id)
+    return MergedPdfWriter(
+        output,
+        get_template(spec.image_path, spec.image_signature),
+        resolution=config.OUTPUT_SETTINGS["base_dpi"],
+        background_jpeg=get_template_jpeg(spec.image_path, spec.image_signature)
+    )
+
+def generate_merged_certificates(
+    records: Iterable[Dict[str, Any]],
+    output: Union[str, BinaryIO],
+    template_path: str = None,
+    template_id: Optional[str] = None
+) -> int:
+    """把多张证书合并为一个PDF，每页一张证书
     
-    # 生成唯一文件名
-    unique_id = uuid.uuid4().hex
-    output_filename = f"certificate_{unique_id}.pdf"
-    output_path = os.path.join(config.TEMP_DIR, output_filename)
-    log_debug(f"生成证书文件: {output_path}")
+    records 可以是任意可迭代对象（例如逐行读取的文件），逐条渲染并立即写出，
+    内存占用与证书数量无关。
     
-    # 保存为PDF
-    template.convert('RGB').save(output_path, "PDF", resolution=100.0)
-    log_debug(f"证书生成完成")
+    Args:
+        records: generate_certificate 参数组成的字典（不含 template_path / template_id）
+        output: 输出文件路径或可写的二进制流
+        template_path: 自定义模板路径
+        template_id: 模板注册表中的模板ID
+        
+    Returns:
+        int: 写入的页数
+    """
+    if isinstance(output, str):
+        with open(output, "wb") as f:
+            return generate_merged_certificates(records, f, template_path, template_id)
     
-    return output_path 
\ No newline at end of file
+    writer = open_merged_pdf(output, template_path, template_id)
+    for record in records:
+        writer.add_page(render_page_layers(template_path=template_path, template_id=template_id, **record))
+    writer.close()
+    return writer.page_count
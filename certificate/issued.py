@@ -0,0 +1,139 @@
+"""
+已签发证书的存储
+每张生成过的证书以请求的缓存键作为稳定的证书ID保存到渲染结果存储，之后可以通过 GET /certificates/{id}
+反复下载而不需要重新渲染。同一个ID只保存第一次生成的内容，保证下载到的内容和强ETag始终不变
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import config
+from certificate.output import FORMATS
+from certificate.storage import Storage, get_storage
+
+# 证书ID：请求缓存键（sha256）的前32位十六进制
+ID_LENGTH = 32
+_ID_PATTERN = re.compile(rf"^[0-9a-f]{{{ID_LENGTH}}}$")
+
+
+class IssuedCertificate(NamedTuple):
+    """已保存的证书"""
+    certificate_id: str
+    key: str  # 内容在存储中的键
+    path: Optional[str]  # 本地文件路径，存储后端不是本地目录时为None
+    output_format: str
+    etag: str  # 强ETag（含引号），由内容的sha256得到
+    size: int
+    created: float
+
+    @property
+    def media_type(self) -> str:
+        return FORMATS[self.output_format][1]
+
+    @property
+    def filename(self) -> str:
+        return f"certificate{FORMATS[self.output_format][0]}"
+
+
+def certificate_id(key: str) -> str:
+    """由请求的缓存键得到证书ID，相同的请求（同一模板和字体版本）得到相同的ID"""
+    return key[:ID_LENGTH]
+
+
+def is_certificate_id(value: str) -> bool:
+    return bool(_ID_PATTERN.match(value))
+
+
+def content_etag(data: bytes) -> str:
+    """证书内容的强ETag（含引号）"""
+    return '"%s"' % hashlib.sha256(data).hexdigest()[:32]
+
+
+class IssuedStore:
+    """保存在渲染结果存储（certificate.storage）中的证书
+
+    每张证书对应一个内容对象和一个记录格式、ETag的元数据对象。内容对象的键包含内容摘要，
+    先写入内容再写入元数据；元数据只在不存在时写入，多个进程同时保存同一个ID时只有第一个生效，
+    读取方看到元数据时内容一定已经完整。过期的证书由存储的清理器删除。
+    """
+
+    def __init__(self, storage: Storage, prefix: str = "issued"):
+        self.storage = storage
+        self.prefix = prefix
+
+    @classmethod
+    def from_config(cls) -> "IssuedStore":
+        """使用进程内共享的渲染结果存储"""
+        return cls(get_storage())
+
+    def _meta_key(self, cert_id: str) -> str:
+        return f"{self.prefix}/{cert_id}.json"
+
+    def get(self, cert_id: str) -> Optional[IssuedCertificate]:
+        """按ID返回已保存的证书，不存在时返回None"""
+        if not is_certificate_id(cert_id):
+            return None
+        data = self.storage.get(self._meta_key(cert_id))
+        if data is None:
+            return None
+        try:
+            meta = json.loads(data)
+        except ValueError:
+            return None
+        key = f"{self.prefix}/{meta['file']}"
+        if self.storage.stat(key) is None:
+            return None
+        return IssuedCertificate(cert_id, key, self.storage.local_path(key), meta["format"], meta["etag"],
+                                 meta["size"], meta["created"])
+
+    def read(self, certificate: IssuedCertificate) -> Optional[bytes]:
+        """读取证书的完整内容，已被清理时返回None"""
+        return self.storage.get(certificate.key)
+
+    def read_range(self, certificate: IssuedCertificate, start: int, end: int) -> Optional[bytes]:
+        """读取证书内容中 [start, end] 范围的字节（用于没有本地文件的存储后端）"""
+        return self.storage.get_range(certificate.key, start, end)
+
+    def put(self, cert_id: str, data: bytes, output_format: str) -> IssuedCertificate:
+        """保存证书；ID已存在时保留原有内容，返回已保存的证书"""
+        existing = self.get(cert_id)
+        if existing is not None:
+            return existing
+
+        etag = content_etag(data)
+        filename = f"{cert_id}.{etag[1:17]}{FORMATS[output_format][0]}"
+        key = f"{self.prefix}/{filename}"
+        self.storage.put(key, data)
+
+        meta = {"file": filename, "format": output_format, "etag": etag, "size": len(data),
+                "created": time.time()}
+        meta_data = json.dumps(meta).encode("utf-8")
+        if not self.storage.put(self._meta_key(cert_id), meta_data, overwrite=False):
+            # 其他请求已经保存了这个ID，使用先保存的内容
+            existing = self.get(cert_id)
+            if existing is not None:
+                if existing.key != key:
+                    self.storage.delete(key)
+                return existing
+            # 元数据还在但内容已被清理，重新保存
+            self.storage.put(self._meta_key(cert_id), meta_data)
+        return IssuedCertificate(cert_id, key, self.storage.local_path(key), output_format, meta["etag"],
+                                 meta["size"], meta["created"])
+
+
+# 进程内共享的证书存储
+_store: Optional[IssuedStore] = None
+_store_lock = threading.Lock()
+
+
+def get_issued_store() -> Optional[IssuedStore]:
+    """返回进程内共享的证书存储，未启用时返回None"""
+    global _store
+    if _store is None and config.ISSUED_SETTINGS["enabled"]:
+        with _store_lock:
+            if _store is None:
+                _store = IssuedStore.from_config()
+    return _store
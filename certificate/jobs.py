@@ -0,0 +1,452 @@
+"""
+异步证书任务
+任务保存在SQLite中，提交后立即返回任务ID，由后台工作者依次取出执行；
+执行中的任务带有工作者的租约并定期续期，工作者退出或租约过期后任务重新排队，不会丢失；
+完成超过保存时间的任务连同结果文件一起删除
+"""
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import config
+from certificate.batch import stream_certificate_pdf, stream_certificate_zip
+from certificate.executor import RenderExecutor, get_executor
+from certificate.models import BatchCertificateRequest
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# 输出方式 -> (结果文件扩展名, MIME类型)
+OUTPUT_TYPES = {
+    "zip": (".zip", "application/zip"),
+    "pdf": (".pdf", "application/pdf"),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    output TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    rendered INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    errors TEXT NOT NULL DEFAULT '[]',
+    error TEXT,
+    result_path TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    owner TEXT,
+    lease_expires REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+class JobStore:
+    """SQLite任务队列
+
+    使用一个连接并用锁串行化；写入可能等待其他进程的锁，在事件循环中要通过 run_in_executor 调用。
+    """
+
+    def __init__(self, db_path: str):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def create(self, request: BatchCertificateRequest, output: str) -> str:
+        """保存一个新任务，返回任务ID"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, output, payload, total, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, output, request.model_dump_json(), request.item_count(), time.time())
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """读取任务，不存在时返回None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def claim_next(self, owner: str, lease: float) -> Optional[Dict[str, Any]]:
+        """取出最早排队的任务，标记为执行中并由 owner 持有 lease 秒的租约"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                started_at = time.time()
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, rendered = 0, failed = 0, errors = '[]', started_at = ?, "
+                    "owner = ?, lease_expires = ? WHERE id = ?",
+                    (RUNNING, started_at, owner, started_at + lease, row["id"])
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        job = dict(row)
+        job.update(status=RUNNING, rendered=0, failed=0, errors="[]", started_at=started_at,
+                   owner=owner, lease_expires=started_at + lease)
+        return job
+
+    def renew_lease(self, job_id: str, owner: str, lease: float) -> bool:
+        """续期租约；任务已不属于 owner（租约过期后被重新排队）时返回False"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND owner = ? AND status = ?",
+                (time.time() + lease, job_id, owner, RUNNING)
+            )
+            return cursor.rowcount > 0
+
+    def update_progress(
+        self, job_id: str, owner: str, rendered: int, failed: int, errors: List[Dict[str, Any]]
+    ) -> None:
+        """记录任务进度（只在任务仍属于 owner 时）"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET rendered = ?, failed = ?, errors = ? WHERE id = ? AND owner = ?",
+                (rendered, failed, json.dumps(errors, ensure_ascii=False), job_id, owner)
+            )
+
+    def finish(self, job_id: str, result_path: str, owner: str) -> bool:
+        """标记任务完成；任务已不属于 owner 时不修改并返回False"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, result_path = ?, finished_at = ?, owner = NULL, lease_expires = NULL "
+                "WHERE id = ? AND owner = ?",
+                (DONE, result_path, time.time(), job_id, owner)
+            )
+            return cursor.rowcount > 0
+
+    def fail(self, job_id: str, message: str, owner: str) -> bool:
+        """标记任务失败；任务已不属于 owner 时不修改并返回False"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?, owner = NULL, lease_expires = NULL "
+                "WHERE id = ? AND owner = ?",
+                (FAILED, message, time.time(), job_id, owner)
+            )
+            return cursor.rowcount > 0
+
+    def requeue_expired(self) -> int:
+        """把租约已过期（持有的工作者已退出或失去响应）的执行中任务重新排队，返回任务数量"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, owner = NULL, lease_expires = NULL "
+                "WHERE status = ? AND lease_expires < ?",
+                (QUEUED, RUNNING, time.time())
+            )
+            return cursor.rowcount
+
+    def release(self, owner: str) -> int:
+        """把 owner 正在执行的任务重新排队（工作者正常停止时），返回任务数量"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, owner = NULL, lease_expires = NULL "
+                "WHERE status = ? AND owner = ?",
+                (QUEUED, RUNNING, owner)
+            )
+            return cursor.rowcount
+
+    def expire(self, finished_before: float) -> List[Optional[str]]:
+        """删除在 finished_before 之前完成或失败的任务，返回它们的结果文件路径"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT result_path FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                    (DONE, FAILED, finished_before)
+                ).fetchall()
+                self._conn.execute(
+                    "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (DONE, FAILED, finished_before)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [row["result_path"] for row in rows]
+
+    def active_ids(self) -> List[str]:
+        """排队中和执行中的任务ID"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)).fetchall()
+        return [row["id"] for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    """任务状态的对外表示"""
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "output": job["output"],
+        "total": job["total"],
+        "rendered": job["rendered"],
+        "failed": job["failed"],
+        "errors": json.loads(job["errors"]),
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+
+
+class _Progress:
+    """收集单个任务的进度，按时间间隔节流写入数据库"""
+
+    def __init__(self, store: JobStore, job_id: str, owner: str, requests: list, interval: float):
+        self._loop = asyncio.get_running_loop()
+        self._pending: Optional[asyncio.Future] = None
+        self._store = store
+        self._job_id = job_id
+        self._owner = owner
+        self._requests = requests
+        self._interval = interval
+        self._last_flush = 0.0
+        self.rendered = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def __call__(self, index: int, error: Optional[BaseException]) -> None:
+        if error is None:
+            self.rendered += 1
+        else:
+            self.failed += 1
+            self.errors.append({
+                "index": index,
+                "studentName": self._requests[index].studentName,
+                "error": str(error)
+            })
+        now = time.monotonic()
+        # 上一次写入还没有完成时跳过，下一张证书完成时再写
+        if now - self._last_flush >= self._interval and (self._pending is None or self._pending.done()):
+            self._pending = self._loop.run_in_executor(None, self._write, self.rendered, self.failed, list(self.errors))
+            self._last_flush = now
+
+    def _write(self, rendered: int, failed: int, errors: List[Dict[str, Any]]) -> None:
+        self._store.update_progress(self._job_id, self._owner, rendered, failed, errors)
+
+    async def flush(self) -> None:
+        """等待进行中的写入，再写入最终进度"""
+        if self._pending is not None:
+            await asyncio.gather(self._pending, return_exceptions=True)
+        await self._loop.run_in_executor(None, self._write, self.rendered, self.failed, list(self.errors))
+
+
+class JobWorker:
+    """后台任务工作者
+
+    在事件循环中运行 concurrency 个循环，依次从队列取出任务，
+    渲染仍交给共享的渲染执行器，每个任务最多同时提交 window 个渲染，给在线请求留出名额。
+    多个进程可以共用同一个数据库：执行中的任务由取出它的工作者持有 lease 秒的租约，
+    每 lease/3 秒续期一次，只有租约过期的任务才会被其他工作者重新排队。
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        result_dir: str,
+        executor: Optional[RenderExecutor] = None,
+        concurrency: int = 1,
+        window: Optional[int] = None,
+        poll_interval: float = 1.0,
+        progress_interval: float = 0.5,
+        lease: float = 60.0,
+        result_ttl: float = 0.0,
+        cleanup_interval: float = 600.0
+    ):
+        self.store = store
+        self.result_dir = result_dir
+        self.executor = executor or get_executor()
+        self.concurrency = max(1, concurrency)
+        self.window = window
+        self.poll_interval = poll_interval
+        self.progress_interval = progress_interval
+        self.lease = lease
+        self.result_ttl = result_ttl
+        self.cleanup_interval = cleanup_interval
+        # 工作者标识：主机名、进程号和随机后缀，同一主机上重启的进程不会与旧进程混淆
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._last_cleanup = 0.0
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        os.makedirs(result_dir, exist_ok=True)
+
+    @classmethod
+    def from_config(cls) -> "JobWorker":
+        """根据 config.JOB_SETTINGS 创建工作者"""
+        settings = config.JOB_SETTINGS
+        return cls(
+            JobStore(settings["db_path"]),
+            settings["result_dir"],
+            concurrency=settings["concurrency"],
+            window=settings["window"],
+            poll_interval=settings["poll_interval"],
+            progress_interval=settings["progress_interval"],
+            lease=settings["lease"],
+            result_ttl=settings["result_ttl"],
+            cleanup_interval=settings["cleanup_interval"],
+        )
+
+    def start(self) -> None:
+        """启动工作循环（需在事件循环中调用），每个循环先重新排队租约已过期的任务"""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._loop()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        """停止工作循环，执行中的任务立即重新排队，由其他工作者或下次启动时继续执行"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.get_running_loop().run_in_executor(None, self.store.release, self.worker_id)
+
+    async def submit(self, request: BatchCertificateRequest, output: str) -> str:
+        """保存任务并唤醒工作者，返回任务ID"""
+        job_id = await asyncio.get_running_loop().run_in_executor(None, self.store.create, request, output)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    def result_path(self, job_id: str, output: str) -> str:
+        return os.path.join(self.result_dir, job_id + OUTPUT_TYPES[output][0])
+
+    def cleanup(self, now: Optional[float] = None) -> int:
+        """删除完成超过 result_ttl 秒的任务及其结果文件，以及结果目录中不属于任何任务的旧文件
+
+        返回删除的文件数量。result_ttl 为0时不清理。
+        """
+        if self.result_ttl <= 0:
+            return 0
+        cutoff = (time.time() if now is None else now) - self.result_ttl
+        removed = 0
+        for path in self.store.expire(cutoff):
+            if path and os.path.isfile(path):
+                os.remove(path)
+                removed += 1
+        # 进程中断留下的临时文件、数据库记录已被删除的结果文件
+        active = set(self.store.active_ids())
+        for filename in os.listdir(self.result_dir):
+            path = os.path.join(self.result_dir, filename)
+            try:
+                if filename.split(".", 1)[0] in active or os.stat(path).st_mtime >= cutoff:
+                    continue
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+    async def _maintain(self) -> None:
+        """定期重新排队租约过期的任务，并按 cleanup_interval 清理过期的任务"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.store.requeue_expired)
+        now = time.monotonic()
+        if self.result_ttl > 0 and now - self._last_cleanup >= self.cleanup_interval:
+            self._last_cleanup = now
+            try:
+                await loop.run_in_executor(None, self.cleanup)
+            except Exception as e:
+                print(f"警告：清理过期任务失败: {e}", file=sys.stderr)
+
+    async def _loop(self) -> None:
+        while True:
+            await self._maintain()
+            job = await asyncio.get_running_loop().run_in_executor(
+                None, self.store.claim_next, self.worker_id, self.lease
+            )
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        """执行一个任务，执行期间定期续期租约；失去租约时停止执行，由新的持有者完成"""
+        loop = asyncio.get_running_loop()
+        work = asyncio.ensure_future(self._execute(job))
+        try:
+            while True:
+                done, _ = await asyncio.wait({work}, timeout=self.lease / 3)
+                if done:
+                    return
+                if not await loop.run_in_executor(None, self.store.renew_lease, job["id"], self.worker_id, self.lease):
+                    break
+        finally:
+            # 失去租约或工作者停止
+            if not work.done():
+                work.cancel()
+                await asyncio.gather(work, return_exceptions=True)
+
+    async def _execute(self, job: Dict[str, Any]) -> None:
+        """渲染任务的结果，先写入临时文件，完成后改名"""
+        job_id = job["id"]
+        loop = asyncio.get_running_loop()
+        try:
+            request = BatchCertificateRequest.model_validate_json(job["payload"])
+            requests = list(request.iter_requests())
+            progress = _Progress(self.store, job_id, self.worker_id, requests, self.progress_interval)
+            stream = stream_certificate_pdf if job["output"] == "pdf" else stream_certificate_zip
+
+            path = self.result_path(job_id, job["output"])
+            temp_path = f"{path}.{self.worker_id.replace(':', '-')}.tmp"
+            try:
+                with open(temp_path, "wb") as f:
+                    async for chunk in stream(requests, self.executor, on_result=progress, window=self.window):
+                        if chunk:
+                            await loop.run_in_executor(None, f.write, chunk)
+                os.replace(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+            await progress.flush()
+            await loop.run_in_executor(None, self.store.finish, job_id, path, self.worker_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await loop.run_in_executor(None, self.store.fail, job_id, str(e), self.worker_id)
+
+
+# 进程内共享的任务工作者
+_job_worker: Optional[JobWorker] = None
+
+
+def get_job_worker() -> JobWorker:
+    """返回进程内共享的任务工作者"""
+    global _job_worker
+    if _job_worker is None:
+        _job_worker = JobWorker.from_config()
+    return _job_worker
@@ -0,0 +1,186 @@
+"""
+文本换行
+把文本切分为不可拆分的片段（西文单词、单个汉字、空白），每个片段的宽度按字体缓存，
+逐段累加宽度完成换行；中文按字符断行，并遵守常见的行首/行尾禁则
+"""
+import re
+from typing import Callable, List, Tuple
+
+from PIL import ImageFont
+
+import config
+from certificate.cache import LRUCache
+from certificate.fonts import font_key
+
+# 不能出现在行首的标点（句号、逗号、右括号等）
+NO_LINE_START = frozenset(
+    "，。、；：！？）】》」』〕〉”’…—～·．,.;:!?)]}%"
+    "）］｝〕〗〙〛〞〟"
+)
+# 不能出现在行尾的标点（左括号、左引号等）
+NO_LINE_END = frozenset(
+    "（【《「『〔〈“‘([{"
+    "（［｛〔〖〘〚〝"
+)
+
+# 西文单词（连续的非空白、非表意字符）、空白、其他单个字符
+_TOKEN_PATTERN = re.compile(
+    r"\s+"
+    r"|[^\s\u1100-\u11ff\u2e80-\u9fff\ua960-\ua97f\uac00-\ud7ff\uf900-\ufaff"
+    r"\ufe30-\ufe4f\uff00-\uffef\U00020000-\U0003ffff]+"
+    r"|."
+)
+
+# 片段宽度缓存: (字体标识, 片段) -> 宽度
+_advance_cache = LRUCache(config.FONT_SETTINGS["advance_cache_size"])
+# 换行结果缓存: (字体标识, 文本, 最大宽度) -> 各行文本
+_wrap_cache = LRUCache(config.FONT_SETTINGS["wrap_cache_size"])
+# 自动字号结果缓存: (最大字号的字体标识, 文本, 最大宽度, 最小字号) -> 字号
+_fit_cache = LRUCache(config.FONT_SETTINGS["fit_cache_size"])
+
+
+def text_advance(text: str, font: ImageFont.FreeTypeFont) -> float:
+    """文本的前进宽度，按 (字体, 文本) 缓存"""
+    key = (font_key(font), text)
+    width = _advance_cache.get(key)
+    if width is None:
+        width = font.getlength(text)
+        _advance_cache.put(key, width)
+    return width
+
+
+def _segments(paragraph: str) -> List[Tuple[str, bool]]:
+    """把一段文本切分为 (片段, 是否空白)，并按禁则把标点与相邻片段合并"""
+    segments: List[Tuple[str, bool]] = []
+    glue_next = False
+    for match in _TOKEN_PATTERN.finditer(paragraph):
+        token = match.group()
+        if token.isspace():
+            segments.append((" ", True))
+            glue_next = False
+            continue
+        if segments and not segments[-1][1] and (glue_next or token[0] in NO_LINE_START):
+            # 行首禁则标点跟随前一个片段；前一个片段以行尾禁则标点结尾时与本片段连在一起
+            segments[-1] = (segments[-1][0] + token, False)
+        else:
+            segments.append((token, False))
+        glue_next = token[-1] in NO_LINE_END
+    return segments
+
+
+def _split_long(segment: str, font: ImageFont.FreeTypeFont, max_width: float) -> List[str]:
+    """把超过最大宽度的单个片段按字符拆开"""
+    pieces = []
+    current = ""
+    width = 0.0
+    for char in segment:
+        advance = text_advance(char, font)
+        if current and width + advance > max_width:
+            pieces.append(current)
+            current, width = "", 0.0
+        current += char
+        width += advance
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def wrap_paragraph(paragraph: str, font: ImageFont.FreeTypeFont, max_width: float) -> List[str]:
+    """对一段不含换行符的文本换行"""
+    lines: List[str] = []
+    current: List[str] = []
+    width = 0.0
+    pending_space = 0.0
+
+    for segment, is_space in _segments(paragraph):
+        if is_space:
+            # 空白只在两个片段之间生效，行首行尾的空白丢弃
+            if current:
+                pending_space = text_advance(" ", font)
+            continue
+
+        advance = text_advance(segment, font)
+        if current and width + pending_space + advance <= max_width:
+            if pending_space:
+                current.append(" ")
+            current.append(segment)
+            width += pending_space + advance
+            pending_space = 0.0
+            continue
+
+        if current:
+            lines.append("".join(current))
+            current, width = [], 0.0
+        pending_space = 0.0
+
+        if advance > max_width:
+            pieces = _split_long(segment, font, max_width)
+            lines.extend(pieces[:-1])
+            segment = pieces[-1]
+            advance = text_advance(segment, font)
+        current.append(segment)
+        width = advance
+
+    if current:
+        lines.append("".join(current))
+    return lines
+
+
+def wrap_lines(text: str, font: ImageFont.FreeTypeFont, max_width: float) -> List[str]:
+    """按最大宽度把文本拆分为多行，文本中的换行符作为强制换行
+
+    结果按 (字体, 文本, 最大宽度) 缓存，同一批证书中相同的内容只换行一次。
+    """
+    key = (font_key(font), text, max_width)
+    cached = _wrap_cache.get(key)
+    if cached is not None:
+        return list(cached)
+
+    lines: List[str] = []
+    for paragraph in text.splitlines():
+        lines.extend(wrap_paragraph(paragraph, font, max_width))
+    _wrap_cache.put(key, tuple(lines))
+    return lines
+
+
+def fit_font_size(
+    text: str,
+    max_width: float,
+    max_size: int,
+    min_size: int,
+    font_for_size: Callable[[int], ImageFont.FreeTypeFont]
+) -> int:
+    """返回单行文本宽度不超过 max_width 的最大字号（不小于 min_size）
+
+    前进宽度与字号近似成正比：只在 max_size 下量一次宽度，按比例估算字号，
+    再用估算字号及相邻字号的字体核对（通常只差一号），不为每个候选字号加载字体。
+    结果按 (字体, 文本, 最大宽度, 最小字号) 缓存，重复的姓名只计算一次。最小字号也放不下时返回 min_size。
+    """
+    largest = font_for_size(max_size)
+    key = (font_key(largest), text, max_width, min_size)
+    size = _fit_cache.get(key)
+    if size is not None:
+        return size
+
+    width = text_advance(text, largest)
+    if min_size >= max_size or width <= max_width:
+        size = max_size
+    else:
+        size = max(min_size, min(max_size - 1, int(max_size * max_width / width)))
+        if text_advance(text, font_for_size(size)) <= max_width:
+            # 估算向下取整，字形微调也可能让大一号的字体仍然放得下
+            while size + 1 < max_size and text_advance(text, font_for_size(size + 1)) <= max_width:
+                size += 1
+        else:
+            while size > min_size and text_advance(text, font_for_size(size - 1)) > max_width:
+                size -= 1
+            size = max(min_size, size - 1)
+    _fit_cache.put(key, size)
+    return size
+
+
+def clear_advance_cache() -> None:
+    """清空片段宽度缓存、换行结果缓存和自动字号缓存"""
+    _advance_cache.clear()
+    _wrap_cache.clear()
+    _fit_cache.clear()
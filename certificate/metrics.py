@@ -0,0 +1,287 @@
+"""
+运行指标
+进程内的计数器、仪表和直方图，以Prometheus文本格式导出。
+每次记录只是一次加锁的计数更新，可以长期开启；
+在进程池中渲染时，子进程记录的观测值随结果一起带回父进程
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from certificate import tracing
+
+# 默认的耗时分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+# 在子进程中执行时收集观测值的列表，为None时直接记录到本进程的指标
+_capture: contextvars.ContextVar = contextvars.ContextVar("metrics_capture", default=None)
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        sink = _capture.get()
+        if sink is not None:
+            sink.append((self.name, "inc", labels, amount))
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """可增可减的当前值"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class CallbackMetric(_Metric):
+    """导出时调用函数读取当前值，用于已经在别处计数的数据（缓存命中数、队列长度等）"""
+
+    def __init__(self, name: str, help_text: str, kind: str,
+                 collect: Callable[[], Dict[LabelValues, float]], labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self.kind = kind
+        self._collect = collect
+
+    def render(self) -> List[str]:
+        try:
+            values = self._collect()
+        except Exception:
+            return []
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """累积分桶的直方图"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各分桶计数..., 总数, 总和]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        sink = _capture.get()
+        if sink is not None:
+            sink.append((self.name, "observe", labels, value))
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0, 0.0]
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {int(state[-2])}")
+            plain = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_count{plain} {int(state[-2])}")
+            lines.append(f"{self.name}_sum{plain} {_format_value(state[-1])}")
+        return lines
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """导出为Prometheus文本格式"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "certificate_stage_seconds", "证书渲染各阶段耗时（秒）", ("stage",)
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "certificate_request_seconds", "HTTP请求总耗时（秒）", ("endpoint",),
+    buckets=DEFAULT_BUCKETS + (30.0, 60.0)
+))
+REQUESTS_TOTAL = REGISTRY.register(Counter(
+    "certificate_requests_total", "HTTP请求数量", ("endpoint", "status")
+))
+FAILURES_TOTAL = REGISTRY.register(Counter(
+    "certificate_failures_total", "渲染或处理失败次数", ("stage",)
+))
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """记录代码块的耗时到 certificate_stage_seconds，开启追踪时同时记录为追踪事件"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.observe(duration, stage=stage)
+        tracing.record_span(stage, start, duration)
+
+
+def record_failure(stage: str) -> None:
+    FAILURES_TOTAL.inc(stage=stage)
+
+
+def capture_call(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Tuple[Any, List[tuple]]:
+    """执行 fn 并收集期间的观测值，用于在子进程中执行后带回父进程"""
+    sink: List[tuple] = []
+    token = _capture.set(sink)
+    try:
+        return fn(*args, **kwargs), sink
+    finally:
+        _capture.reset(token)
+
+
+def replay(observations: List[tuple]) -> None:
+    """把子进程带回的观测值记录到本进程的指标"""
+    for name, action, labels, value in observations:
+        metric = REGISTRY.get(name)
+        if metric is not None:
+            getattr(metric, action)(value, **labels)
+
+
+class MetricsMiddleware:
+    """记录每个HTTP请求的耗时和状态码的ASGI中间件
+
+    耗时记到响应体发送完毕为止，流式响应也包含完整的传输时间；
+    endpoint 标签使用路由模板（例如 /jobs/{job_id}），不会因路径参数产生大量标签。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500, "done": False}
+
+        def _finish() -> None:
+            if status["done"]:
+                return
+            status["done"] = True
+            route = scope.get("route")
+            endpoint = getattr(route, "path", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+            REQUESTS_TOTAL.inc(endpoint=endpoint, status=str(status["code"]))
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                _finish()
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _finish()
+
+
+def render_metrics() -> str:
+    """导出所有指标"""
+    return REGISTRY.render()
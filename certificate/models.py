@@ -1,10 +1,97 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import Iterator, List, Literal, Optional
+
+def check_output_fields(request: BaseModel) -> None:
+    """检查输出选项的组合（与模板尺寸有关的检查在渲染前进行）"""
+    if request.width is not None and request.dpi is not None:
+        raise ValueError("width 和 dpi 只能提供其中一个")
+    if request.engine == "vector" and request.format not in (None, "pdf"):
+        raise ValueError("矢量渲染引擎只能输出PDF")
 
 class CertificateRequest(BaseModel):
     """证书生成请求的数据模型"""
     studentName: str = Field(..., description="学生姓名")
-    ngoSignature: Optional[str] = Field(None, description="NGO签名图片URL或文本")
+    ngoSignature: Optional[str] = Field(None, description="NGO签名：图片URL、base64 data URL、signature:<签名ID> 或文本")
     ngoName: str = Field(..., description="NGO名称")
     contents: str = Field(..., description="证书内容")
-    date: str = Field(..., description="颁发日期") 
\ No newline at end of file
+    date: str = Field(..., description="颁发日期")
+    engine: Optional[Literal["raster", "vector"]] = Field(None, description="渲染引擎: raster 或 vector，默认使用服务配置")
+    templateId: Optional[str] = Field(None, description="模板ID，默认使用默认模板")
+    format: Optional[Literal["pdf", "png", "jpeg", "webp"]] = Field(None, description="输出格式，默认使用服务配置")
+    quality: Optional[int] = Field(None, ge=1, le=100, description="JPEG/WebP编码质量 1-100")
+    width: Optional[int] = Field(None, gt=0, description="输出的像素宽度，与 dpi 二选一")
+    dpi: Optional[float] = Field(None, gt=0, description="输出分辨率，与 width 二选一")
+
+    @model_validator(mode="after")
+    def check_output_options(self) -> "CertificateRequest":
+        check_output_fields(self)
+        return self
+
+class PreviewRequest(BaseModel):
+    """实时预览请求的数据模型，输入过程中尚未填写的字段可以为空"""
+    studentName: str = Field("", description="学生姓名")
+    ngoSignature: Optional[str] = Field(None, description="NGO签名：图片URL、base64 data URL、signature:<签名ID> 或文本")
+    ngoName: str = Field("", description="NGO名称")
+    contents: str = Field("", description="证书内容")
+    date: str = Field("", description="颁发日期")
+    templateId: Optional[str] = Field(None, description="模板ID，默认使用默认模板")
+    format: Optional[Literal["jpeg", "webp"]] = Field(None, description="预览格式，默认使用服务配置")
+    quality: Optional[int] = Field(None, ge=1, le=100, description="编码质量 1-100")
+    width: Optional[int] = Field(None, gt=0, description="预览宽度（像素）")
+
+class BatchCertificateRequest(BaseModel):
+    """批量证书生成请求的数据模型
+
+    两种用法二选一：
+    1. items: 逐条给出完整的证书请求
+    2. ngoName/date/contents/ngoSignature 共享字段 + studentNames 学生姓名列表
+    """
+    items: Optional[List[CertificateRequest]] = Field(None, description="完整的证书请求列表")
+    studentNames: Optional[List[str]] = Field(None, description="学生姓名列表，与共享字段一起使用")
+    ngoSignature: Optional[str] = Field(None, description="共享的NGO签名：图片URL、base64 data URL、signature:<签名ID> 或文本")
+    ngoName: Optional[str] = Field(None, description="共享的NGO名称")
+    contents: Optional[str] = Field(None, description="共享的证书内容")
+    date: Optional[str] = Field(None, description="共享的颁发日期")
+    engine: Optional[Literal["raster", "vector"]] = Field(None, description="共享的渲染引擎（仅用于 ZIP 输出）")
+    templateId: Optional[str] = Field(None, description="共享的模板ID")
+    format: Optional[Literal["pdf", "png", "jpeg", "webp"]] = Field(None, description="共享的输出格式（仅用于 ZIP 输出）")
+    quality: Optional[int] = Field(None, ge=1, le=100, description="共享的编码质量（仅用于 ZIP 输出）")
+    width: Optional[int] = Field(None, gt=0, description="共享的输出宽度（仅用于 ZIP 输出）")
+    dpi: Optional[float] = Field(None, gt=0, description="共享的输出分辨率（仅用于 ZIP 输出）")
+
+    @model_validator(mode="after")
+    def check_batch_mode(self) -> "BatchCertificateRequest":
+        check_output_fields(self)
+        if self.items is not None and self.studentNames is not None:
+            raise ValueError("items 和 studentNames 只能提供其中一个")
+        if self.items is None and self.studentNames is None:
+            raise ValueError("必须提供 items 或 studentNames")
+        if self.studentNames is not None:
+            missing = [name for name in ("ngoName", "contents", "date") if getattr(self, name) is None]
+            if missing:
+                raise ValueError(f"使用 studentNames 时必须提供共享字段: {', '.join(missing)}")
+        return self
+
+    def item_count(self) -> int:
+        """批量请求中的证书数量"""
+        return len(self.items if self.items is not None else self.studentNames)
+
+    def iter_requests(self) -> Iterator[CertificateRequest]:
+        """展开为逐条的证书请求"""
+        if self.items is not None:
+            yield from self.items
+            return
+        for student_name in self.studentNames:
+            yield CertificateRequest(
+                studentName=student_name,
+                ngoSignature=self.ngoSignature,
+                ngoName=self.ngoName,
+                contents=self.contents,
+                date=self.date,
+                engine=self.engine,
+                templateId=self.templateId,
+                format=self.format,
+                quality=self.quality,
+                width=self.width,
+                dpi=self.dpi
+            )
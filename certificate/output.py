@@ -0,0 +1,112 @@
+"""
+证书输出格式
+请求可以选择输出格式（PDF/PNG/JPEG/WebP）、质量和目标宽度/DPI。
+需要较小的输出时，模板和布局按比例缩小后直接在小画布上渲染，
+而不是先渲染原尺寸再缩小
+"""
+from typing import BinaryIO, Optional, Tuple, Union
+
+from PIL import Image, features
+
+import config
+
+# 输出格式 -> (文件扩展名, MIME类型)
+FORMATS = {
+    "pdf": (".pdf", "application/pdf"),
+    "png": (".png", "image/png"),
+    "jpeg": (".jpg", "image/jpeg"),
+    "webp": (".webp", "image/webp"),
+}
+IMAGE_FORMATS = ("png", "jpeg", "webp")
+
+
+class OutputError(ValueError):
+    """输出选项无效"""
+
+
+def resolve_format(output_format: Optional[str] = None) -> str:
+    """返回要使用的输出格式，未指定时使用 config.OUTPUT_SETTINGS["format"]"""
+    output_format = (output_format or config.OUTPUT_SETTINGS["format"]).lower()
+    if output_format not in FORMATS:
+        raise OutputError(f"不支持的输出格式: {output_format}")
+    if output_format == "webp" and not features.check("webp"):
+        raise OutputError("当前Pillow不支持WebP编码")
+    return output_format
+
+
+def resolve_scale(size: Tuple[int, int], width: Optional[int] = None, dpi: Optional[float] = None) -> float:
+    """根据目标宽度或DPI计算相对模板原始尺寸的缩放比例
+
+    width 是输出图片的像素宽度；dpi 以 config.OUTPUT_SETTINGS["base_dpi"] 为原始尺寸，
+    PDF 的页面物理尺寸不随 dpi 变化。只支持缩小，不会把模板放大到超过原始分辨率。
+    """
+    if width is not None and dpi is not None:
+        raise OutputError("width 和 dpi 只能指定其中一个")
+    if width is not None:
+        scale = width / size[0]
+    elif dpi is not None:
+        scale = dpi / config.OUTPUT_SETTINGS["base_dpi"]
+    else:
+        return 1.0
+
+    if scale <= 0:
+        raise OutputError("width 和 dpi 必须大于0")
+    if scale > 1.0:
+        raise OutputError(
+            f"输出尺寸不能超过模板原始尺寸（宽度 {size[0]}px，{config.OUTPUT_SETTINGS['base_dpi']:g} DPI）"
+        )
+    if size[0] * scale < config.OUTPUT_SETTINGS["min_width"]:
+        raise OutputError(f"输出宽度不能小于 {config.OUTPUT_SETTINGS['min_width']}px")
+    return scale
+
+
+def resolve_output(
+    size: Tuple[int, int],
+    output_format: Optional[str] = None,
+    engine: Optional[str] = None,
+    width: Optional[int] = None,
+    dpi: Optional[float] = None
+) -> Tuple[str, float]:
+    """校验输出选项，返回 (输出格式, 缩放比例)
+
+    Args:
+        size: 模板原始尺寸
+        engine: 请求中明确指定的渲染引擎；矢量引擎只能输出PDF
+    """
+    output_format = resolve_format(output_format)
+    if engine == "vector" and output_format != "pdf":
+        raise OutputError("矢量渲染引擎只能输出PDF")
+    return output_format, resolve_scale(size, width, dpi)
+
+
+def scaled_size(size: Tuple[int, int], scale: float) -> Tuple[int, int]:
+    """缩放后的画布尺寸"""
+    if scale == 1.0:
+        return size
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+
+def encode_image(
+    image: Image.Image,
+    output: Union[str, BinaryIO],
+    output_format: str,
+    quality: Optional[int] = None,
+    dpi: Optional[float] = None
+) -> None:
+    """把渲染好的RGB图像编码为图片格式
+
+    各格式都选用编码较快的参数：JPEG不做额外的霍夫曼优化，PNG使用较低的压缩级别，
+    WebP使用较快的编码方法（均可在 config.OUTPUT_SETTINGS 中调整）。
+    """
+    settings = config.OUTPUT_SETTINGS
+    params = {}
+    if dpi is not None:
+        params["dpi"] = (dpi, dpi)
+    if output_format == "jpeg":
+        image.save(output, "JPEG", quality=quality or settings["jpeg_quality"], **params)
+    elif output_format == "webp":
+        image.save(output, "WEBP", quality=quality or settings["webp_quality"], method=settings["webp_method"])
+    elif output_format == "png":
+        image.save(output, "PNG", compress_level=settings["png_compress_level"], **params)
+    else:
+        raise OutputError(f"不是图片格式: {output_format}")
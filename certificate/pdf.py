@@ -0,0 +1,215 @@
+"""
+PDF输出
+一个顺序写入的最小PDF写入器，以及背景图只嵌入一次的多页合并PDF
+"""
+import zlib
+from io import BytesIO
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+from certificate.textlayers import get_text_sprite
+
+# 图层图像数据的压缩级别
+LAYER_COMPRESS_LEVEL = 6
+
+
+class PdfLayer(NamedTuple):
+    """已编码的前景图层，位置和尺寸以模板像素为单位"""
+    x: int
+    y: int
+    width: int
+    height: int
+    rgb: bytes  # Flate 压缩的 RGB 数据
+    alpha: Optional[bytes]  # Flate 压缩的透明度数据，None 表示不透明
+
+
+class LayerCanvas:
+    """记录绘制操作的画布
+
+    提供与 ImageDraw.text / Image.paste 相同的调用方式，
+    每段文字或每张图片都记录为一个带透明度的独立图层，而不是画到整张模板上。
+    """
+
+    def __init__(self, size: Tuple[int, int]):
+        self.size = size
+        self.layers: List[Tuple[int, int, Image.Image, Optional[Image.Image]]] = []
+
+    def text(self, xy, text, fill=None, font=None, **kwargs) -> None:
+        """以图层形式记录一段文字（遮罩来自文字图层缓存）"""
+        sprite = get_text_sprite(text, font)
+        if sprite.mask is None:
+            return
+        left, top = sprite.offset
+        color = Image.new("RGB", sprite.mask.size, fill)
+        self.layers.append((int(xy[0]) + left, int(xy[1]) + top, color, sprite.mask))
+
+    def paste(self, im: Image.Image, box: Tuple[int, int], mask: Optional[Image.Image] = None) -> None:
+        """以图层形式记录一张图片"""
+        alpha = None
+        if mask is not None:
+            alpha = mask.getchannel("A") if mask.mode == "RGBA" else mask.convert("L")
+        self.layers.append((box[0], box[1], im.convert("RGB"), alpha))
+
+    def encode(self) -> List[PdfLayer]:
+        """压缩所有图层，结果可以跨进程传递"""
+        encoded = []
+        for x, y, rgb, alpha in self.layers:
+            encoded.append(PdfLayer(
+                x, y, rgb.width, rgb.height,
+                zlib.compress(rgb.tobytes(), LAYER_COMPRESS_LEVEL),
+                zlib.compress(alpha.tobytes(), LAYER_COMPRESS_LEVEL) if alpha is not None else None
+            ))
+        return encoded
+
+
+def encode_jpeg(image: Image.Image, quality: int = 75) -> bytes:
+    """把RGB图像编码为JPEG（与Pillow保存PDF时的DCTDecode一致）"""
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+class PdfWriter:
+    """顺序写入的PDF写入器
+
+    对象写入后立即落到输出流，只在内存中保留交叉引用表的偏移量，
+    因此输出可以是不可 seek 的流。
+    """
+
+    def __init__(self, fp: BinaryIO, version: str = "1.4"):
+        self._fp = fp
+        self._position = 0
+        self._offsets: Dict[int, int] = {}
+        self._next_number = 1
+        self._write(b"%PDF-" + version.encode("ascii") + b"\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data: bytes) -> None:
+        self._fp.write(data)
+        self._position += len(data)
+
+    def reserve(self) -> int:
+        """预留一个对象编号，稍后用 write_object 写入"""
+        number = self._next_number
+        self._next_number += 1
+        return number
+
+    def write_object(self, number: int, body: bytes) -> int:
+        """写入一个间接对象"""
+        self._offsets[number] = self._position
+        self._write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        return number
+
+    def add_object(self, body: bytes) -> int:
+        """写入一个新的间接对象并返回编号"""
+        return self.write_object(self.reserve(), body)
+
+    def add_stream(self, entries: bytes, data: bytes) -> int:
+        """写入一个流对象，entries 为字典中除 /Length 外的内容"""
+        body = b"<< " + entries + b" /Length %d >>\nstream\n" % len(data) + data + b"\nendstream"
+        return self.add_object(body)
+
+    def close(self, root: int) -> None:
+        """写入交叉引用表和文件尾"""
+        xref_offset = self._position
+        count = self._next_number
+        lines = [b"xref\n0 %d\n" % count, b"0000000000 65535 f \n"]
+        for number in range(1, count):
+            lines.append(b"%010d 00000 n \n" % self._offsets.get(number, 0))
+        self._write(b"".join(lines))
+        self._write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, root, xref_offset))
+        self._fp.flush()
+
+
+def add_layer_image(writer: PdfWriter, layer: PdfLayer) -> int:
+    """把前景图层写为图像对象（带软蒙版），返回对象编号"""
+    smask = b""
+    if layer.alpha is not None:
+        alpha = writer.add_stream(
+            b"/Type /XObject /Subtype /Image /Width %d /Height %d "
+            b"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode" % (layer.width, layer.height),
+            layer.alpha
+        )
+        smask = b" /SMask %d 0 R" % alpha
+    return writer.add_stream(
+        b"/Type /XObject /Subtype /Image /Width %d /Height %d "
+        b"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode%s" % (layer.width, layer.height, smask),
+        layer.rgb
+    )
+
+
+def add_background_image(writer: PdfWriter, size: Tuple[int, int], jpeg: bytes) -> int:
+    """把JPEG编码的背景写为图像对象，返回对象编号"""
+    return writer.add_stream(
+        b"/Type /XObject /Subtype /Image /Width %d /Height %d "
+        b"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode" % size,
+        jpeg
+    )
+
+
+def layer_command(name: bytes, layer: PdfLayer, scale: float, page_height: float) -> bytes:
+    """在页面上绘制图层的内容流命令（PDF坐标原点在左下角）"""
+    return b"q %.4f 0 0 %.4f %.4f %.4f cm /%s Do Q" % (
+        layer.width * scale, layer.height * scale,
+        layer.x * scale, page_height - (layer.y + layer.height) * scale,
+        name
+    )
+
+
+class MergedPdfWriter:
+    """多页合并PDF，每页一张证书
+
+    背景图只作为一个图像对象嵌入一次，所有页面都引用它；
+    每页只写入自己的前景图层，内存占用与页数无关。
+    """
+
+    def __init__(self, fp: BinaryIO, background: Image.Image, resolution: float = 100.0,
+                 background_jpeg: Optional[bytes] = None):
+        self._writer = PdfWriter(fp)
+        self._size = background.size
+        self._scale = 72.0 / resolution
+        self._kids: List[int] = []
+
+        self._catalog = self._writer.reserve()
+        self._pages = self._writer.reserve()
+        self._background = add_background_image(
+            self._writer,
+            background.size,
+            background_jpeg if background_jpeg is not None else encode_jpeg(background)
+        )
+
+    @property
+    def page_count(self) -> int:
+        return len(self._kids)
+
+    def add_page(self, layers: List[PdfLayer]) -> None:
+        """添加一页：共享背景加上本页的前景图层"""
+        scale = self._scale
+        page_width = self._size[0] * scale
+        page_height = self._size[1] * scale
+
+        resources = [b"/Bg %d 0 R" % self._background]
+        commands = [b"q %.4f 0 0 %.4f 0 0 cm /Bg Do Q" % (page_width, page_height)]
+        for index, layer in enumerate(layers):
+            number = add_layer_image(self._writer, layer)
+            resources.append(b"/L%d %d 0 R" % (index, number))
+            commands.append(layer_command(b"L%d" % index, layer, scale, page_height))
+
+        contents = self._writer.add_stream(b"", b"\n".join(commands))
+        page = self._writer.add_object(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.4f %.4f] "
+            b"/Resources << /XObject << %s >> >> /Contents %d 0 R >>" % (
+                self._pages, page_width, page_height, b" ".join(resources), contents
+            )
+        )
+        self._kids.append(page)
+
+    def close(self) -> None:
+        """写入页面树和文件尾"""
+        kids = b" ".join(b"%d 0 R" % kid for kid in self._kids)
+        self._writer.write_object(
+            self._pages,
+            b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._kids))
+        )
+        self._writer.write_object(self._catalog, b"<< /Type /Catalog /Pages %d 0 R >>" % self._pages)
+        self._writer.close(self._catalog)
@@ -0,0 +1,351 @@
+"""
+证书模板注册表
+扫描模板目录中的 图片+布局文件 组合（例如 ngo_a.png + ngo_a.json），启动时预加载并校验，
+请求按模板ID直接查表；按时间间隔轮询文件修改时间，模板或布局变化后自动重新加载
+"""
+import copy
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import config
+from certificate.templates import file_signature, get_template
+
+try:
+    import yaml
+except ImportError:  # YAML布局是可选的，未安装 PyYAML 时只支持JSON
+    yaml = None
+
+# 支持的模板图片和布局文件扩展名
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+LAYOUT_EXTENSIONS = (".json", ".yaml", ".yml")
+
+# 布局中可以出现的字段
+TEXT_FIELDS = ("student_name", "student_name_text", "ngo_name", "contents", "date")
+LAYOUT_FIELDS = TEXT_FIELDS + ("ngo_signature",)
+# 内置默认模板的ID（config.DEFAULT_TEMPLATE + config.CERTIFICATE_CONFIG）
+DEFAULT_TEMPLATE_ID = "default"
+
+
+class TemplateError(ValueError):
+    """模板或布局文件无效"""
+
+
+class TemplateSpec(NamedTuple):
+    """已加载并校验的模板"""
+    template_id: str
+    image_path: str
+    image_signature: Tuple[int, int]
+    layout_path: Optional[str]
+    layout_signature: Optional[Tuple[int, int]]
+    layout: Dict[str, Dict[str, Any]]
+    size: Tuple[int, int]
+
+    def identity(self) -> Tuple[Any, ...]:
+        """模板版本标识，图片或布局文件变化时随之变化（用于结果缓存的键）"""
+        return (self.template_id, self.image_path, self.image_signature, self.layout_path, self.layout_signature)
+
+
+def _read_layout(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            return json.load(f)
+        if yaml is None:
+            raise TemplateError(f"读取YAML布局需要安装 PyYAML: {path}")
+        return yaml.safe_load(f) or {}
+
+
+def _as_pair(value: Any, name: str) -> Tuple[int, int]:
+    if not isinstance(value, (list, tuple)) or len(value) != 2 or not all(isinstance(v, (int, float)) for v in value):
+        raise TemplateError(f"{name} 必须是两个数字")
+    return int(value[0]), int(value[1])
+
+
+def _as_color(value: Any, name: str) -> Tuple[int, int, int]:
+    if isinstance(value, str) and value.startswith("#") and len(value) == 7:
+        return tuple(int(value[i:i + 2], 16) for i in (1, 3, 5))
+    if (not isinstance(value, (list, tuple)) or len(value) != 3
+            or not all(isinstance(v, int) and 0 <= v <= 255 for v in value)):
+        raise TemplateError(f"{name} 必须是 #RRGGBB 或三个0-255的整数")
+    return tuple(value)
+
+
+def _available_width(x: int, width: int, align: str) -> int:
+    """从字段位置按对齐方式到模板边缘能容纳的文本宽度"""
+    if align == "center":
+        available = 2 * min(x, width - x)
+    elif align == "right":
+        available = x
+    else:
+        available = width - x
+    return max(1, available)
+
+
+def validate_layout(raw: Dict[str, Any], size: Tuple[int, int]) -> Dict[str, Dict[str, Any]]:
+    """校验布局并与默认布局合并
+
+    每个字段的设置覆盖 config.CERTIFICATE_CONFIG 中同名字段的设置，
+    字段值为 null 时表示该模板不绘制这个字段。
+    max_width 超出字段位置到模板边缘的可用宽度时缩小到可用宽度，
+    避免较小的模板继承默认布局的宽度后文字超出图片。
+    """
+    if not isinstance(raw, dict):
+        raise TemplateError("布局文件必须是一个对象")
+    unknown = sorted(set(raw) - set(LAYOUT_FIELDS))
+    if unknown:
+        raise TemplateError(f"未知的布局字段: {', '.join(unknown)}")
+
+    layout = copy.deepcopy(config.CERTIFICATE_CONFIG)
+    width, height = size
+    for name in LAYOUT_FIELDS:
+        if name not in raw:
+            continue
+        if raw[name] is None:
+            layout.pop(name, None)
+            continue
+        if not isinstance(raw[name], dict):
+            raise TemplateError(f"{name} 必须是一个对象")
+        field = dict(layout.get(name, {}))
+        field.update(raw[name])
+        layout[name] = field
+
+    required = ("student_name", "ngo_name", "contents", "date", "ngo_signature")
+    missing = [name for name in required if name not in layout]
+    if missing:
+        raise TemplateError(f"布局缺少必需字段: {', '.join(missing)}")
+
+    for name, field in layout.items():
+        if "position" not in field:
+            raise TemplateError(f"{name}.position 未设置")
+        x, y = field["position"] = _as_pair(field["position"], f"{name}.position")
+        if not (0 <= x <= width and 0 <= y <= height):
+            hint = "" if name in raw else "（继承自默认布局，请在布局中设置该字段或设为 null）"
+            raise TemplateError(f"{name}.position ({x}, {y}) 超出模板范围 {width}x{height}{hint}")
+        if "color" in field:
+            field["color"] = _as_color(field["color"], f"{name}.color")
+        if "font_size" in field and (not isinstance(field["font_size"], int) or field["font_size"] <= 0):
+            raise TemplateError(f"{name}.font_size 必须是正整数")
+        if field.get("min_font_size") is not None and (
+                not isinstance(field["min_font_size"], int) or field["min_font_size"] <= 0):
+            raise TemplateError(f"{name}.min_font_size 必须是正整数")
+        if field.get("align", "left") not in ("left", "center", "right"):
+            raise TemplateError(f"{name}.align 只能是 left、center 或 right")
+        if field.get("max_width") is not None and (not isinstance(field["max_width"], int) or field["max_width"] <= 0):
+            raise TemplateError(f"{name}.max_width 必须是正整数")
+        if field.get("max_width"):
+            field["max_width"] = min(field["max_width"], _available_width(x, width, field.get("align", "left")))
+        if "max_size" in field:
+            field["max_size"] = _as_pair(field["max_size"], f"{name}.max_size")
+    return layout
+
+
+def scale_layout(layout: Dict[str, Dict[str, Any]], scale: float) -> Dict[str, Dict[str, Any]]:
+    """按比例缩放布局中的坐标、字号、宽度和签名尺寸，用于直接渲染较小的输出"""
+    if scale == 1.0:
+        return layout
+
+    def _scale(value: float) -> int:
+        return max(1, round(value * scale))
+
+    scaled = {}
+    for name, field in layout.items():
+        field = dict(field)
+        field["position"] = (round(field["position"][0] * scale), round(field["position"][1] * scale))
+        for key in ("font_size", "min_font_size", "max_width"):
+            if field.get(key):
+                field[key] = _scale(field[key])
+        if field.get("line_spacing"):
+            field["line_spacing"] = round(field["line_spacing"] * scale)
+        if "max_size" in field:
+            field["max_size"] = (_scale(field["max_size"][0]), _scale(field["max_size"][1]))
+        scaled[name] = field
+    return scaled
+
+
+def load_template_spec(
+    template_id: str,
+    image_path: str,
+    layout_path: Optional[str]
+) -> TemplateSpec:
+    """解码模板图片（进入模板缓存）并校验布局"""
+    image_signature = file_signature(image_path)
+    try:
+        size = get_template(image_path, image_signature).size
+    except OSError as e:
+        raise TemplateError(f"无法读取模板图片 {image_path}: {e}") from e
+
+    if layout_path is None:
+        layout = validate_layout({}, size)
+        layout_signature = None
+    else:
+        layout_signature = file_signature(layout_path)
+        try:
+            raw = _read_layout(layout_path)
+        except (OSError, ValueError) as e:
+            raise TemplateError(f"无法读取布局文件 {layout_path}: {e}") from e
+        layout = validate_layout(raw, size)
+
+    return TemplateSpec(template_id, image_path, image_signature, layout_path, layout_signature, layout, size)
+
+
+def _scan_pairs(template_dir: str) -> Dict[str, Tuple[str, str]]:
+    """扫描模板目录，返回 模板ID -> (图片路径, 布局路径)，只收录同时有图片和布局的模板"""
+    if not os.path.isdir(template_dir):
+        return {}
+    images: Dict[str, str] = {}
+    layouts: Dict[str, str] = {}
+    for filename in sorted(os.listdir(template_dir)):
+        stem, ext = os.path.splitext(filename)
+        ext = ext.lower()
+        path = os.path.join(template_dir, filename)
+        if ext in IMAGE_EXTENSIONS:
+            images.setdefault(stem, path)
+        elif ext in LAYOUT_EXTENSIONS:
+            layouts.setdefault(stem, path)
+    return {stem: (images[stem], layouts[stem]) for stem in images if stem in layouts}
+
+
+class TemplateRegistry:
+    """模板ID -> 已加载模板 的注册表
+
+    查询只读取当前的快照（一次字典查找），不检查文件；start() 启动后台线程，
+    每 poll_interval 秒检查一次文件修改时间并重新加载，请求处理不会因为重新加载而阻塞。
+    未调用 refresh() 或 start() 时，第一次查询会同步加载一次。
+    """
+
+    def __init__(self, template_dir: str, poll_interval: float = 5.0):
+        self.template_dir = template_dir
+        self.poll_interval = poll_interval
+        self._templates: Dict[str, TemplateSpec] = {}
+        self._errors: Dict[str, str] = {}
+        self._checked_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._poller: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls) -> "TemplateRegistry":
+        """根据 config.TEMPLATE_SETTINGS 创建注册表"""
+        return cls(config.TEMPLATE_DIR, config.TEMPLATE_SETTINGS["poll_interval"])
+
+    def _sources(self) -> Dict[str, Tuple[str, Optional[str]]]:
+        sources: Dict[str, Tuple[str, Optional[str]]] = dict(_scan_pairs(self.template_dir))
+        sources.setdefault(DEFAULT_TEMPLATE_ID, (config.DEFAULT_TEMPLATE, None))
+        return sources
+
+    def _is_current(self, spec: TemplateSpec, image_path: str, layout_path: Optional[str]) -> bool:
+        try:
+            return (
+                spec.image_path == image_path
+                and spec.layout_path == layout_path
+                and file_signature(image_path) == spec.image_signature
+                and (layout_path is None or file_signature(layout_path) == spec.layout_signature)
+            )
+        except OSError:
+            return False
+
+    def refresh(self, blocking: bool = True) -> List[str]:
+        """检查模板目录，加载新增或修改过的模板，移除已删除的模板
+
+        Args:
+            blocking: 其他线程正在检查时是否等待；不等待时直接返回空列表
+
+        Returns:
+            List[str]: 本次重新加载的模板ID
+        """
+        if not self._refresh_lock.acquire(blocking=blocking):
+            return []
+        try:
+            reloaded = []
+            templates: Dict[str, TemplateSpec] = {}
+            errors: Dict[str, str] = {}
+            for template_id, (image_path, layout_path) in self._sources().items():
+                current = self._templates.get(template_id)
+                if current is not None and self._is_current(current, image_path, layout_path):
+                    templates[template_id] = current
+                    continue
+                try:
+                    templates[template_id] = load_template_spec(template_id, image_path, layout_path)
+                    reloaded.append(template_id)
+                except (TemplateError, OSError) as e:
+                    errors[template_id] = str(e)
+                    print(f"警告：模板 {template_id} 加载失败: {e}", file=sys.stderr)
+                    if current is not None:
+                        # 修改后的文件无效时继续使用上一个有效版本
+                        templates[template_id] = current
+            # 整体替换，读取方总是看到一致的快照
+            self._templates = templates
+            self._errors = errors
+            self._checked_at = time.monotonic()
+            return reloaded
+        finally:
+            self._refresh_lock.release()
+
+    def start(self) -> None:
+        """启动后台检查线程；poll_interval 不大于0时不检查文件变化"""
+        if self._poller is not None or self.poll_interval <= 0:
+            return
+        self._stop.clear()
+        self._poller = threading.Thread(target=self._poll, name="template-registry", daemon=True)
+        self._poller.start()
+
+    def stop(self) -> None:
+        """停止后台检查线程"""
+        if self._poller is None:
+            return
+        self._stop.set()
+        self._poller.join()
+        self._poller = None
+
+    def _poll(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh(blocking=False)
+            except Exception as e:
+                print(f"警告：检查模板目录失败: {e}", file=sys.stderr)
+
+    def _ensure_loaded(self) -> None:
+        if self._checked_at == 0.0:
+            # 还没有加载过（未预热、未启动后台检查），同步加载一次
+            self.refresh()
+
+    def get(self, template_id: Optional[str] = None) -> Optional[TemplateSpec]:
+        """按ID返回模板，不存在时返回None；不传ID时返回默认模板"""
+        self._ensure_loaded()
+        return self._templates.get(template_id or DEFAULT_TEMPLATE_ID)
+
+    def list(self) -> List[TemplateSpec]:
+        self._ensure_loaded()
+        templates = self._templates
+        return [templates[key] for key in sorted(templates)]
+
+    @property
+    def errors(self) -> Dict[str, str]:
+        """上次检查时加载失败的模板及原因"""
+        return dict(self._errors)
+
+
+# 进程内共享的模板注册表
+_registry: Optional[TemplateRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> TemplateRegistry:
+    """返回进程内共享的模板注册表"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = TemplateRegistry.from_config()
+    return _registry
+
+
+def get_template_spec(template_id: Optional[str] = None) -> TemplateSpec:
+    """按ID返回模板，不存在时抛出 TemplateError"""
+    spec = get_registry().get(template_id)
+    if spec is None:
+        raise TemplateError(f"模板不存在: {template_id or DEFAULT_TEMPLATE_ID}")
+    return spec
@@ -0,0 +1,243 @@
+"""
+证书结果缓存
+以规范化请求、模板标识和字体标识的哈希作为键，缓存生成好的证书内容。
+内存层和磁盘层都按LRU淘汰；同时到达的相同请求只渲染一次，其余请求等待同一结果
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import config
+from certificate.cache import LRUCache
+from certificate.fonts import font_identity
+from certificate.metrics import REGISTRY, CallbackMetric
+from certificate.registry import TemplateSpec
+
+
+def _normalize(value: Any) -> Any:
+    """规范化请求字段：Unicode统一为NFC形式"""
+    if isinstance(value, str):
+        return unicodedata.normalize("NFC", value)
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def _layout_identity(layout: Dict[str, Any]) -> str:
+    """证书布局配置的摘要"""
+    return hashlib.sha256(repr(sorted(layout.items())).encode("utf-8")).hexdigest()
+
+
+def cache_key(request: Dict[str, Any], template: TemplateSpec) -> str:
+    """计算证书请求的缓存键
+
+    Args:
+        request: 请求字段（例如 CertificateRequest.model_dump()）
+        template: 使用的模板（模板注册表中的版本）
+    """
+    identity = {
+        "request": _normalize(request),
+        "template": template.identity(),
+        "font": font_identity(),
+        "layout": _layout_identity(template.layout),
+    }
+    payload = json.dumps(identity, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskTier:
+    """磁盘缓存层，按最近使用时间淘汰，总大小不超过上限
+
+    文件的修改时间记录最近使用时间，重启后据此恢复LRU顺序。
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".bin")
+
+    def _load_index(self) -> None:
+        """扫描目录，按修改时间恢复LRU顺序"""
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                if not filename.endswith(".bin"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, filename))
+                except OSError:
+                    continue
+                found.append((stat.st_mtime_ns, filename[:-4], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total += size
+        self._evict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            with self._lock:
+                self._discard(key)
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再改名，读取方不会看到写了一半的文件
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = len(data)
+            self._total += len(data)
+            self._evict()
+
+    def _discard(self, key: str) -> None:
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total -= size
+
+    def _evict(self) -> None:
+        while self._entries and self._total > self.max_bytes:
+            key, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+
+class ResultCache:
+    """两级证书结果缓存，并合并并发的相同请求"""
+
+    def __init__(self, memory_bytes: int, disk_dir: Optional[str] = None, disk_bytes: int = 0):
+        self._memory = LRUCache(max_entries=1 << 20, max_weight=memory_bytes, weigh=len)
+        self._disk = DiskTier(disk_dir, disk_bytes) if disk_dir and disk_bytes > 0 else None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @classmethod
+    def from_config(cls) -> "ResultCache":
+        """根据 config.RESULT_CACHE_SETTINGS 创建缓存
+
+        启用已签发证书时不使用磁盘层：签发的证书已经保存在存储中，并且在结果缓存之前查找，
+        磁盘层只会把每张证书再写一次而不会被读取。
+        """
+        settings = config.RESULT_CACHE_SETTINGS
+        disk_dir = None if config.ISSUED_SETTINGS["enabled"] else settings["disk_dir"]
+        return cls(settings["memory_bytes"], disk_dir, settings["disk_bytes"])
+
+    async def _load_or_render(self, key: str, render: Callable[[], Awaitable[bytes]]) -> bytes:
+        """读取磁盘层，未命中时渲染并写入两级缓存"""
+        try:
+            loop = asyncio.get_running_loop()
+            if self._disk is not None:
+                data = await loop.run_in_executor(None, self._disk.get, key)
+                if data is not None:
+                    self.disk_hits += 1
+                    self._memory.put(key, data)
+                    return data
+            self.misses += 1
+            data = await render()
+            self._memory.put(key, data)
+            if self._disk is not None:
+                await loop.run_in_executor(None, self._disk.put, key, data)
+            return data
+        finally:
+            self._inflight.pop(key, None)
+
+    async def get_or_render(self, key: str, render: Callable[[], Awaitable[bytes]]) -> bytes:
+        """返回缓存的结果；未命中时调用 render 生成
+
+        内存层未命中时，同一个键同时只有一个任务在读取磁盘层或渲染，其他请求等待它的结果（失败时一起收到异常）；
+        任务在检查内存层之后、任何等待之前登记，并发的相同请求不会各自渲染。
+        渲染在独立任务中执行，发起请求的客户端断开也不会影响等待中的请求。
+        """
+        data = self._memory.get(key)
+        if data is not None:
+            self.memory_hits += 1
+            return data
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._load_or_render(key, render))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        """命中/未命中计数和各层占用"""
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory.total_weight,
+            "disk_entries": len(self._disk) if self._disk is not None else 0,
+            "disk_bytes": self._disk.total_bytes if self._disk is not None else 0,
+        }
+
+
+# 进程内共享的结果缓存
+_result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """返回进程内共享的结果缓存，未启用时返回None"""
+    global _result_cache
+    if _result_cache is None and config.RESULT_CACHE_SETTINGS["enabled"]:
+        _result_cache = ResultCache.from_config()
+    return _result_cache
+
+
+def _collect_cache_results() -> Dict[Tuple[str], float]:
+    if _result_cache is None:
+        return {}
+    return {
+        ("memory_hit",): _result_cache.memory_hits,
+        ("disk_hit",): _result_cache.disk_hits,
+        ("miss",): _result_cache.misses,
+        ("coalesced",): _result_cache.coalesced,
+    }
+
+
+REGISTRY.register(CallbackMetric(
+    "certificate_result_cache_total", "证书结果缓存的命中/未命中次数", "counter", _collect_cache_results, ("result",)
+))
@@ -0,0 +1,395 @@
+"""
+签名图片获取
+签名可以是图片URL、内联的 data URL（data:image/png;base64,...）或预先注册的签名ID（signature:<id>）。
+URL使用连接池复用HTTP连接，下载有超时和大小限制；
+解码并缩放后的签名按 (来源, 最大尺寸) 缓存，URL过期后用 ETag/Last-Modified 重新验证，
+内联和已注册的签名按内容寻址，不需要重新验证
+"""
+import base64
+import binascii
+import hashlib
+import math
+import re
+import threading
+import time
+from io import BytesIO
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+import config
+from certificate.cache import LRUCache
+from certificate.metrics import REGISTRY, CallbackMetric, timed
+from certificate.storage import LocalStorage, StorageJanitor
+
+
+class SignatureError(ValueError):
+    """签名图片无法获取或解码"""
+
+
+# 已注册签名的引用前缀，例如 signature:0123abcd...
+SIGNATURE_PREFIX = "signature:"
+DATA_URL_PREFIX = "data:"
+_SIGNATURE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class _SignatureEntry(NamedTuple):
+    image: Image.Image
+    etag: Optional[str]
+    last_modified: Optional[str]
+    checked_at: float
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_signature_cache = LRUCache(config.SIGNATURE_SETTINGS["cache_size"])
+
+REGISTRY.register(CallbackMetric(
+    "certificate_signature_cache_total", "签名图片缓存的命中/未命中次数", "counter",
+    lambda: {("hit",): _signature_cache.hits, ("miss",): _signature_cache.misses},
+    ("result",)
+))
+
+
+def get_session() -> requests.Session:
+    """返回进程内共享、带连接池的HTTP会话"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool_size = config.SIGNATURE_SETTINGS["pool_size"]
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def _timeout() -> Tuple[float, float]:
+    settings = config.SIGNATURE_SETTINGS
+    return settings["connect_timeout"], settings["read_timeout"]
+
+
+def _read_limited(response: requests.Response, max_bytes: int) -> bytes:
+    """流式读取响应内容，超过大小限制时立即中止"""
+    content_length = response.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise SignatureError(f"签名图片过大: {content_length} 字节，上限 {max_bytes} 字节")
+
+    chunks = []
+    received = 0
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        received += len(chunk)
+        if received > max_bytes:
+            raise SignatureError(f"签名图片超过大小上限 {max_bytes} 字节")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def fetch_image_bytes(url: str, headers: Optional[dict] = None) -> Tuple[Optional[bytes], requests.Response]:
+    """下载图片内容，服务器返回304时内容为None"""
+    max_bytes = config.API_SETTINGS["max_upload_size"]
+    try:
+        with get_session().get(url, headers=headers, stream=True, timeout=_timeout()) as response:
+            if response.status_code == 304:
+                return None, response
+            if response.status_code != 200:
+                raise SignatureError(f"无法下载图片，HTTP状态码: {response.status_code}")
+            return _read_limited(response, max_bytes), response
+    except requests.RequestException as e:
+        raise SignatureError(f"无法下载图片: {e}") from e
+
+
+def _check_pixels(image: Image.Image) -> None:
+    """只根据文件头中的尺寸检查像素数，超过上限时不解码"""
+    max_pixels = config.SIGNATURE_SETTINGS["max_pixels"]
+    width, height = image.size
+    if width * height > max_pixels:
+        raise SignatureError(f"签名图片尺寸过大: {width}x{height}，上限 {max_pixels} 像素")
+
+
+def decode_image(data: bytes) -> Image.Image:
+    """解码图片数据（原始尺寸），像素数超过 max_pixels 时抛出 SignatureError"""
+    try:
+        image = Image.open(BytesIO(data))
+        _check_pixels(image)
+        image.load()
+        return image
+    except SignatureError:
+        raise
+    except Exception as e:
+        raise SignatureError(f"无法解码签名图片: {e}") from e
+
+
+def fit_size(size: Tuple[int, int], max_size: Tuple[int, int]) -> Tuple[int, int]:
+    """按最大尺寸等比缩小后的尺寸，不放大"""
+    max_width, max_height = max_size
+    width, height = size
+
+    # 保持宽高比
+    if width > max_width:
+        ratio = max_width / width
+        width = max_width
+        height = int(height * ratio)
+
+    if height > max_height:
+        ratio = max_height / height
+        height = max_height
+        width = int(width * ratio)
+
+    return max(1, width), max(1, height)
+
+
+def normalize_mode(image: Image.Image) -> Image.Image:
+    """统一为 RGB 或 RGBA；带透明度的图片转为 RGBA，透明通道全部不透明时去掉透明通道"""
+    if image.mode in ("RGBA", "LA", "PA", "RGBa", "La") or "transparency" in image.info:
+        image = image.convert("RGBA")
+        if image.getchannel("A").getextrema() == (255, 255):
+            return image.convert("RGB")
+        return image
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
+
+
+def resize_signature(signature_img: Image.Image, max_size: Tuple[int, int]) -> Image.Image:
+    """按最大尺寸等比缩放签名，结果为 RGB 或 RGBA
+
+    先用整数倍缩小（reduce）把图片缩到目标尺寸的 reducing_gap 倍以内，
+    再做最终的 LANCZOS 重采样，重采样的开销与原图大小无关。
+    """
+    size = fit_size(signature_img.size, max_size)
+    if signature_img.mode not in ("RGB", "RGBA", "L", "LA"):
+        # reduce 不支持调色板等模式，先转换
+        signature_img = normalize_mode(signature_img)
+    if size != signature_img.size:
+        signature_img = signature_img.resize(
+            size, Image.LANCZOS, reducing_gap=config.SIGNATURE_SETTINGS["reducing_gap"]
+        )
+    return normalize_mode(signature_img)
+
+
+def load_signature(data: bytes, max_size: Tuple[int, int]) -> Image.Image:
+    """解码并缩放签名图片，开销只取决于输出尺寸而不是上传图片的大小
+
+    JPEG 使用 draft 模式在解码时直接按 1/2、1/4、1/8 缩小（不小于目标尺寸的 reducing_gap 倍），
+    其他格式解码后先整数倍缩小再重采样；像素数超过 max_pixels 的图片在解码前拒绝。
+    """
+    try:
+        image = Image.open(BytesIO(data))
+        _check_pixels(image)
+        if image.format == "JPEG":
+            gap = config.SIGNATURE_SETTINGS["reducing_gap"]
+            width, height = fit_size(image.size, max_size)
+            image.draft(None, (int(width * gap), int(height * gap)))
+        image.load()
+    except SignatureError:
+        raise
+    except Exception as e:
+        raise SignatureError(f"无法解码签名图片: {e}") from e
+    return resize_signature(image, max_size)
+
+
+def is_image_signature(ngo_signature: Optional[str]) -> bool:
+    """签名是否为图片（URL、data URL 或已注册的签名ID），否则视为文本签名"""
+    return bool(ngo_signature) and ngo_signature.startswith(
+        ("http://", "https://", DATA_URL_PREFIX, SIGNATURE_PREFIX)
+    )
+
+
+def decode_data_url(value: str) -> bytes:
+    """解析 base64 编码的 data URL（也接受不带 data: 前缀的纯 base64），超过上传大小上限时抛出 SignatureError"""
+    if value.startswith(DATA_URL_PREFIX):
+        header, _, payload = value.partition(",")
+        if not header.endswith(";base64"):
+            raise SignatureError("签名 data URL 必须是 base64 编码")
+    else:
+        payload = value
+    payload = "".join(payload.split())
+    max_bytes = config.API_SETTINGS["max_upload_size"]
+    if len(payload) * 3 // 4 > max_bytes:
+        raise SignatureError(f"签名图片超过大小上限 {max_bytes} 字节")
+    try:
+        return base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise SignatureError(f"签名图片不是有效的 base64: {e}") from e
+
+
+def check_signature_reference(ngo_signature: Optional[str]) -> None:
+    """请求校验时快速检查内联签名：已注册的签名ID必须存在，data URL 必须是 base64 且不超过大小上限
+
+    只检查格式和大小，不解码图片；无效时抛出 SignatureError。
+    """
+    if not ngo_signature:
+        return
+    if ngo_signature.startswith(SIGNATURE_PREFIX):
+        if not get_signature_store().exists(ngo_signature[len(SIGNATURE_PREFIX):]):
+            raise SignatureError(f"签名不存在: {ngo_signature[len(SIGNATURE_PREFIX):]}")
+    elif ngo_signature.startswith(DATA_URL_PREFIX):
+        header, _, payload = ngo_signature.partition(",")
+        if not header.endswith(";base64"):
+            raise SignatureError("签名 data URL 必须是 base64 编码")
+        max_bytes = config.API_SETTINGS["max_upload_size"]
+        if len(payload) * 3 // 4 > max_bytes:
+            raise SignatureError(f"签名图片超过大小上限 {max_bytes} 字节")
+
+
+def signature_id(data: bytes) -> str:
+    """签名图片内容的ID（sha256前32位），相同的图片得到相同的ID"""
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+class SignatureStore:
+    """已注册签名的原始图片，保存在本地目录中，多个进程共享
+
+    ID由内容得到，同一张图片重复注册不会产生新文件，但会刷新写入时间；
+    文件由 LocalStorage 原子写入，过期和超过总大小上限的签名由 get_signature_janitor() 删除。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.storage = LocalStorage(directory)
+
+    @classmethod
+    def from_config(cls) -> "SignatureStore":
+        """根据 config.SIGNATURE_SETTINGS 创建存储"""
+        return cls(config.SIGNATURE_SETTINGS["store_dir"])
+
+    def exists(self, sig_id: str) -> bool:
+        return bool(_SIGNATURE_ID_PATTERN.match(sig_id)) and self.storage.exists(sig_id)
+
+    def get(self, sig_id: str) -> bytes:
+        """读取已注册签名的原始图片，不存在（或已被清理）时抛出 SignatureError"""
+        if not _SIGNATURE_ID_PATTERN.match(sig_id):
+            raise SignatureError(f"无效的签名ID: {sig_id}")
+        data = self.storage.get(sig_id)
+        if data is None:
+            raise SignatureError(f"签名不存在: {sig_id}")
+        return data
+
+    def put(self, data: bytes) -> str:
+        """保存签名图片，返回ID；已存在时覆盖为相同的内容，重新开始计算保存时间"""
+        sig_id = signature_id(data)
+        self.storage.put(sig_id, data)
+        return sig_id
+
+
+_store: Optional[SignatureStore] = None
+_janitor: Optional[StorageJanitor] = None
+_store_lock = threading.Lock()
+
+
+def get_signature_store() -> SignatureStore:
+    """返回进程内共享的签名存储"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SignatureStore.from_config()
+    return _store
+
+
+def get_signature_janitor() -> StorageJanitor:
+    """返回签名存储的后台清理器（按 SIGNATURE_SETTINGS 的 store_ttl 和 store_max_bytes）"""
+    global _janitor
+    if _janitor is None:
+        settings = config.SIGNATURE_SETTINGS
+        _janitor = StorageJanitor(get_signature_store().storage, settings["store_ttl"],
+                                  settings["store_max_bytes"], settings["store_sweep_interval"])
+    return _janitor
+
+
+def register_signature(data: bytes, sizes: Iterable[Tuple[int, int]] = ()) -> Tuple[str, Tuple[int, int]]:
+    """校验并注册签名图片，返回 (签名ID, 原始尺寸)
+
+    图片无法解码或像素数超过上限时抛出 SignatureError；
+    同时按 sizes 中的各个最大尺寸预先缩放，放入签名缓存。
+    """
+    max_bytes = config.API_SETTINGS["max_upload_size"]
+    if len(data) > max_bytes:
+        raise SignatureError(f"签名图片超过大小上限 {max_bytes} 字节")
+    try:
+        with Image.open(BytesIO(data)) as image:
+            size = image.size
+    except Exception as e:
+        raise SignatureError(f"无法解码签名图片: {e}") from e
+    sizes = list(sizes)
+    # 先解码缩放，确认图片有效后再保存
+    images = [load_signature(data, max_size) for max_size in sizes] or [load_signature(data, (64, 64))]
+    sig_id = get_signature_store().put(data)
+    for max_size, image in zip(sizes, images):
+        _signature_cache.put(((SIGNATURE_PREFIX, sig_id), tuple(max_size)), _SignatureEntry(image, None, None, math.inf))
+    return sig_id, size
+
+
+def _get_inline_image(source: str, max_size: Tuple[int, int]) -> Image.Image:
+    """返回 data URL 或已注册签名缩放后的图片，按内容寻址缓存，不需要重新验证"""
+    if source.startswith(SIGNATURE_PREFIX):
+        sig_id = source[len(SIGNATURE_PREFIX):]
+        key = ((SIGNATURE_PREFIX, sig_id), tuple(max_size))
+    else:
+        key = ((DATA_URL_PREFIX, hashlib.sha256(source.encode("utf-8")).hexdigest()), tuple(max_size))
+    entry: Optional[_SignatureEntry] = _signature_cache.get(key)
+    if entry is not None:
+        return entry.image
+
+    if source.startswith(SIGNATURE_PREFIX):
+        data = get_signature_store().get(sig_id)
+    else:
+        data = decode_data_url(source)
+    with timed("signature_resize"):
+        image = load_signature(data, max_size)
+    # checked_at 为无穷大：内容不会变化，条目一直有效
+    _signature_cache.put(key, _SignatureEntry(image, None, None, math.inf))
+    return image
+
+
+def get_signature_image(url: str, max_size: Tuple[int, int]) -> Image.Image:
+    """返回已缩放的签名图片（只读，多个请求共享同一对象）
+
+    url 也可以是 data URL 或 signature:<id>，不发起网络请求。
+    URL的缓存条目在 revalidate_after 秒内直接使用；过期后带上 ETag/Last-Modified
+    发送条件请求，服务器返回304时继续使用缓存的图片。
+    """
+    if url.startswith((DATA_URL_PREFIX, SIGNATURE_PREFIX)):
+        return _get_inline_image(url, max_size)
+
+    key = (url, tuple(max_size))
+    entry: Optional[_SignatureEntry] = _signature_cache.get(key)
+    now = time.monotonic()
+    if entry is not None and now - entry.checked_at < config.SIGNATURE_SETTINGS["revalidate_after"]:
+        return entry.image
+
+    headers = {}
+    if entry is not None:
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+
+    with timed("signature_download"):
+        data, response = fetch_image_bytes(url, headers=headers)
+    if data is None and entry is not None:
+        _signature_cache.put(key, entry._replace(checked_at=now))
+        return entry.image
+    if data is None:
+        # 没有发送条件请求却收到304，按错误处理
+        raise SignatureError("无法下载图片，HTTP状态码: 304")
+
+    with timed("signature_resize"):
+        image = load_signature(data, max_size)
+    _signature_cache.put(key, _SignatureEntry(
+        image,
+        response.headers.get("ETag"),
+        response.headers.get("Last-Modified"),
+        now
+    ))
+    return image
+
+
+def clear_signature_cache() -> None:
+    """清空签名缓存"""
+    _signature_cache.clear()
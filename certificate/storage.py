@@ -0,0 +1,492 @@
+"""
+渲染结果存储
+已签发的证书和未指定输出位置时生成的证书都保存在这里。存储后端实现 Storage 接口：
+- LocalStorage：本地目录，按键的哈希分两级子目录，单个目录中的文件数量有上限；
+  先写临时文件再改名，读取方不会看到写了一半的文件
+- ObjectStorage：对象存储（S3兼容客户端），MemoryObjectClient 是用于开发和测试的进程内替身
+StorageJanitor 在后台定期删除超过保存时间的对象，并在总大小超过上限时从最旧的开始删除
+"""
+import asyncio
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote, unquote
+
+import config
+from certificate.metrics import REGISTRY, CallbackMetric
+
+try:
+    import boto3
+except ImportError:  # 对象存储是可选的，未安装 boto3 时只能使用本地存储
+    boto3 = None
+
+# 键由 / 分隔的若干段组成，每段只能包含字母、数字和 . _ -
+_KEY_PATTERN = re.compile(r"^[A-Za-z0-9._-]+(/[A-Za-z0-9._-]+)*$")
+# 写入中的临时文件后缀
+_TEMP_SUFFIX = ".tmp"
+
+
+class StorageError(Exception):
+    """存储后端不可用或配置无效"""
+
+
+class StoredObject(NamedTuple):
+    """存储中的一个对象"""
+    key: str
+    size: int
+    modified: float  # 写入时间（Unix时间戳）
+
+
+def check_key(key: str) -> str:
+    if not _KEY_PATTERN.match(key) or ".." in key.split("/"):
+        raise ValueError(f"无效的存储键: {key}")
+    return key
+
+
+class Storage:
+    """存储后端接口
+
+    put 是原子的：读取方要么看到完整的旧内容（或不存在），要么看到完整的新内容。
+    """
+
+    def put(self, key: str, data: bytes, overwrite: bool = True) -> bool:
+        """写入对象；overwrite 为 False 且对象已存在时不写入并返回 False"""
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[bytes]:
+        """读取对象内容，不存在时返回None"""
+        raise NotImplementedError
+
+    def get_range(self, key: str, start: int, end: int) -> Optional[bytes]:
+        """读取对象中 [start, end] 范围的内容（含结束位置），不存在时返回None"""
+        data = self.get(key)
+        return None if data is None else data[start:end + 1]
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        """返回对象的大小和写入时间，不存在时返回None"""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        """对象是否存在"""
+        return self.stat(key) is not None
+
+    def delete(self, key: str) -> None:
+        """删除对象，不存在时忽略"""
+        raise NotImplementedError
+
+    def iter_objects(self) -> Iterator[StoredObject]:
+        """遍历所有对象（供清理使用，顺序不确定）"""
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[str]:
+        """对象对应的本地文件路径（可以直接按块发送文件）；不是本地存储时返回None"""
+        return None
+
+    def discard_incomplete(self, older_than: float) -> int:
+        """删除早于 older_than 的未完成写入（进程中断留下的临时文件），返回删除的数量"""
+        return 0
+
+
+class LocalStorage(Storage):
+    """本地目录存储
+
+    文件路径为 根目录/哈希前2位/哈希3-4位/转义后的键，键在目录中分散，
+    列目录和查找不会因为单个目录中的文件过多而变慢。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha1(check_key(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4], quote(key, safe=""))
+
+    def put(self, key: str, data: bytes, overwrite: bool = True) -> bool:
+        path = self._path(key)
+        if not overwrite and os.path.isfile(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}{_TEMP_SUFFIX}"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        if overwrite:
+            os.replace(temp_path, path)
+            return True
+        # 硬链接在目标已存在时失败，多个进程同时写入同一个键时只有第一个生效
+        try:
+            os.link(temp_path, path)
+            return True
+        except FileExistsError:
+            return False
+        except OSError:
+            # 文件系统不支持硬链接时以独占方式创建目标文件
+            return self._create_exclusive(path, data)
+        finally:
+            os.remove(temp_path)
+
+    @staticmethod
+    def _create_exclusive(path: str, data: bytes) -> bool:
+        try:
+            f = open(path, "xb")
+        except FileExistsError:
+            return False
+        try:
+            with f:
+                f.write(data)
+        except BaseException:
+            os.remove(path)
+            raise
+        return True
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def get_range(self, key: str, start: int, end: int) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                f.seek(start)
+                return f.read(end - start + 1)
+        except FileNotFoundError:
+            return None
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            result = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        return StoredObject(key, result.st_size, result.st_mtime)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def iter_objects(self) -> Iterator[StoredObject]:
+        for directory, _, files in os.walk(self.root):
+            for filename in files:
+                if filename.endswith(_TEMP_SUFFIX):
+                    continue
+                try:
+                    result = os.stat(os.path.join(directory, filename))
+                except FileNotFoundError:
+                    continue
+                yield StoredObject(unquote(filename), result.st_size, result.st_mtime)
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self._path(key)
+
+    def discard_incomplete(self, older_than: float) -> int:
+        removed = 0
+        for directory, _, files in os.walk(self.root):
+            for filename in files:
+                if not filename.endswith(_TEMP_SUFFIX):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    if os.stat(path).st_mtime < older_than:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+        return removed
+
+
+class ObjectStorage(Storage):
+    """对象存储后端
+
+    client 需要提供 S3 客户端（boto3）的 put_object / get_object / head_object /
+    delete_object / list_objects_v2 这几个方法的子集；对象存储的单次写入本身是原子的。
+    """
+
+    def __init__(self, client: Any, bucket: str, prefix: str = ""):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+
+    def _name(self, key: str) -> str:
+        return self.prefix + check_key(key)
+
+    @staticmethod
+    def _is_missing(error: Exception) -> bool:
+        code = getattr(error, "response", {}).get("Error", {}).get("Code")
+        return isinstance(error, KeyError) or code in ("404", "NoSuchKey", "NotFound")
+
+    @staticmethod
+    def _is_conflict(error: Exception) -> bool:
+        code = getattr(error, "response", {}).get("Error", {}).get("Code")
+        return code in ("PreconditionFailed", "412", "ConditionalRequestConflict")
+
+    def put(self, key: str, data: bytes, overwrite: bool = True) -> bool:
+        params = {} if overwrite else {"IfNoneMatch": "*"}
+        try:
+            self.client.put_object(Bucket=self.bucket, Key=self._name(key), Body=data, **params)
+        except Exception as e:
+            if not overwrite and self._is_conflict(e):
+                return False
+            raise
+        return True
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._name(key))
+        except Exception as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return response["Body"].read()
+
+    def get_range(self, key: str, start: int, end: int) -> Optional[bytes]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._name(key), Range=f"bytes={start}-{end}")
+        except Exception as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return response["Body"].read()
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self._name(key))
+        except Exception as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return StoredObject(key, response["ContentLength"], response["LastModified"].timestamp())
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._name(key))
+
+    def iter_objects(self) -> Iterator[StoredObject]:
+        params = {"Bucket": self.bucket, "Prefix": self.prefix}
+        while True:
+            response = self.client.list_objects_v2(**params)
+            for item in response.get("Contents", []):
+                yield StoredObject(item["Key"][len(self.prefix):], item["Size"], item["LastModified"].timestamp())
+            if not response.get("IsTruncated"):
+                return
+            params["ContinuationToken"] = response["NextContinuationToken"]
+
+
+class _Body:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def read(self) -> bytes:
+        return self._data
+
+
+class _ClientError(Exception):
+    """与 botocore ClientError 相同结构的错误（response["Error"]["Code"]）"""
+
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class MemoryObjectClient:
+    """进程内的对象存储替身，实现 ObjectStorage 用到的 S3 客户端方法，用于开发和测试"""
+
+    def __init__(self):
+        self._objects: Dict[Tuple[str, str], Tuple[bytes, float]] = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, IfNoneMatch: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            if IfNoneMatch == "*" and (Bucket, Key) in self._objects:
+                raise _ClientError("PreconditionFailed")
+            self._objects[(Bucket, Key)] = (bytes(Body), time.time())
+        return {}
+
+    def _lookup(self, Bucket: str, Key: str) -> Tuple[bytes, float]:
+        with self._lock:
+            if (Bucket, Key) not in self._objects:
+                raise _ClientError("NoSuchKey")
+            return self._objects[(Bucket, Key)]
+
+    def get_object(self, Bucket: str, Key: str, Range: Optional[str] = None) -> Dict[str, Any]:
+        data, _ = self._lookup(Bucket, Key)
+        if Range:
+            start, end = Range[len("bytes="):].split("-")
+            data = data[int(start):int(end) + 1]
+        return {"Body": _Body(data)}
+
+    def head_object(self, Bucket: str, Key: str) -> Dict[str, Any]:
+        data, modified = self._lookup(Bucket, Key)
+        return {"ContentLength": len(data), "LastModified": datetime.fromtimestamp(modified, timezone.utc)}
+
+    def delete_object(self, Bucket: str, Key: str) -> Dict[str, Any]:
+        with self._lock:
+            self._objects.pop((Bucket, Key), None)
+        return {}
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = "", ContinuationToken: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            items = sorted((key, data, modified) for (bucket, key), (data, modified) in self._objects.items()
+                           if bucket == Bucket and key.startswith(Prefix))
+        return {
+            "Contents": [
+                {"Key": key, "Size": len(data), "LastModified": datetime.fromtimestamp(modified, timezone.utc)}
+                for key, data, modified in items
+            ],
+            "IsTruncated": False,
+        }
+
+
+def create_storage() -> Storage:
+    """根据 config.STORAGE_SETTINGS 创建存储后端"""
+    settings = config.STORAGE_SETTINGS
+    backend = settings["backend"]
+    if backend == "local":
+        return LocalStorage(settings["dir"])
+    if backend == "memory":
+        return ObjectStorage(MemoryObjectClient(), "certificates", settings["prefix"])
+    if backend == "s3":
+        if boto3 is None:
+            raise StorageError("使用S3存储需要安装 boto3")
+        if not settings["bucket"]:
+            raise StorageError("使用S3存储需要设置 STORAGE_BUCKET")
+        return ObjectStorage(boto3.client("s3"), settings["bucket"], settings["prefix"])
+    raise StorageError(f"不支持的存储后端: {backend}")
+
+
+def object_group(key: str) -> str:
+    """对象所属的组：键最后一段中第一个 . 之前的部分
+
+    例如已签发证书的元数据 issued/<id>.json 和内容 issued/<id>.<摘要>.pdf 属于同一组，清理时一起删除。
+    """
+    directory, _, name = key.rpartition("/")
+    name = name.split(".", 1)[0]
+    return f"{directory}/{name}" if directory else name
+
+
+class StorageJanitor:
+    """后台清理：删除超过 ttl 秒的对象，总大小超过 max_bytes 时从最旧的对象开始删除
+
+    同组的对象（见 object_group）作为一个整体按其中最新的写入时间过期和淘汰，不会只删除其中一个。
+    每 interval 秒在线程池中执行一次 sweep，不阻塞事件循环；多个进程同时清理同一个目录也是安全的。
+    """
+
+    def __init__(self, storage: Storage, ttl: float, max_bytes: int, interval: float = 600.0):
+        self.storage = storage
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.expired = 0
+        self.evicted = 0
+        self.total_bytes = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls, storage: Storage) -> "StorageJanitor":
+        """根据 config.STORAGE_SETTINGS 创建清理器"""
+        settings = config.STORAGE_SETTINGS
+        return cls(storage, settings["ttl"], settings["max_bytes"], settings["janitor_interval"])
+
+    def sweep(self, now: Optional[float] = None) -> Dict[str, int]:
+        """执行一次清理，返回本次删除的对象数量和剩余的总大小"""
+        now = time.time() if now is None else now
+        groups: Dict[str, List[StoredObject]] = {}
+        for item in self.storage.iter_objects():
+            groups.setdefault(object_group(item.key), []).append(item)
+        # 每组按其中最新的写入时间排序
+        ordered = sorted(groups.values(), key=lambda items: max(item.modified for item in items))
+
+        expired = evicted = 0
+        remaining = []
+        for items in ordered:
+            if self.ttl > 0 and max(item.modified for item in items) < now - self.ttl:
+                expired += self._delete_group(items)
+            else:
+                remaining.append(items)
+        # 写入中断留下的临时文件保留一小时
+        self.storage.discard_incomplete(now - 3600)
+
+        total = sum(item.size for items in remaining for item in items)
+        for items in remaining:
+            if self.max_bytes <= 0 or total <= self.max_bytes:
+                break
+            evicted += self._delete_group(items)
+            total -= sum(item.size for item in items)
+        self.expired += expired
+        self.evicted += evicted
+        self.total_bytes = total
+        return {"expired": expired, "evicted": evicted, "total_bytes": total}
+
+    def _delete_group(self, items: List[StoredObject]) -> int:
+        """删除一组对象，最后写入的（例如元数据）先删除，返回删除的数量"""
+        for item in sorted(items, key=lambda item: item.modified, reverse=True):
+            self.storage.delete(item.key)
+        return len(items)
+
+    def start(self) -> None:
+        """启动后台清理循环（需在事件循环中调用）"""
+        if self._task is None and self.interval > 0 and (self.ttl > 0 or self.max_bytes > 0):
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.sweep)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"警告：存储清理失败: {e}", file=sys.stderr)
+            await asyncio.sleep(self.interval)
+
+
+# 进程内共享的存储和清理器
+_storage: Optional[Storage] = None
+_janitor: Optional[StorageJanitor] = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> Storage:
+    """返回进程内共享的渲染结果存储"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage()
+    return _storage
+
+
+def get_storage_janitor() -> StorageJanitor:
+    """返回进程内共享的存储清理器"""
+    global _janitor
+    if _janitor is None:
+        _janitor = StorageJanitor.from_config(get_storage())
+    return _janitor
+
+
+def _collect_janitor_deletions() -> Dict[Tuple[str], float]:
+    if _janitor is None:
+        return {}
+    return {("expired",): _janitor.expired, ("evicted",): _janitor.evicted}
+
+
+REGISTRY.register(CallbackMetric(
+    "certificate_storage_deleted_total", "存储清理删除的对象数量（过期/超出总大小）", "counter",
+    _collect_janitor_deletions, ("reason",)
+))
+REGISTRY.register(CallbackMetric(
+    "certificate_storage_bytes", "上次清理后存储中对象的总大小（字节）", "gauge",
+    lambda: {(): _janitor.total_bytes} if _janitor is not None else {}
+))
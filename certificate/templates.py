@@ -0,0 +1,115 @@
+"""
+证书模板加载与缓存
+模板在进程内只解码一次，之后每次渲染只拿到一份副本；
+缩小输出使用的缩小版模板按尺寸缓存，同样只缩放一次
+"""
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+import config
+from certificate.cache import LRUCache
+from certificate.pdf import encode_jpeg
+
+Size = Tuple[int, int]
+
+# 已解码的模板缓存: 路径 -> ((mtime_ns, 文件大小), RGB图像)
+_template_cache: Dict[str, Tuple[Tuple[int, int], Image.Image]] = {}
+# 模板的JPEG编码缓存（PDF背景）: (路径, 文件签名, 尺寸) -> JPEG数据
+# 尺寸来自请求的 width/dpi，按条目数和总字节数限制，不会随不同的尺寸无限增长
+_jpeg_cache = LRUCache(
+    max_entries=config.OUTPUT_SETTINGS["template_jpeg_cache_size"],
+    max_weight=config.OUTPUT_SETTINGS["template_jpeg_cache_bytes"],
+    weigh=len
+)
+# 缩小版模板缓存: (路径, 文件签名, 尺寸) -> RGB图像
+_scaled_cache = LRUCache(max_entries=config.OUTPUT_SETTINGS["scaled_template_cache_size"])
+_template_lock = threading.Lock()
+
+
+def file_signature(template_path: str) -> Tuple[int, int]:
+    """返回用于判断模板是否被修改的文件签名"""
+    stat = os.stat(template_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def template_identity(template_path: str) -> Tuple[str, int, int]:
+    """返回模板的标识（路径、修改时间、文件大小），模板文件变化时标识随之变化"""
+    return (template_path,) + file_signature(template_path)
+
+
+def get_template(template_path: str, signature: Optional[Tuple[int, int]] = None) -> Image.Image:
+    """返回缓存中已解码的RGB模板（只读，调用方不得修改）
+
+    以路径加修改时间作为缓存键，模板文件被替换后会自动重新解码。
+    调用方已经知道文件签名（例如模板注册表轮询得到的）时可以传入 signature，省去一次 stat。
+    """
+    signature = signature or file_signature(template_path)
+    cached = _template_cache.get(template_path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    with _template_lock:
+        # 其他线程可能已经完成了解码
+        cached = _template_cache.get(template_path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        with Image.open(template_path) as image:
+            template = image.convert("RGB")
+        _template_cache[template_path] = (signature, template)
+        return template
+
+
+def get_scaled_template(
+    template_path: str,
+    signature: Optional[Tuple[int, int]] = None,
+    size: Optional[Size] = None
+) -> Image.Image:
+    """返回缩小到 size 的模板（只读），size 为None或等于原始尺寸时返回原模板"""
+    signature = signature or file_signature(template_path)
+    template = get_template(template_path, signature)
+    if size is None or size == template.size:
+        return template
+
+    key = (template_path, signature, size)
+    scaled = _scaled_cache.get(key)
+    if scaled is None:
+        # reducing_gap 先按整数倍快速缩小，再用 LANCZOS 精确缩放
+        scaled = template.resize(size, Image.LANCZOS, reducing_gap=3.0)
+        _scaled_cache.put(key, scaled)
+    return scaled
+
+
+def load_template(
+    template_path: str,
+    signature: Optional[Tuple[int, int]] = None,
+    size: Optional[Size] = None
+) -> Image.Image:
+    """返回模板（或缩小版模板）的可写副本，用于单次渲染"""
+    return get_scaled_template(template_path, signature, size).copy()
+
+
+def get_template_jpeg(
+    template_path: str,
+    signature: Optional[Tuple[int, int]] = None,
+    size: Optional[Size] = None
+) -> bytes:
+    """返回模板（或缩小版模板）的JPEG编码，每个模板版本和尺寸只编码一次"""
+    signature = signature or file_signature(template_path)
+    key = (template_path, signature, size)
+    data = _jpeg_cache.get(key)
+    if data is None:
+        data = encode_jpeg(get_scaled_template(template_path, signature, size))
+        _jpeg_cache.put(key, data)
+    return data
+
+
+def clear_template_cache() -> None:
+    """清空模板缓存"""
+    with _template_lock:
+        _template_cache.clear()
+        _jpeg_cache.clear()
+        _scaled_cache.clear()
@@ -0,0 +1,74 @@
+"""
+文字图层缓存
+每段文字按 (字体, 字号, 文本) 只光栅化一次，得到灰度遮罩和墨迹宽度；
+同一批证书中相同的组织名称、日期、证书内容和文字签名直接粘贴缓存的遮罩，
+每张证书只需要光栅化变化的字段（通常只有学生姓名）。
+遮罩与颜色无关，绘制时才按字段颜色填充
+"""
+from typing import NamedTuple, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+import config
+from certificate.cache import LRUCache
+from certificate.fonts import font_key
+from certificate.metrics import REGISTRY, CallbackMetric, timed
+
+
+class TextSprite(NamedTuple):
+    """光栅化后的一段文字"""
+    mask: Optional[Image.Image]  # L模式遮罩，没有可见墨迹时为None
+    offset: Tuple[int, int]  # 遮罩左上角相对文字坐标的偏移
+    ink_width: Optional[int]  # 墨迹右边缘的位置（与 font.getmask(text).getbbox()[2] 相同），没有墨迹时为None
+
+
+def _weigh(sprite: TextSprite) -> int:
+    if sprite.mask is None:
+        return 64
+    return sprite.mask.width * sprite.mask.height + 64
+
+
+_sprite_cache = LRUCache(
+    config.FONT_SETTINGS["layer_cache_size"],
+    max_weight=config.FONT_SETTINGS["layer_cache_bytes"],
+    weigh=_weigh
+)
+
+REGISTRY.register(CallbackMetric(
+    "certificate_text_layer_cache_total", "文字图层缓存的命中/未命中次数", "counter",
+    lambda: {("hit",): _sprite_cache.hits, ("miss",): _sprite_cache.misses},
+    ("result",)
+))
+
+
+def render_sprite(text: str, font: ImageFont.FreeTypeFont) -> TextSprite:
+    """光栅化一段文字（不使用缓存）
+
+    遮罩的尺寸和偏移与 ImageDraw.text 内部使用的一致，粘贴结果与直接绘制逐像素相同。
+    """
+    left, top, right, bottom = font.getbbox(text)
+    if right <= left or bottom <= top:
+        return TextSprite(None, (left, top), None)
+    mask = Image.new("L", (right - left, bottom - top), 0)
+    ImageDraw.Draw(mask).text((-left, -top), text, fill=255, font=font)
+    bbox = mask.getbbox()
+    if bbox is None:
+        # 只有空白字符
+        return TextSprite(None, (left, top), None)
+    return TextSprite(mask, (left, top), bbox[2])
+
+
+def get_text_sprite(text: str, font: ImageFont.FreeTypeFont) -> TextSprite:
+    """返回文字的遮罩，按 (字体, 文本) 缓存（只读，多个请求共享同一对象）"""
+    key = (font_key(font), text)
+    sprite = _sprite_cache.get(key)
+    if sprite is None:
+        with timed("text_rasterize"):
+            sprite = render_sprite(text, font)
+        _sprite_cache.put(key, sprite)
+    return sprite
+
+
+def clear_sprite_cache() -> None:
+    """清空文字图层缓存"""
+    _sprite_cache.clear()
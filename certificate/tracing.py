@@ -0,0 +1,86 @@
+"""
+请求级调试追踪
+追踪状态保存在 contextvars 中，只对开启了追踪的请求生效，并发请求之间互不影响。
+未开启追踪时，每个记录点只是一次 ContextVar 读取
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class Trace:
+    """一次请求的追踪记录，事件按发生顺序保存"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.events: List[Dict[str, Any]] = []
+
+    def add(self, name: str, start: float, duration: Optional[float] = None, **fields: Any) -> None:
+        entry: Dict[str, Any] = {"event": name, "at_ms": round((start - self.started) * 1000, 3)}
+        if duration is not None:
+            entry["duration_ms"] = round(duration * 1000, 3)
+        entry.update(fields)
+        self.events.append(entry)
+
+    def timeline(self) -> List[Dict[str, Any]]:
+        """按开始时间排序的事件（耗时事件在结束时才记录，因此需要重新排序）"""
+        return sorted(self.events, key=lambda entry: entry["at_ms"])
+
+    def extend(self, events: List[Dict[str, Any]], offset: float) -> None:
+        """合并在子进程中记录的事件，offset 为子进程追踪开始的相对时间（秒）"""
+        for entry in events:
+            entry = dict(entry)
+            entry["at_ms"] = round(entry["at_ms"] + offset * 1000, 3)
+            self.events.append(entry)
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("certificate_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    """返回当前上下文的追踪记录，未开启追踪时为None"""
+    return _current.get()
+
+
+def is_enabled() -> bool:
+    return _current.get() is not None
+
+
+@contextmanager
+def start_trace() -> Iterator[Trace]:
+    """在当前上下文中开启追踪"""
+    trace = Trace()
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def event(name: str, **fields: Any) -> None:
+    """记录一个瞬时事件"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, time.perf_counter(), **fields)
+
+
+def record_span(name: str, start: float, duration: float, **fields: Any) -> None:
+    """记录一段已经结束的耗时"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, start, duration, **fields)
+
+
+@contextmanager
+def span(name: str, **fields: Any) -> Iterator[None]:
+    """记录代码块的开始时间和耗时"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter() - start, **fields)
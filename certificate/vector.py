@@ -0,0 +1,355 @@
+"""
+矢量文字PDF渲染引擎
+背景以预先压缩好的JPEG图像嵌入，姓名、组织、内容、日期等文字以真正的PDF文本写入，
+并嵌入只包含所用字形的字体子集。文字不再光栅化，文件更小，打印也不会发虚
+"""
+import hashlib
+import os
+import re
+import threading
+import zlib
+from io import BytesIO
+from typing import BinaryIO, Dict, FrozenSet, List, NamedTuple, Tuple
+
+import config
+from certificate.cache import LRUCache
+from certificate.pdf import (
+    LayerCanvas, PdfWriter, add_background_image, add_layer_image, layer_command
+)
+
+try:
+    from fontTools.subset import Options, Subsetter
+    from fontTools.ttLib import TTFont
+except ImportError:  # fontTools 是可选依赖，只有矢量引擎需要
+    TTFont = None
+
+
+class VectorEngineUnavailable(RuntimeError):
+    """矢量引擎不可用（缺少 fontTools）"""
+
+
+class FontSubset(NamedTuple):
+    """嵌入PDF的字体子集"""
+    base_name: bytes  # 带子集前缀的字体名，例如 ABCDEF+NotoSansCJKsc-Regular
+    font_file: bytes  # Flate 压缩后的字体程序
+    font_length: int  # 压缩前的字体程序长度
+    is_cff: bool  # CFF轮廓（FontFile3/OpenType）还是TrueType轮廓（FontFile2）
+    codes: Dict[str, int]  # 字符 -> 内容流中的两字节编码（CID）
+    widths: Dict[int, int]  # CID -> 字宽（1/1000 em）
+    bbox: Tuple[int, int, int, int]
+    ascent: int
+    descent: int
+
+
+class TextRun(NamedTuple):
+    """一段以PDF文本写入的文字，位置为 ImageDraw.text 的左上角坐标（模板像素）"""
+    x: float
+    y: float
+    text: str
+    font_path: str
+    font_index: int
+    size: float
+    ascent: int  # 字体在该字号下的上升高度（像素），用于换算基线
+    fill: Tuple[int, int, int]
+
+
+class _SourceFont(NamedTuple):
+    """已读入内存的字体文件"""
+    data: bytes
+    codepoints: FrozenSet[int]  # 字体 cmap 中包含的字符
+
+
+_subset_cache = LRUCache(
+    max_entries=config.VECTOR_SETTINGS["subset_cache_size"],
+    max_weight=config.VECTOR_SETTINGS["subset_cache_bytes"],
+    weigh=lambda subset: len(subset.font_file)
+)
+# 每个字体只读取和解析一次 cmap，按 (路径, 索引, 修改时间) 缓存
+_source_cache = LRUCache(max_entries=8)
+# 每个字体当前共用的字符集：新证书的字符都在其中时直接使用已有的子集，不重新生成
+_font_charsets: Dict[Tuple[str, int], str] = {}
+_charset_lock = threading.Lock()
+
+
+def is_available() -> bool:
+    """矢量引擎所需的 fontTools 是否已安装"""
+    return TTFont is not None
+
+
+def _scaled(value: float, units_per_em: int) -> int:
+    return int(round(value * 1000.0 / units_per_em))
+
+
+def _load_source_font(font_path: str, font_index: int) -> _SourceFont:
+    """读取字体文件并解析一次 cmap，之后生成子集时从内存中的数据打开"""
+    key = (font_path, font_index, os.stat(font_path).st_mtime_ns)
+    source = _source_cache.get(key)
+    if source is None:
+        with open(font_path, "rb") as f:
+            data = f.read()
+        font = TTFont(BytesIO(data), fontNumber=font_index, lazy=True)
+        source = _SourceFont(data, frozenset(font.getBestCmap() or {}))
+        _source_cache.put(key, source)
+    return source
+
+
+def _build_font_subset(font_path: str, font_index: int, chars: str) -> FontSubset:
+    """用 fontTools 生成只包含指定字符的字体子集"""
+    source = _load_source_font(font_path, font_index)
+    font = TTFont(BytesIO(source.data), fontNumber=font_index, lazy=True)
+
+    options = Options()
+    options.layout_features = []  # 不做复杂排版，不需要 GSUB/GPOS
+    options.drop_tables += ["FFTM"]  # FontForge 时间戳表，fontTools 不会子集化，每次都会输出警告
+    options.hinting = False
+    options.desubroutinize = True
+    options.notdef_outline = True
+    options.name_IDs = [1, 2, 6]
+    subsetter = Subsetter(options)
+    subsetter.populate(text=chars)
+    subsetter.subset(font)
+
+    is_cff = "CFF " in font
+    cid_keyed = is_cff and hasattr(font["CFF "].cff.topDictIndex[0], "ROS")
+    units_per_em = font["head"].unitsPerEm
+    cmap = font.getBestCmap() or {}
+    hmtx = font["hmtx"]
+
+    codes: Dict[str, int] = {}
+    widths: Dict[int, int] = {}
+    for char in chars:
+        glyph_name = cmap.get(ord(char), ".notdef")
+        if cid_keyed:
+            # CID-keyed CFF 在内容流中使用 CID，fontTools 中字形名为 cidNNNNN
+            code = int(glyph_name[3:]) if glyph_name.startswith("cid") else 0
+        else:
+            code = font.getGlyphID(glyph_name)
+        codes[char] = code
+        widths[code] = _scaled(hmtx[glyph_name][0], units_per_em)
+
+    buffer = BytesIO()
+    font.save(buffer)
+    font_program = buffer.getvalue()
+
+    head = font["head"]
+    hhea = font["hhea"]
+    postscript_name = font["name"].getDebugName(6) or "Font"
+    postscript_name = re.sub(r"[^A-Za-z0-9_-]", "", postscript_name) or "Font"
+    # 子集前缀：由字符集决定的6个大写字母
+    digest = hashlib.sha1(chars.encode("utf-8")).digest()
+    tag = "".join(chr(ord("A") + byte % 26) for byte in digest[:6])
+
+    return FontSubset(
+        base_name=f"{tag}+{postscript_name}".encode("ascii"),
+        font_file=zlib.compress(font_program, 6),
+        font_length=len(font_program),
+        is_cff=is_cff,
+        codes=codes,
+        widths=widths,
+        bbox=tuple(_scaled(v, units_per_em) for v in (head.xMin, head.yMin, head.xMax, head.yMax)),
+        ascent=_scaled(hhea.ascent, units_per_em),
+        descent=_scaled(hhea.descent, units_per_em),
+    )
+
+
+def get_font_subset(font_path: str, font_index: int, chars: str) -> FontSubset:
+    """返回包含 chars 中所有字符的字体子集
+
+    每个字体维护一个共用的字符集，只有出现新字符时才按旧字符集与新字符的并集重新生成子集，
+    超过 subset_max_chars 时从本次的字符重新开始。拉丁字母的姓名很快就不再需要生成子集，
+    中文姓名也只在出现新的汉字时才生成。字体中没有的字符不参与子集，写出时使用 .notdef。
+    """
+    source = _load_source_font(font_path, font_index)
+    needed = {char for char in chars if ord(char) in source.codepoints}
+    font_key = (font_path, font_index)
+    with _charset_lock:
+        charset = _font_charsets.get(font_key, "")
+    if not needed.issubset(charset):
+        union = needed.union(charset)
+        if len(union) > config.VECTOR_SETTINGS["subset_max_chars"]:
+            union = needed
+        charset = "".join(sorted(union))
+
+    key = (font_path, font_index, charset)
+    subset = _subset_cache.get(key)
+    if subset is None:
+        subset = _build_font_subset(font_path, font_index, charset)
+        _subset_cache.put(key, subset)
+    with _charset_lock:
+        _font_charsets[font_key] = charset
+    return subset
+
+
+def clear_subset_cache() -> None:
+    """清空字体子集缓存和各字体的共用字符集"""
+    _subset_cache.clear()
+    _source_cache.clear()
+    with _charset_lock:
+        _font_charsets.clear()
+
+
+class VectorCanvas(LayerCanvas):
+    """矢量引擎的画布
+
+    文字记录为 TextRun，之后以PDF文本写出；签名图片等仍作为图层。
+    没有字体文件可嵌入时（例如PIL默认字体），文字退回为图层。
+    """
+
+    def __init__(self, size: Tuple[int, int]):
+        super().__init__(size)
+        self.runs: List[TextRun] = []
+
+    def text(self, xy, text, fill=None, font=None, **kwargs) -> None:
+        font_path = getattr(font, "path", None)
+        if not isinstance(font_path, str):
+            super().text(xy, text, fill=fill, font=font, **kwargs)
+            return
+        if not text:
+            return
+        ascent, _ = font.getmetrics()
+        self.runs.append(TextRun(
+            xy[0], xy[1], text, font_path, getattr(font, "index", 0), font.size, ascent, tuple(fill[:3])
+        ))
+
+
+def _hex_string(subset: FontSubset, text: str) -> bytes:
+    # 字体中没有的字符使用 .notdef（编码0）
+    return b"<" + "".join("%04X" % subset.codes.get(char, 0) for char in text).encode("ascii") + b">"
+
+
+def _to_unicode_cmap(subset: FontSubset) -> bytes:
+    """生成 ToUnicode CMap，使PDF中的文字可以复制和搜索"""
+    entries = []
+    for char, code in sorted(subset.codes.items(), key=lambda item: item[1]):
+        if code == 0:
+            continue
+        entries.append("<%04X> <%s>" % (code, char.encode("utf-16-be").hex().upper()))
+
+    lines = [
+        "/CIDInit /ProcSet findresource begin",
+        "12 dict begin",
+        "begincmap",
+        "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def",
+        "/CMapName /Adobe-Identity-UCS def",
+        "/CMapType 2 def",
+        "1 begincodespacerange",
+        "<0000> <FFFF>",
+        "endcodespacerange",
+    ]
+    for start in range(0, len(entries), 100):
+        chunk = entries[start:start + 100]
+        lines.append(f"{len(chunk)} beginbfchar")
+        lines.extend(chunk)
+        lines.append("endbfchar")
+    lines.extend([
+        "endcmap",
+        "CMapName currentdict /CMap defineresource pop",
+        "end",
+        "end",
+    ])
+    return "\n".join(lines).encode("ascii")
+
+
+def _add_font(writer: PdfWriter, subset: FontSubset) -> int:
+    """写入 Type0 字体及其子对象，返回 Type0 字体的对象编号"""
+    if subset.is_cff:
+        font_file = writer.add_stream(b"/Subtype /OpenType /Filter /FlateDecode", subset.font_file)
+        font_file_key = b"/FontFile3"
+    else:
+        font_file = writer.add_stream(b"/Length1 %d /Filter /FlateDecode" % subset.font_length, subset.font_file)
+        font_file_key = b"/FontFile2"
+
+    descriptor = writer.add_object(
+        b"<< /Type /FontDescriptor /FontName /%s /Flags 4 /FontBBox [%d %d %d %d] "
+        b"/ItalicAngle 0 /Ascent %d /Descent %d /CapHeight %d /StemV 80 %s %d 0 R >>" % (
+            (subset.base_name,) + subset.bbox
+            + (subset.ascent, subset.descent, subset.ascent, font_file_key, font_file)
+        )
+    )
+
+    widths = b" ".join(b"%d [%d]" % (code, width) for code, width in sorted(subset.widths.items()))
+    if subset.is_cff:
+        cid_font_type = b"/Subtype /CIDFontType0"
+    else:
+        cid_font_type = b"/Subtype /CIDFontType2 /CIDToGIDMap /Identity"
+    cid_font = writer.add_object(
+        b"<< /Type /Font %s /BaseFont /%s "
+        b"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+        b"/FontDescriptor %d 0 R /DW 1000 /W [%s] >>" % (cid_font_type, subset.base_name, descriptor, widths)
+    )
+
+    to_unicode = writer.add_stream(b"/Filter /FlateDecode", zlib.compress(_to_unicode_cmap(subset)))
+    return writer.add_object(
+        b"<< /Type /Font /Subtype /Type0 /BaseFont /%s /Encoding /Identity-H "
+        b"/DescendantFonts [%d 0 R] /ToUnicode %d 0 R >>" % (subset.base_name, cid_font, to_unicode)
+    )
+
+
+def write_vector_pdf(
+    output: BinaryIO,
+    canvas: VectorCanvas,
+    background_jpeg: bytes,
+    resolution: float = 100.0
+) -> None:
+    """把矢量画布写为单页PDF
+
+    Args:
+        output: 可写的二进制流
+        canvas: 已绘制好字段的矢量画布
+        background_jpeg: JPEG编码的模板背景（按模板缓存，不会每次重新编码）
+        resolution: 模板像素与PDF点的换算分辨率（DPI），与光栅引擎一致
+    """
+    if not is_available():
+        raise VectorEngineUnavailable("矢量渲染引擎需要安装 fonttools")
+
+    scale = 72.0 / resolution
+    page_width = canvas.size[0] * scale
+    page_height = canvas.size[1] * scale
+
+    # CFF轮廓的字体以 FontFile3/OpenType 嵌入，需要 PDF 1.6
+    writer = PdfWriter(output, version="1.6")
+    catalog = writer.reserve()
+    pages = writer.reserve()
+
+    xobjects = [b"/Bg %d 0 R" % add_background_image(writer, canvas.size, background_jpeg)]
+    commands = [b"q %.4f 0 0 %.4f 0 0 cm /Bg Do Q" % (page_width, page_height)]
+
+    for index, layer in enumerate(canvas.encode()):
+        xobjects.append(b"/L%d %d 0 R" % (index, add_layer_image(writer, layer)))
+        commands.append(layer_command(b"L%d" % index, layer, scale, page_height))
+
+    # 同一字体的所有文字共用一个子集，每个字体在文档中只嵌入一次
+    font_chars: Dict[Tuple[str, int], str] = {}
+    for run in canvas.runs:
+        font_chars[(run.font_path, run.font_index)] = font_chars.get((run.font_path, run.font_index), "") + run.text
+    fonts = []
+    font_subsets: Dict[Tuple[str, int], Tuple[bytes, FontSubset]] = {}
+    for index, ((font_path, font_index), chars) in enumerate(font_chars.items()):
+        subset = get_font_subset(font_path, font_index, chars)
+        font_name = b"F%d" % index
+        font_subsets[(font_path, font_index)] = (font_name, subset)
+        fonts.append(b"/%s %d 0 R" % (font_name, _add_font(writer, subset)))
+
+    for run in canvas.runs:
+        font_name, subset = font_subsets[(run.font_path, run.font_index)]
+        # ImageDraw.text 的坐标是文字左上角，基线在其下方 ascent 像素处
+        baseline = page_height - (run.y + run.ascent) * scale
+        commands.append(b"BT /%s %.4f Tf %.4f %.4f %.4f rg %.4f %.4f Td %s Tj ET" % (
+            font_name, run.size * scale,
+            run.fill[0] / 255.0, run.fill[1] / 255.0, run.fill[2] / 255.0,
+            run.x * scale, baseline,
+            _hex_string(subset, run.text)
+        ))
+
+    contents = writer.add_stream(b"/Filter /FlateDecode", zlib.compress(b"\n".join(commands), 6))
+    resources = b"/XObject << %s >>" % b" ".join(xobjects)
+    if fonts:
+        resources += b" /Font << %s >>" % b" ".join(fonts)
+    page = writer.add_object(
+        b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.4f %.4f] /Resources << %s >> /Contents %d 0 R >>" % (
+            pages, page_width, page_height, resources, contents
+        )
+    )
+    writer.write_object(pages, b"<< /Type /Pages /Kids [%d 0 R] /Count 1 >>" % page)
+    writer.write_object(catalog, b"<< /Type /Catalog /Pages %d 0 R >>" % pages)
+    writer.close(catalog)
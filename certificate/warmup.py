@@ -0,0 +1,144 @@
+"""
+启动预热与就绪状态
+工作进程对外报告就绪之前，先加载字体、模板（含预览用的缩小版）和各字号的字体对象，
+再试渲染一张证书，让编码器、文字图层等首次使用时才初始化的部分提前完成，
+首个真实请求不再承担这些开销。
+
+以 gunicorn 预加载模式（preload_app）运行时，主进程在 fork 之前调用 preload_shared()，
+只读的模板图像和字体对象由各工作进程以写时复制的方式共享，工作进程的预热不再重复加载
+"""
+import sys
+import threading
+import time
+from io import BytesIO
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+import config
+from certificate.fonts import default_font_path, discover_fonts
+from certificate.generator import (
+    generate_certificate, get_font, prepare_preview_templates, preview_width, render_preview_bytes
+)
+from certificate.output import OutputError, resolve_scale
+from certificate.registry import DEFAULT_TEMPLATE_ID, get_registry, scale_layout
+from certificate.templates import get_template_jpeg
+
+# 试渲染使用的示例内容（包含中文，覆盖常用字形）
+SAMPLE_FIELDS = {
+    "student_name": "预热示例",
+    "ngo_name": "示例公益组织",
+    "contents": "感谢您参与志愿服务活动，特发此证，以资鼓励。",
+    "date": "2024年1月1日",
+    "ngo_signature": "示例签名",
+}
+
+# 预热状态: pending（未开始）、warming（进行中）、ready（完成）、failed（失败）
+_state: Dict[str, Any] = {"status": "pending"}
+_state_lock = threading.Lock()
+# preload_shared() 各步骤的耗时，已加载过时不为None
+_shared_steps: Optional[Dict[str, float]] = None
+
+
+def _set_state(**values: Any) -> None:
+    global _state
+    with _state_lock:
+        state = dict(_state)
+        state.update(values)
+        # 整体替换，读取方总是看到一致的快照
+        _state = state
+
+
+def readiness() -> Dict[str, Any]:
+    """返回当前的预热状态（副本）"""
+    return dict(_state)
+
+
+def is_ready() -> bool:
+    return _state["status"] == "ready"
+
+
+def preload_fonts() -> int:
+    """加载所有模板布局用到的字号（原始尺寸和默认预览尺寸），返回加载的字体数量"""
+    font_path = default_font_path()
+    sizes = set()
+    for spec in get_registry().list():
+        layouts = [spec.layout]
+        try:
+            layouts.append(scale_layout(spec.layout, resolve_scale(spec.size, preview_width(spec))))
+        except OutputError:
+            pass
+        for layout in layouts:
+            for field in layout.values():
+                if field.get("font_size"):
+                    sizes.add(field["font_size"])
+    for size in sorted(sizes):
+        get_font(font_path, size)
+    return len(sizes)
+
+
+def preload_shared() -> Dict[str, float]:
+    """加载只读的共享资源，返回各步骤耗时（毫秒）
+
+    只加载数据，不创建线程或进程池，可以在 gunicorn 主进程 fork 之前调用（由 gunicorn.conf.py 冻结垃圾回收）。
+    已经加载过时（包括 fork 出的工作进程从主进程继承）直接返回上次的耗时，不重复加载。
+    """
+    global _shared_steps
+    if _shared_steps is not None:
+        return dict(_shared_steps)
+    steps: Dict[str, float] = {}
+
+    def _step(name: str, fn) -> None:
+        started = time.perf_counter()
+        fn()
+        steps[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    _step("fonts", discover_fonts)
+    # 提前导入所有图片格式插件，首次解码签名图片时不再导入
+    _step("image_plugins", Image.init)
+    _step("templates", get_registry().refresh)
+    _step("preview_templates", prepare_preview_templates)
+    _step("pdf_templates", lambda: [
+        get_template_jpeg(spec.image_path, spec.image_signature) for spec in get_registry().list()
+    ])
+    _step("font_sizes", preload_fonts)
+    _shared_steps = steps
+    return dict(steps)
+
+
+def dry_run() -> None:
+    """不写文件地试渲染一张默认格式的证书和一张预览图"""
+    generate_certificate(output=BytesIO(), template_id=DEFAULT_TEMPLATE_ID, **SAMPLE_FIELDS)
+    render_preview_bytes(template_id=DEFAULT_TEMPLATE_ID, **SAMPLE_FIELDS)
+
+
+def warm_up_worker() -> None:
+    """在渲染进程池的子进程中执行的预热（子进程已从父进程继承加载好的资源）"""
+    if config.WARMUP_SETTINGS["dry_run"]:
+        dry_run()
+
+
+def warm_up(run_dry_run: Optional[bool] = None) -> Dict[str, Any]:
+    """执行预热并更新就绪状态，返回最终状态；失败时状态为 failed 并记录原因，不抛出异常"""
+    if run_dry_run is None:
+        run_dry_run = config.WARMUP_SETTINGS["dry_run"]
+    started = time.perf_counter()
+    _set_state(status="warming", error=None)
+    try:
+        steps = preload_shared()
+        if run_dry_run:
+            dry_run_started = time.perf_counter()
+            dry_run()
+            steps["dry_run"] = round((time.perf_counter() - dry_run_started) * 1000, 1)
+    except Exception as e:
+        print(f"警告：启动预热失败: {e}", file=sys.stderr)
+        _set_state(status="failed", error=f"{type(e).__name__}: {e}",
+                   duration_ms=round((time.perf_counter() - started) * 1000, 1))
+        return readiness()
+    _set_state(status="ready", steps=steps, duration_ms=round((time.perf_counter() - started) * 1000, 1))
+    return readiness()
+
+
+def skip_warm_up() -> None:
+    """不预热，直接标记为就绪（config.WARMUP_SETTINGS["enabled"] 为 False 时）"""
+    _set_state(status="ready", skipped=True)
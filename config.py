@@ -10,6 +10,11 @@ TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
 # 默认证书模板
 DEFAULT_TEMPLATE = os.path.join(TEMPLATE_DIR, "1.png")
 
+# 模板注册表设置
+TEMPLATE_SETTINGS = {
+    "poll_interval": float(os.environ.get("TEMPLATE_POLL_INTERVAL", 5.0)),  # 检查模板文件变化的间隔（秒）
+}
+
 # 临时文件目录
 TEMP_DIR = os.path.join(BASE_DIR, "temp")
 os.makedirs(TEMP_DIR, exist_ok=True)
@@ -18,25 +23,41 @@ os.makedirs(TEMP_DIR, exist_ok=True)
 FONT_DIR = os.path.join(BASE_DIR, "fonts")
 os.makedirs(FONT_DIR, exist_ok=True)
 
-# 尝试使用系统中可能存在的字体
-system_fonts = [
-    os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts\\simhei.ttf"),  # 黑体
-    os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts\\simsun.ttc"),  # 宋体
-    os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts\\msyh.ttf"),    # 微软雅黑
-    os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts\\arial.ttf"),   # Arial
-    os.path.join(FONT_DIR, "msyh.ttf"),  # 本地字体目录中的微软雅黑
+# 指定字体路径（可选），为None时由 certificate.fonts 在启动时自动发现
+# 也可以通过环境变量 CERTIFICATE_FONT 指定
+DEFAULT_FONT = None
+
+# 候选字体，按优先级排列（绝对路径或字体文件名）
+FONT_CANDIDATES = [
+    "simhei.ttf",  # 黑体
+    "simsun.ttc",  # 宋体
+    "msyh.ttf",    # 微软雅黑
+    "arial.ttf",   # Arial
+    "NotoSansCJK-Regular.ttc",  # Linux Noto CJK
+    "PingFang.ttc",  # MacOS 苹方
 ]
 
-# 默认字体 - 找到第一个存在的字体
-DEFAULT_FONT = None
-for font_path in system_fonts:
-    if os.path.exists(font_path):
-        DEFAULT_FONT = font_path
-        break
+# 字体搜索目录，启动时扫描一次建立字体索引（靠前的目录优先）
+FONT_SEARCH_DIRS = [
+    FONT_DIR,  # 本地字体目录
+    os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts"),
+    "/usr/share/fonts",
+    "/usr/local/share/fonts",
+    os.path.expanduser("~/.fonts"),
+    os.path.expanduser("~/.local/share/fonts"),
+    "/Library/Fonts",
+    "/System/Library/Fonts",
+]
 
-# 如果没有找到字体，则使用None，程序会回退到使用默认字体
-if DEFAULT_FONT is None:
-    print("警告：未找到任何可用字体，将使用PIL默认字体")
+# 字体缓存设置
+FONT_SETTINGS = {
+    "cache_size": 64,  # 最多缓存的字体对象数量 (路径, 大小, 索引)
+    "advance_cache_size": 65536,  # 换行时缓存的片段宽度数量 (字体, 片段)
+    "wrap_cache_size": 1024,  # 缓存的换行结果数量 (字体, 文本, 最大宽度)
+    "fit_cache_size": 4096,  # 缓存的自动字号结果数量 (字体, 文本, 最大宽度, 最小字号)
+    "layer_cache_size": 4096,  # 缓存的文字图层数量 (字体, 文本)
+    "layer_cache_bytes": 64 * 1024 * 1024,  # 文字图层缓存的总大小上限（字节）
+}
 
 # 证书字段位置配置 - 根据SVG坐标更新
 CERTIFICATE_CONFIG = {
@@ -44,6 +65,8 @@ CERTIFICATE_CONFIG = {
     "student_name": {
         "position": (1004, 555),
         "font_size": 100,
+        "max_width": 1600,  # 单行字段的最大宽度，超过时自动缩小字号
+        "min_font_size": 60,  # 自动缩小时的最小字号
         "color": (139, 69, 19),  # #8B4513 (棕色)
         "align": "center",
         "font_style": "bold_italic"  # 粗斜体
@@ -59,6 +82,8 @@ CERTIFICATE_CONFIG = {
     "ngo_name": {
         "position": (1337, 1170),
         "font_size": 70,
+        "max_width": 1200,
+        "min_font_size": 40,
         "color": (0, 0, 0),  # 黑色
         "align": "center"
     },
@@ -93,4 +118,106 @@ CERTIFICATE_CONFIG = {
 API_SETTINGS = {
     "allowed_origins": ["*"],  # 允许的CORS来源
     "max_upload_size": 10 * 1024 * 1024,  # 最大上传文件大小（10MB）
-} 
\ No newline at end of file
+} 
+# 签名图片下载设置（下载大小上限使用 API_SETTINGS["max_upload_size"]）
+SIGNATURE_SETTINGS = {
+    "connect_timeout": 3.0,  # 连接超时（秒）
+    "read_timeout": 10.0,  # 读取超时（秒）
+    "pool_size": 16,  # HTTP连接池大小
+    "cache_size": 128,  # 缓存的签名图片数量
+    "revalidate_after": 300,  # 缓存超过该秒数后向服务器重新验证（ETag/Last-Modified）
+    "max_pixels": 40_000_000,  # 签名图片的像素数上限，超过时不解码（防止解压炸弹）
+    "reducing_gap": 2.0,  # 解码时/整数倍缩小后至少保留目标尺寸的倍数，再做最终重采样
+    "store_dir": os.environ.get("SIGNATURE_STORE_DIR", os.path.join(TEMP_DIR, "signatures")),  # 已注册签名的保存目录
+    "store_ttl": int(os.environ.get("SIGNATURE_STORE_TTL", 30 * 86400)),  # 已注册签名的保存时间（秒，从最后一次注册算起），0表示不按时间清理
+    "store_max_bytes": int(os.environ.get("SIGNATURE_STORE_MAX_BYTES", 512 * 1024 * 1024)),  # 已注册签名的总大小上限（字节），0表示不限制
+    "store_sweep_interval": float(os.environ.get("SIGNATURE_STORE_SWEEP_INTERVAL", 3600)),  # 后台清理的间隔（秒）
+}
+
+# 渲染执行器设置
+RENDER_SETTINGS = {
+    "executor": os.environ.get("RENDER_EXECUTOR", "thread"),  # thread（线程池）或 process（进程池）
+    "max_workers": int(os.environ.get("RENDER_MAX_WORKERS", os.cpu_count() or 1)),  # 同时渲染的最大数量
+    "max_queue": int(os.environ.get("RENDER_MAX_QUEUE", 32)),  # 最多排队等待的请求数，超出返回503
+    "retry_after": int(os.environ.get("RENDER_RETRY_AFTER", 5)),  # 503响应中的Retry-After秒数
+    "engine": os.environ.get("CERTIFICATE_ENGINE", "raster"),  # 默认渲染引擎: raster（整页图片）或 vector（矢量文字，需要fonttools）
+}
+
+# 证书输出设置（请求中未指定时使用）
+OUTPUT_SETTINGS = {
+    "format": os.environ.get("CERTIFICATE_FORMAT", "pdf"),  # 默认输出格式: pdf、png、jpeg 或 webp
+    "base_dpi": 100.0,  # 模板原始尺寸对应的分辨率，PDF页面尺寸 = 模板像素 / base_dpi 英寸
+    "min_width": 64,  # 缩小输出时允许的最小宽度（像素）
+    "jpeg_quality": 85,  # JPEG默认质量
+    "webp_quality": 80,  # WebP默认质量
+    "webp_method": 2,  # WebP编码速度与压缩率的权衡，0最快、6压缩率最高
+    "png_compress_level": 3,  # PNG压缩级别（0-9），越大越慢
+    "scaled_template_cache_size": 16,  # 缓存的缩小版模板数量
+    "template_jpeg_cache_size": 16,  # 缓存的模板JPEG编码（矢量PDF背景）数量，按模板版本和尺寸
+    "template_jpeg_cache_bytes": 64 * 1024 * 1024,  # 模板JPEG编码缓存的总大小上限（字节）
+}
+
+# 实时预览设置（/preview）
+PREVIEW_SETTINGS = {
+    "width": int(os.environ.get("PREVIEW_WIDTH", 600)),  # 默认预览宽度（像素），不超过模板原始宽度
+    "format": os.environ.get("PREVIEW_FORMAT", "jpeg"),  # 默认预览格式: jpeg 或 webp
+    "quality": int(os.environ.get("PREVIEW_QUALITY", 70)),  # 默认预览质量
+}
+
+# 启动预热设置（/ready 在预热完成后返回200）
+WARMUP_SETTINGS = {
+    "enabled": os.environ.get("WARMUP_ENABLED", "1") == "1",  # 是否在启动时预热
+    "dry_run": os.environ.get("WARMUP_DRY_RUN", "1") == "1",  # 预热时是否试渲染一张证书
+    "blocking": os.environ.get("WARMUP_BLOCKING", "1") == "1",  # 预热完成后才开始接收请求；为0时在后台预热
+}
+
+# 矢量渲染引擎设置
+VECTOR_SETTINGS = {
+    "subset_cache_size": 256,  # 缓存的字体子集数量
+    "subset_cache_bytes": 32 * 1024 * 1024,  # 字体子集缓存的总大小上限（字节）
+    "subset_max_chars": 512,  # 每个字体共用子集的最大字符数，超过时只按当前证书的字符重新生成
+}
+
+# 批量生成设置
+BATCH_SETTINGS = {
+    "max_items": int(os.environ.get("BATCH_MAX_ITEMS", 1000)),  # 单次批量请求最多的证书数量
+}
+
+# 异步任务设置
+JOB_SETTINGS = {
+    "db_path": os.environ.get("JOB_DB_PATH", os.path.join(TEMP_DIR, "jobs.sqlite3")),  # 任务队列数据库
+    "result_dir": os.environ.get("JOB_RESULT_DIR", os.path.join(TEMP_DIR, "jobs")),  # 任务结果文件目录
+    "max_items": int(os.environ.get("JOB_MAX_ITEMS", 20000)),  # 单个任务最多的证书数量
+    "concurrency": int(os.environ.get("JOB_CONCURRENCY", 1)),  # 同时执行的任务数量
+    "window": int(os.environ.get("JOB_WINDOW", max(1, (os.cpu_count() or 2) // 2))),  # 每个任务同时提交的渲染数量
+    "poll_interval": float(os.environ.get("JOB_POLL_INTERVAL", 1.0)),  # 没有任务时检查队列的间隔（秒）
+    "progress_interval": float(os.environ.get("JOB_PROGRESS_INTERVAL", 0.5)),  # 写入进度的最小间隔（秒）
+    "lease": float(os.environ.get("JOB_LEASE", 60.0)),  # 执行中任务的租约（秒），工作者每1/3租约续期，过期后任务重新排队
+    "result_ttl": float(os.environ.get("JOB_RESULT_TTL", 7 * 86400)),  # 完成的任务和结果文件的保存时间（秒），0表示不删除
+    "cleanup_interval": float(os.environ.get("JOB_CLEANUP_INTERVAL", 600)),  # 清理过期任务的间隔（秒）
+}
+
+# 证书结果缓存设置（相同请求直接返回已生成的PDF）
+RESULT_CACHE_SETTINGS = {
+    "enabled": os.environ.get("RESULT_CACHE_ENABLED", "1") == "1",
+    "memory_bytes": int(os.environ.get("RESULT_CACHE_MEMORY_BYTES", 64 * 1024 * 1024)),  # 内存层上限（字节）
+    "disk_dir": os.environ.get("RESULT_CACHE_DIR", os.path.join(TEMP_DIR, "result_cache")),  # 磁盘层目录，为空时不使用磁盘层
+    "disk_bytes": int(os.environ.get("RESULT_CACHE_DISK_BYTES", 512 * 1024 * 1024)),  # 磁盘层上限（字节）
+}
+
+# 已签发证书的设置（GET /certificates/{id} 按ID重新下载，证书保存在 STORAGE_SETTINGS 的存储中）
+ISSUED_SETTINGS = {
+    "enabled": os.environ.get("ISSUED_ENABLED", "1") == "1",
+    "max_age": int(os.environ.get("ISSUED_MAX_AGE", 86400)),  # 响应的 Cache-Control max-age（秒）
+}
+
+# 渲染结果存储设置（已签发的证书和未指定输出位置时生成的证书）
+STORAGE_SETTINGS = {
+    "backend": os.environ.get("STORAGE_BACKEND", "local"),  # local（本地目录）、s3（需要boto3）或 memory（进程内，仅用于开发测试）
+    "dir": os.environ.get("STORAGE_DIR", os.path.join(TEMP_DIR, "storage")),  # 本地存储目录
+    "bucket": os.environ.get("STORAGE_BUCKET", ""),  # S3存储桶
+    "prefix": os.environ.get("STORAGE_PREFIX", ""),  # 对象存储中的键前缀
+    "ttl": int(os.environ.get("STORAGE_TTL", 7 * 86400)),  # 保存时间（秒），0表示不按时间清理
+    "max_bytes": int(os.environ.get("STORAGE_MAX_BYTES", 2 * 1024 * 1024 * 1024)),  # 总大小上限（字节），0表示不限制
+    "janitor_interval": float(os.environ.get("STORAGE_JANITOR_INTERVAL", 600)),  # 后台清理的间隔（秒）
+}
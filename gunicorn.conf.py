@@ -0,0 +1,35 @@
+"""
+gunicorn 配置（在项目目录中运行 gunicorn 时自动读取）
+
+预加载模式（GUNICORN_PRELOAD=1，默认开启）下主进程先导入应用，并在 fork 工作进程之前
+加载字体、模板和各字号的字体对象；这些只读资源由各工作进程以写时复制的方式共享，
+多个工作进程不会各自再占用一份内存，工作进程启动后的预热也只剩试渲染。
+"""
+import gc
+import os
+
+bind = f":{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+# 预热需要的时间计入工作进程启动时间，超时时间要留出余量
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+if preload_app:
+    # gunicorn 读取本配置之后才导入应用：从这里开始关闭垃圾回收，
+    # 导入和预加载期间创建的对象不会被回收器扫描和写入，fork 前统一冻结
+    gc.disable()
+
+
+def when_ready(server):
+    """主进程已加载应用、即将 fork 工作进程"""
+    if preload_app:
+        from certificate.warmup import preload_shared
+
+        steps = preload_shared()
+        # 已加载的对象移出垃圾回收的扫描范围，工作进程中的回收不会写入这些对象而复制内存页；
+        # 冻结后重新开启垃圾回收，fork 出的工作进程继承开启的状态
+        gc.freeze()
+        gc.enable()
+        server.log.info("主进程预加载完成: %s", steps)
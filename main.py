@@ -1,10 +1,37 @@
+import asyncio
 import os
+import sys
+from contextlib import nullcontext
+from typing import List, Optional, Tuple
 import uvicorn
-from fastapi import FastAPI, HTTPException, Query
+from pydantic import ValidationError
+from fastapi import FastAPI, HTTPException, Query, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
-from certificate.models import CertificateRequest
-from certificate.generator import generate_certificate
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+import config
+from certificate.models import BatchCertificateRequest, CertificateRequest, PreviewRequest
+from certificate.batch import stream_certificate_pdf, stream_certificate_zip
+from certificate.generator import (
+    preview_width,
+    render_certificate_bytes,
+    render_preview_bytes,
+)
+from certificate.executor import QueueFullError, get_executor
+from certificate.jobs import DONE, OUTPUT_TYPES, get_job_worker, job_status
+from certificate.metrics import MetricsMiddleware, record_failure, render_metrics
+from certificate.output import FORMATS, OutputError, resolve_output, resolve_scale
+from certificate.tracing import start_trace
+from certificate.result_cache import cache_key, get_result_cache
+from certificate.fonts import default_font_path, discover_fonts, resolve_font_path
+from certificate.registry import TemplateSpec, get_registry, scale_layout
+from certificate.signatures import (
+    SIGNATURE_PREFIX, SignatureError, check_signature_reference, decode_data_url, get_signature_janitor,
+    register_signature
+)
+from certificate.issued import certificate_id, content_etag, get_issued_store
+from certificate.storage import get_storage_janitor
+from certificate.http_files import PartialFileResponse, RangeNotSatisfiable, etag_matches, parse_range
+from certificate.warmup import readiness, skip_warm_up, warm_up, warm_up_worker
 
 app = FastAPI(
     title="证书生成服务",
@@ -21,155 +48,562 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 记录每个请求的耗时和状态码
+app.add_middleware(MetricsMiddleware)
+
+# 后台预热任务（WARMUP_BLOCKING=0 时），保留引用防止被回收
+_warm_up_task: Optional[asyncio.Task] = None
+
+async def run_warm_up():
+    """预热字体、模板并试渲染，进程池模式下同时启动所有渲染子进程"""
+    state = await asyncio.get_running_loop().run_in_executor(None, warm_up)
+    executor = get_executor()
+    if state["status"] == "ready" and executor.kind == "process":
+        try:
+            await executor.warm_up(warm_up_worker)
+        except Exception as e:
+            print(f"警告：渲染子进程预热失败: {e}", file=sys.stderr)
+
+@app.on_event("startup")
+async def warm_up_on_startup():
+    """启动预热：发现字体、加载并校验所有模板、加载字体并试渲染一张证书，完成后 /ready 返回200
+
+    之后模板由后台线程按 TEMPLATE_POLL_INTERVAL 检查文件变化，不在请求处理中检查。
+    """
+    global _warm_up_task
+    if not config.WARMUP_SETTINGS["enabled"]:
+        # 不预热时仍然加载模板，保持启动时校验模板的行为
+        discover_fonts()
+        get_registry().refresh()
+        skip_warm_up()
+    elif config.WARMUP_SETTINGS["blocking"]:
+        await run_warm_up()
+    else:
+        _warm_up_task = asyncio.get_running_loop().create_task(run_warm_up())
+    get_registry().start()
+
+@app.on_event("startup")
+async def start_job_worker():
+    """启动后台任务工作者，租约已过期的中断任务会重新排队"""
+    get_job_worker().start()
+
+@app.on_event("startup")
+async def start_storage_janitor():
+    """启动渲染结果存储的后台清理（按 STORAGE_TTL 和 STORAGE_MAX_BYTES）"""
+    get_storage_janitor().start()
+
+@app.on_event("shutdown")
+async def stop_storage_janitor():
+    """停止存储清理"""
+    await get_storage_janitor().stop()
+
+@app.on_event("startup")
+async def start_signature_janitor():
+    """启动已注册签名的后台清理（按 SIGNATURE_STORE_TTL 和 SIGNATURE_STORE_MAX_BYTES）"""
+    get_signature_janitor().start()
+
+@app.on_event("shutdown")
+async def stop_signature_janitor():
+    """停止签名清理"""
+    await get_signature_janitor().stop()
+
+@app.on_event("shutdown")
+async def stop_job_worker():
+    """停止后台任务工作者，执行中的任务立即重新排队"""
+    await get_job_worker().stop()
+
+@app.on_event("shutdown")
+def stop_template_polling():
+    """停止模板目录的后台检查"""
+    get_registry().stop()
+
+@app.on_event("shutdown")
+def shutdown_executor():
+    """关闭渲染线程池/进程池"""
+    get_executor().shutdown()
+
 @app.get("/")
 async def root():
     return {"message": "证书生成服务已启动"}
 
+@app.get("/ready")
+async def ready():
+    """就绪探针：启动预热完成后返回200，预热中或预热失败时返回503"""
+    state = readiness()
+    return JSONResponse(content=state, status_code=200 if state["status"] == "ready" else 503)
+
+def queue_full_response(error: QueueFullError) -> HTTPException:
+    """渲染队列已满时返回503，并告知客户端何时重试"""
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+def find_template(template_id: Optional[str]) -> TemplateSpec:
+    """按ID查找模板，不存在时返回400"""
+    spec = get_registry().get(template_id)
+    if spec is None:
+        raise HTTPException(status_code=400, detail=f"模板不存在: {template_id}")
+    return spec
+
+def check_output(request: CertificateRequest, spec: TemplateSpec) -> str:
+    """检查输出选项（格式、宽度/DPI相对模板尺寸），无效时返回400；返回实际使用的输出格式"""
+    try:
+        output_format, _ = resolve_output(spec.size, request.format, request.engine, request.width, request.dpi)
+    except OutputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return output_format
+
+def check_signature(ngo_signature: Optional[str]) -> None:
+    """检查内联签名（signature:<id> 必须已注册，data URL 必须是 base64），无效时返回400"""
+    try:
+        check_signature_reference(ngo_signature)
+    except SignatureError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def check_batch_templates(requests: List[CertificateRequest], output: str) -> None:
+    """检查批量请求用到的模板都存在；合并PDF共享背景，只能使用一个模板
+
+    ZIP 输出中每张证书按各自的输出选项生成，这里一并检查；内联签名也在这里检查。
+    """
+    templates = {template_id: find_template(template_id) for template_id in {r.templateId for r in requests}}
+    for ngo_signature in {r.ngoSignature for r in requests}:
+        check_signature(ngo_signature)
+    if output == "pdf" and len(templates) > 1:
+        raise HTTPException(status_code=400, detail="合并PDF中的证书必须使用同一个模板")
+    if output == "zip":
+        checked = set()
+        for request in requests:
+            options = (request.templateId, request.format, request.engine, request.width, request.dpi)
+            if options not in checked:
+                check_output(request, templates[request.templateId])
+                checked.add(options)
+
 @app.post("/generate-certificate")
 async def create_certificate(request: CertificateRequest):
+    return await issue_certificate(request)
+
+@app.post("/generate-certificate/upload")
+async def create_certificate_upload(request: Request):
+    """以 multipart/form-data 生成证书：字段与 JSON 请求体相同，签名图片作为 signatureFile 文件上传
+
+    上传的签名会被注册（与 POST /signatures 相同），响应头 X-Signature-Id 返回签名ID，
+    之后的请求可以直接使用 ngoSignature="signature:<id>"。
+    """
+    form = await request.form()
+    fields = {key: value for key, value in form.items() if isinstance(value, str) and value != ""}
+    upload = form.get("signatureFile")
+    sig_id = None
+    if upload is not None and not isinstance(upload, str):
+        sig_id, _ = await register_uploaded_signature(await read_upload(upload))
+        fields["ngoSignature"] = SIGNATURE_PREFIX + sig_id
+    try:
+        certificate_request = CertificateRequest(**fields)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    response = await issue_certificate(certificate_request)
+    if sig_id is not None:
+        response.headers["X-Signature-Id"] = sig_id
+    return response
+
+async def issue_certificate(request: CertificateRequest) -> Response:
+    """生成一张证书并返回响应（JSON 和 multipart 接口共用）"""
+    spec = find_template(request.templateId)
+    output_format = check_output(request, spec)
+    check_signature(request.ngoSignature)
+    try:
+        # 在渲染池中生成证书（内存中完成，不写临时文件），避免阻塞事件循环
+        def render():
+            return get_executor().run(
+                render_certificate_bytes,
+                student_name=request.studentName,
+                ngo_signature=request.ngoSignature,
+                ngo_name=request.ngoName,
+                contents=request.contents,
+                date=request.date,
+                engine=request.engine,
+                template_id=request.templateId,
+                output_format=output_format,
+                quality=request.quality,
+                width=request.width,
+                dpi=request.dpi
+            )
+        
+        # 未指定引擎时按当前配置的引擎计算键，切换默认引擎不会命中旧结果
+        fields = request.model_dump()
+        fields["format"] = output_format
+        if output_format == "pdf":
+            fields["engine"] = request.engine or config.RENDER_SETTINGS["engine"]
+        key = cache_key(fields, spec)
+        
+        loop = asyncio.get_running_loop()
+        store = get_issued_store()
+        issued = content = None
+        if store is not None:
+            # 已经签发过的证书直接返回保存的内容，与 ETag 和 GET /certificates/{id} 一致
+            issued = await loop.run_in_executor(None, store.get, certificate_id(key))
+            if issued is not None:
+                content = await loop.run_in_executor(None, store.read, issued)
+        
+        if content is None:
+            # 相同的请求直接使用缓存结果，并发的相同请求只渲染一次
+            result_cache = get_result_cache()
+            if result_cache is not None:
+                content = await result_cache.get_or_render(key, render)
+            else:
+                content = await render()
+            if store is not None:
+                # 保存证书，之后可以通过 GET /certificates/{id} 重新下载
+                issued = await loop.run_in_executor(None, store.put, certificate_id(key), content, output_format)
+                if issued.etag != content_etag(content):
+                    # 同一个ID已由其他请求先保存，返回先保存的内容；读取前已被清理时不返回证书ID
+                    stored = await loop.run_in_executor(None, store.read, issued)
+                    if stored is not None:
+                        content = stored
+                    else:
+                        issued = None
+        
+        suffix, media_type = FORMATS[output_format]
+        headers = {"Content-Disposition": f'attachment; filename="certificate{suffix}"'}
+        if issued is not None:
+            headers["X-Certificate-Id"] = issued.certificate_id
+            headers["Content-Location"] = f"/certificates/{issued.certificate_id}"
+            headers["ETag"] = issued.etag
+        return Response(content=content, media_type=media_type, headers=headers)
+    except QueueFullError as e:
+        record_failure("queue_full")
+        raise queue_full_response(e)
+    except Exception as e:
+        record_failure("render")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/preview")
+async def preview_certificate(request: PreviewRequest):
+    """低分辨率的实时预览（默认600px宽的JPEG），可以在每次输入时调用
+
+    在预先缩小的模板上直接渲染，不编码PDF，也不使用结果缓存。
+    """
+    spec = find_template(request.templateId)
+    output_format = request.format or config.PREVIEW_SETTINGS["format"]
+    try:
+        resolve_output(spec.size, output_format, width=preview_width(spec, request.width))
+    except OutputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
-        # 生成证书并获取文件路径
-        certificate_path = generate_certificate(
+        content = await get_executor().run(
+            render_preview_bytes,
             student_name=request.studentName,
             ngo_signature=request.ngoSignature,
             ngo_name=request.ngoName,
             contents=request.contents,
-            date=request.date
-        )
-        
-        # 返回生成的证书文件
-        return FileResponse(
-            path=certificate_path,
-            filename="certificate.pdf",
-            media_type="application/pdf"
+            date=request.date,
+            template_id=request.templateId,
+            output_format=output_format,
+            quality=request.quality,
+            width=request.width
         )
+    except QueueFullError as e:
+        record_failure("queue_full")
+        raise queue_full_response(e)
     except Exception as e:
+        record_failure("render")
         raise HTTPException(status_code=500, detail=str(e))
+    
+    return Response(
+        content=content,
+        media_type=FORMATS[output_format][1],
+        headers={"Cache-Control": "no-store"}
+    )
 
-@app.post("/generate-certificate/debug")
-async def create_certificate_debug(
-    request: CertificateRequest, 
-    enable_debug: bool = Query(True, description="启用调试模式")
+async def read_upload(upload: UploadFile) -> bytes:
+    """读取上传的文件，超过 max_upload_size 时返回413"""
+    max_bytes = config.API_SETTINGS["max_upload_size"]
+    data = await upload.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"上传文件超过大小上限 {max_bytes} 字节")
+    return data
+
+async def register_uploaded_signature(data: bytes) -> Tuple[str, Tuple[int, int]]:
+    """在线程池中校验、注册签名，并按所有模板的签名尺寸（含默认预览尺寸）预先缩放"""
+    sizes = set()
+    for spec in get_registry().list():
+        max_size = spec.layout.get("ngo_signature", {}).get("max_size")
+        if not max_size:
+            continue
+        sizes.add(tuple(max_size))
+        try:
+            scale = resolve_scale(spec.size, preview_width(spec))
+        except OutputError:
+            continue
+        sizes.add(tuple(scale_layout({"ngo_signature": spec.layout["ngo_signature"]}, scale)["ngo_signature"]["max_size"]))
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, register_signature, data, sorted(sizes))
+    except SignatureError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/signatures", status_code=201)
+async def create_signature(request: Request):
+    """注册签名图片，返回可重复使用的签名ID
+
+    multipart/form-data 上传 file 字段，或 JSON {"image": "<base64 或 data URL>"}。
+    之后的请求使用 ngoSignature="signature:<id>"，服务器保存已解码、已缩放的签名，不再下载图片。
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="缺少上传的签名文件 file")
+        data = await read_upload(upload)
+    else:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="请求体必须是JSON或multipart/form-data")
+        if not isinstance(body, dict) or not isinstance(body.get("image"), str):
+            raise HTTPException(status_code=400, detail="缺少 image 字段（base64 或 data URL）")
+        try:
+            data = decode_data_url(body["image"])
+        except SignatureError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    sig_id, (width, height) = await register_uploaded_signature(data)
+    return {"signatureId": sig_id, "ngoSignature": SIGNATURE_PREFIX + sig_id, "width": width, "height": height}
+
+@app.post("/generate-certificates/batch")
+async def create_certificates_batch(
+    request: BatchCertificateRequest,
+    output: str = Query("zip", description="输出方式: zip（每人一个文件，格式见 format）或 pdf（合并为一个多页PDF）")
 ):
-    """调试模式生成证书，会记录详细的字体渲染信息"""
+    """批量生成证书，以ZIP流或合并PDF流的形式返回，每完成一张证书就写入响应"""
+    if output not in ("zip", "pdf"):
+        raise HTTPException(status_code=400, detail=f"不支持的输出方式: {output}")
     
-    # 设置环境变量启用调试模式
-    if enable_debug:
-        os.environ["DEBUG_FONT"] = "1"
+    item_count = request.item_count()
+    if item_count == 0:
+        raise HTTPException(status_code=400, detail="批量请求中没有证书")
+    if item_count > config.BATCH_SETTINGS["max_items"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次最多生成 {config.BATCH_SETTINGS['max_items']} 张证书"
+        )
     
-    debug_info = []
+    requests = list(request.iter_requests())
+    check_batch_templates(requests, output)
     
-    # 自定义处理器捕获调试信息
-    class DebugInfoHandler:
-        def write(self, message):
-            debug_info.append(message)
-        def flush(self):
-            pass
+    executor = get_executor()
+    try:
+        executor.check_capacity()
+    except QueueFullError as e:
+        record_failure("queue_full")
+        raise queue_full_response(e)
     
-    # 保存原始错误输出
-    original_stderr = os.sys.stderr
+    if output == "pdf":
+        return StreamingResponse(
+            stream_certificate_pdf(requests, executor),
+            media_type="application/pdf",
+            headers={"Content-Disposition": 'attachment; filename="certificates.pdf"'}
+        )
     
-    try:
-        # 替换为我们的处理器来捕获调试输出
-        if enable_debug:
-            os.sys.stderr = DebugInfoHandler()
-        
-        # 生成证书并获取文件路径
-        certificate_path = generate_certificate(
-            student_name=request.studentName,
-            ngo_signature=request.ngoSignature,
-            ngo_name=request.ngoName,
-            contents=request.contents,
-            date=request.date
+    return StreamingResponse(
+        stream_certificate_zip(requests, executor),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="certificates.zip"'}
+    )
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    request: BatchCertificateRequest,
+    output: str = Query("zip", description="输出方式: zip（每人一个文件，格式见 format）或 pdf（合并为一个多页PDF）")
+):
+    """提交异步证书任务，立即返回任务ID"""
+    if output not in OUTPUT_TYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的输出方式: {output}")
+    
+    item_count = request.item_count()
+    if item_count == 0:
+        raise HTTPException(status_code=400, detail="任务中没有证书")
+    if item_count > config.JOB_SETTINGS["max_items"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单个任务最多生成 {config.JOB_SETTINGS['max_items']} 张证书"
         )
+    
+    check_batch_templates(list(request.iter_requests()), output)
+    
+    job_id = await get_job_worker().submit(request, output)
+    return {"job_id": job_id, "status": "queued", "total": item_count}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查询任务状态和进度"""
+    job = await asyncio.get_running_loop().run_in_executor(None, get_job_worker().store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job_status(job)
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """下载已完成任务的结果文件"""
+    job = await asyncio.get_running_loop().run_in_executor(None, get_job_worker().store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if job["status"] != DONE:
+        raise HTTPException(status_code=409, detail=f"任务尚未完成，当前状态: {job['status']}")
+    if not job["result_path"] or not os.path.isfile(job["result_path"]):
+        raise HTTPException(status_code=410, detail="任务结果已不存在")
+    
+    suffix, media_type = OUTPUT_TYPES[job["output"]]
+    return FileResponse(job["result_path"], media_type=media_type, filename=f"certificates{suffix}")
+
+@app.api_route("/certificates/{certificate_id}", methods=["GET", "HEAD"])
+async def get_certificate(certificate_id: str, request: Request):
+    """下载已签发的证书，不重新渲染
+
+    支持强ETag的条件请求（If-None-Match → 304）和单个字节范围请求（Range → 206），
+    可以由CDN和浏览器缓存。
+    """
+    store = get_issued_store()
+    issued = store.get(certificate_id) if store is not None else None
+    if issued is None:
+        raise HTTPException(status_code=404, detail="证书不存在")
+    
+    headers = {
+        "ETag": issued.etag,
+        "Cache-Control": f"public, max-age={config.ISSUED_SETTINGS['max_age']}, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if etag_matches(request.headers.get("if-none-match"), issued.etag):
+        return Response(status_code=304, headers=headers)
+    
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    # If-Range 与当前ETag不一致时忽略 Range，返回完整内容
+    if if_range is None or if_range.strip() == issued.etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), issued.size)
+        except RangeNotSatisfiable:
+            headers["Content-Range"] = f"bytes */{issued.size}"
+            return Response(status_code=416, headers=headers)
+    
+    if issued.path is None:
+        # 存储后端没有本地文件时从存储读取内容（对象存储只读取请求的范围）
+        start, end = byte_range if byte_range is not None else (0, issued.size - 1)
+        headers["Content-Disposition"] = f'attachment; filename="{issued.filename}"'
+        headers["Content-Length"] = str(end - start + 1)
+        body = b""
+        if request.method != "HEAD":
+            body = await asyncio.get_running_loop().run_in_executor(None, store.read_range, issued, start, end)
+            if body is None:
+                raise HTTPException(status_code=404, detail="证书不存在")
+        if byte_range is None:
+            return Response(body, media_type=issued.media_type, headers=headers)
+        headers["Content-Range"] = f"bytes {start}-{end}/{issued.size}"
+        return Response(body, status_code=206, media_type=issued.media_type, headers=headers)
+    
+    options = dict(headers=headers, media_type=issued.media_type, filename=issued.filename, method=request.method)
+    if byte_range is not None:
+        return PartialFileResponse(issued.path, byte_range[0], byte_range[1], issued.size, **options)
+    return FileResponse(issued.path, **options)
+
+@app.post("/generate-certificate/debug")
+async def create_certificate_debug(
+    request: CertificateRequest, 
+    enable_debug: bool = Query(True, description="启用调试模式")
+):
+    """调试模式生成证书，返回本次渲染的字体、文本绘制和各阶段耗时记录
+
+    追踪只作用于当前请求，不影响同时在处理的其他请求。
+    """
+    output_format = check_output(request, find_template(request.templateId))
+    try:
+        with start_trace() if enable_debug else nullcontext() as trace:
+            
+            # 在渲染池中生成证书（内存中完成，不写临时文件），不使用结果缓存
+            content = await get_executor().run(
+                render_certificate_bytes,
+                student_name=request.studentName,
+                ngo_signature=request.ngoSignature,
+                ngo_name=request.ngoName,
+                contents=request.contents,
+                date=request.date,
+                engine=request.engine,
+                template_id=request.templateId,
+                output_format=output_format,
+                quality=request.quality,
+                width=request.width,
+                dpi=request.dpi
+            )
         
-        # 返回生成的证书文件和调试信息
+        # 返回证书信息和调试信息
         response_data = {
             "message": "证书生成成功",
-            "certificate_path": certificate_path,
-            "debug_info": debug_info if enable_debug else []
+            "format": output_format,
+            "certificate_size": len(content),
+            "debug_info": trace.timeline() if trace is not None else []
         }
         
         return JSONResponse(content=response_data)
     
+    except QueueFullError as e:
+        raise queue_full_response(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
-    finally:
-        # 恢复原始错误输出
-        if enable_debug:
-            os.sys.stderr = original_stderr
-        
-        # 重置环境变量
-        if "DEBUG_FONT" in os.environ:
-            del os.environ["DEBUG_FONT"]
+
+@app.get("/templates")
+async def list_templates():
+    """列出已加载的模板及其尺寸和字段，以及加载失败的模板"""
+    registry = get_registry()
+    return {
+        "templates": [
+            {"id": spec.template_id, "width": spec.size[0], "height": spec.size[1], "fields": sorted(spec.layout)}
+            for spec in registry.list()
+        ],
+        "errors": registry.errors
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """以Prometheus文本格式导出运行指标"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/cache-stats")
+async def get_cache_stats():
+    """返回证书结果缓存的命中/未命中计数"""
+    result_cache = get_result_cache()
+    if result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **result_cache.stats()}
 
 @app.get("/font-info")
 async def get_font_info():
     """返回关于可用字体的信息"""
-    import config
     from certificate.generator import get_font
     
     # 测试字体大小为40
     test_size = 40
     
-    # 设置调试模式
-    os.environ["DEBUG_FONT"] = "1"
-    
-    debug_info = []
-    
-    # 自定义处理器捕获调试信息
-    class DebugInfoHandler:
-        def write(self, message):
-            debug_info.append(message)
-        def flush(self):
-            pass
-    
-    # 保存原始错误输出
-    original_stderr = os.sys.stderr
-    
-    try:
-        # 替换为我们的处理器来捕获调试输出
-        os.sys.stderr = DebugInfoHandler()
-        
+    with start_trace() as trace:
         # 获取字体
-        font = get_font(config.DEFAULT_FONT, test_size)
-        
-        # 收集系统字体信息
-        font_info = {
-            "default_font": config.DEFAULT_FONT,
-            "font_dir": config.FONT_DIR,
-            "available_fonts": []
-        }
-        
-        # 检查系统字体
-        system_fonts = [
-            "arial.ttf", "simsun.ttc", "simhei.ttf", "msyh.ttf",
-            "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc",
-            "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc"
-        ]
-        
-        for font_name in system_fonts:
-            try:
-                test_font = get_font(font_name, test_size)
-                if test_font:
-                    font_info["available_fonts"].append(font_name)
-            except Exception:
-                pass
-        
-        # 返回字体信息和调试信息
-        return {
-            "font_info": font_info,
-            "debug_info": debug_info
-        }
+        get_font(default_font_path(), test_size)
     
-    finally:
-        # 恢复原始错误输出
-        os.sys.stderr = original_stderr
-        
-        # 重置环境变量
-        if "DEBUG_FONT" in os.environ:
-            del os.environ["DEBUG_FONT"]
+    # 收集系统字体信息（来自启动时建立的字体索引，不再逐个加载探测）
+    font_index = discover_fonts()
+    font_info = {
+        "default_font": default_font_path(),
+        "font_dir": config.FONT_DIR,
+        "available_fonts": [
+            font_name for font_name in config.FONT_CANDIDATES
+            if resolve_font_path(font_name)
+        ],
+        "indexed_fonts": len(font_index)
+    }
+    
+    # 返回字体信息和调试信息
+    return {
+        "font_info": font_info,
+        "debug_info": trace.timeline()
+    }
 
 if __name__ == "__main__":
     # 获取PORT环境变量，用于Cloud Run部署
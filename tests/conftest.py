@@ -0,0 +1,31 @@
+"""
+测试公共设置：把项目根目录加入导入路径，提供测试用的字体和图片
+"""
+import os
+import sys
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def make_png(size=(400, 200), color=(20, 20, 120, 255)) -> bytes:
+    """生成一张PNG图片的内容"""
+    buffer = BytesIO()
+    Image.new("RGBA", size, color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def font_path():
+    """默认字体路径，系统中没有可用字体时跳过测试"""
+    from certificate.fonts import default_font_path
+
+    path = default_font_path()
+    if path is None:
+        pytest.skip("没有可用的字体")
+    return path
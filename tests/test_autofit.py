@@ -0,0 +1,53 @@
+"""
+单行字段自动缩小字号：宽度限制不超出模板
+"""
+import json
+import os
+
+import config
+from certificate.generator import get_field_font, get_font, get_text_dimensions
+from certificate.linebreak import clear_advance_cache, fit_font_size, text_advance
+from certificate.registry import validate_layout
+
+SMALL_SIZE = (842, 595)
+with open(os.path.join(config.TEMPLATE_DIR, "certificate_template.json"), encoding="utf-8") as f:
+    SMALL_LAYOUT = json.load(f)
+
+LONG_NAME = "Maximiliana Alexandrina Featherstonehaugh-Wolfeschlegel"
+
+
+def test_inherited_max_width_is_clamped_to_template():
+    layout = validate_layout(dict(SMALL_LAYOUT, ngo_name={"position": [600, 470], "font_size": 26}), SMALL_SIZE)
+    # 居中于 x=600：右侧只剩 242px
+    assert layout["ngo_name"]["max_width"] == 484
+    layout = validate_layout(dict(SMALL_LAYOUT, date={"position": [100, 430], "max_width": 2000, "align": "left"}),
+                             SMALL_SIZE)
+    assert layout["date"]["max_width"] == 742
+
+
+def test_long_name_fits_small_template(font_path):
+    layout = validate_layout(SMALL_LAYOUT, SMALL_SIZE)
+    field = layout["student_name"]
+    font = get_field_font(font_path, field, LONG_NAME, field["font_size"])
+    assert font.size < field["font_size"]
+    assert font.size >= field["min_font_size"]
+
+    width, _ = get_text_dimensions(LONG_NAME, font)
+    assert width <= field["max_width"]
+    x = field["position"][0]
+    assert x - width // 2 >= 0 and x + width - width // 2 <= SMALL_SIZE[0]
+
+
+def test_fit_loads_only_the_measured_sizes(font_path):
+    clear_advance_cache()
+    requested = []
+
+    def font_for_size(size):
+        requested.append(size)
+        return get_font(font_path, size)
+
+    size = fit_font_size(LONG_NAME, 600, 100, 10, font_for_size)
+    # 只加载最大字号（量宽度）和估算字号附近的字体（核对），不逐个尝试候选字号
+    assert len(set(requested)) <= 4
+    assert text_advance(LONG_NAME, get_font(font_path, size)) <= 600
+    assert text_advance(LONG_NAME, get_font(font_path, size + 1)) > 600
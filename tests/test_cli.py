@@ -0,0 +1,71 @@
+"""
+离线批量生成：无效记录写入 errors.jsonl，不中断整个批次
+"""
+import json
+import os
+
+from certificate import output
+from certificate.cli import CHECKPOINT_VERSION, iter_records, main, prepare_record, run
+
+GOOD = {"studentName": "Ada", "ngoName": "NGO", "contents": "Contents", "date": "2025"}
+DEFAULTS = {"format": "jpeg", "quality": None, "width": 200, "dpi": None, "engine": None}
+
+
+def write_jsonl(path, lines):
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(line + "\n")
+
+
+def read_errors(output_dir):
+    with open(os.path.join(output_dir, "errors.jsonl"), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_non_object_lines_are_errors(tmp_path):
+    path = str(tmp_path / "names.jsonl")
+    write_jsonl(path, ["[1, 2]", '"x"', "3", "{bad json"])
+    records = list(iter_records(path, "jsonl", set(), 0))
+    assert [index for index, _ in records] == [0, 1, 2, 3]
+    assert all("__error__" in fields for _, fields in records)
+    assert records[0][1]["__error__"] == "每行必须是JSON对象"
+
+
+def test_batch_and_resume_past_non_object_line(tmp_path, font_path):
+    path = str(tmp_path / "names.jsonl")
+    output_dir = str(tmp_path / "out")
+    write_jsonl(path, [json.dumps(GOOD), "[1, 2]", '"x"', "3", json.dumps(dict(GOOD, studentName="Alan"))])
+
+    checkpoint = run(path, output_dir, "jsonl", workers=1, window=2, defaults=DEFAULTS, report_interval=60)
+    assert (checkpoint.succeeded, checkpoint.failed, checkpoint.watermark) == (2, 3, 5)
+    assert [error["index"] for error in read_errors(output_dir)] == [1, 2, 3]
+
+    # 检查点停在无效的行之前（例如上次运行在这里中断），继续运行不会在同一条记录上崩溃
+    with open(os.path.join(output_dir, ".checkpoint.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": CHECKPOINT_VERSION, "input": path, "watermark": 1, "done": [],
+                   "succeeded": 1, "failed": 0}, f)
+    checkpoint = run(path, output_dir, "jsonl", workers=1, window=2, defaults=DEFAULTS, report_interval=60)
+    assert (checkpoint.succeeded, checkpoint.failed, checkpoint.watermark) == (2, 3, 5)
+    assert len([name for name in os.listdir(output_dir) if name.endswith(".jpg")]) == 2
+
+
+def test_render_failure_records_student_name(tmp_path, font_path):
+    path = str(tmp_path / "names.jsonl")
+    output_dir = str(tmp_path / "out")
+    write_jsonl(path, [json.dumps(GOOD), json.dumps(dict(GOOD, studentName="Alan"))])
+    # 第二条记录的临时文件位置被目录占用，渲染在子进程中失败
+    _, blocked = prepare_record(1, dict(GOOD, studentName="Alan"), dict(DEFAULTS), output_dir)
+    os.makedirs(blocked + ".tmp")
+
+    checkpoint = run(path, output_dir, "jsonl", workers=1, window=2, defaults=DEFAULTS, report_interval=60)
+    assert (checkpoint.succeeded, checkpoint.failed) == (1, 1)
+    [error] = read_errors(output_dir)
+    assert error["index"] == 1 and error["studentName"] == "Alan"
+
+
+def test_unsupported_format_is_an_error_exit(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(output.features, "check", lambda feature: False)
+    path = str(tmp_path / "names.jsonl")
+    write_jsonl(path, [json.dumps(GOOD)])
+    assert main([path, "-o", str(tmp_path / "out"), "--format", "webp"]) == 2
+    assert "WebP" in capsys.readouterr().err
@@ -0,0 +1,53 @@
+"""
+渲染执行器：正在渲染和排队的请求都达到上限时返回503和 Retry-After
+"""
+import asyncio
+import threading
+
+import httpx
+
+import main
+from certificate.executor import RenderExecutor
+
+REQUEST = {"ngoName": "NGO", "contents": "Contents", "date": "2025", "format": "pdf"}
+
+
+def test_full_queue_returns_503_with_retry_after(monkeypatch):
+    executor = RenderExecutor(max_workers=1, max_queue=1, retry_after=7)
+    release = threading.Event()
+
+    def render(**kwargs):
+        release.wait(10)
+        return b"%PDF-" + kwargs["student_name"].encode()
+
+    monkeypatch.setattr(main, "get_executor", lambda: executor)
+    monkeypatch.setattr(main, "render_certificate_bytes", render)
+    monkeypatch.setattr(main, "get_result_cache", lambda: None)
+    monkeypatch.setattr(main, "get_issued_store", lambda: None)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            def post(name):
+                return asyncio.ensure_future(client.post("/generate-certificate", json=dict(REQUEST, studentName=name)))
+
+            # 一个正在渲染，一个排队等待
+            running, queued = post("Ada"), post("Alan")
+            for _ in range(200):
+                if executor.in_flight == 1 and executor.waiting == 1:
+                    break
+                await asyncio.sleep(0.01)
+            assert (executor.in_flight, executor.waiting) == (1, 1)
+
+            rejected = await client.post("/generate-certificate", json=dict(REQUEST, studentName="Grace"))
+            release.set()
+            return rejected, await running, await queued
+
+    try:
+        rejected, running, queued = asyncio.run(scenario())
+    finally:
+        release.set()
+        executor.shutdown()
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "7"
+    assert (running.status_code, queued.status_code) == (200, 200)
+    assert queued.content == b"%PDF-Alan"
@@ -0,0 +1,83 @@
+"""
+已签发证书：POST 的响应体、ETag 和 GET /certificates/{id} 的内容一致
+"""
+import hashlib
+import itertools
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import config
+import main
+from certificate import issued
+from certificate.issued import IssuedStore
+from certificate.result_cache import ResultCache
+from certificate.storage import LocalStorage
+
+REQUEST = {"studentName": "Ada", "ngoName": "NGO", "contents": "Contents", "date": "2025", "format": "pdf"}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(issued, "_store", IssuedStore(LocalStorage(str(tmp_path / "storage"))))
+    # 每次请求都使用新的结果缓存，相当于缓存条目已被淘汰
+    monkeypatch.setattr(main, "get_result_cache", lambda: ResultCache(memory_bytes=1 << 20))
+    # 重新渲染得到不同的字节（例如PDF中的创建时间）
+    counter = itertools.count()
+    monkeypatch.setattr(main, "render_certificate_bytes", lambda **kwargs: b"%%PDF-render-%d" % next(counter))
+    return TestClient(main.app)
+
+
+def etag_of(content: bytes) -> str:
+    return '"%s"' % hashlib.sha256(content).hexdigest()[:32]
+
+
+def test_body_etag_and_get_agree_after_rerender(client):
+    first = client.post("/generate-certificate", json=REQUEST)
+    second = client.post("/generate-certificate", json=REQUEST)
+    assert first.status_code == second.status_code == 200
+
+    certificate_id = first.headers["X-Certificate-Id"]
+    assert second.headers["X-Certificate-Id"] == certificate_id
+    for response in (first, second):
+        assert response.headers["ETag"] == etag_of(response.content)
+    # 第二次请求返回已签发的内容，而不是重新渲染的内容
+    assert second.content == first.content
+
+    fetched = client.get(second.headers["Content-Location"])
+    assert fetched.status_code == 200
+    assert fetched.content == second.content
+    assert fetched.headers["ETag"] == second.headers["ETag"]
+
+
+class _RacingStore:
+    """get 总是未命中：模拟另一个请求在本次渲染期间保存了同一个ID"""
+
+    def __init__(self, store):
+        self._store = store
+
+    def get(self, cert_id):
+        return None
+
+    def __getattr__(self, name):
+        return getattr(self._store, name)
+
+
+def test_concurrent_issue_returns_first_stored_content(client, monkeypatch):
+    first = client.post("/generate-certificate", json=REQUEST)
+    monkeypatch.setattr(main, "get_issued_store", lambda: _RacingStore(issued._store))
+    second = client.post("/generate-certificate", json=REQUEST)
+
+    assert second.content == first.content
+    assert second.headers["ETag"] == first.headers["ETag"] == etag_of(second.content)
+
+
+def test_issued_certificates_are_written_once(monkeypatch, tmp_path):
+    monkeypatch.setitem(config.RESULT_CACHE_SETTINGS, "disk_dir", str(tmp_path / "result_cache"))
+    monkeypatch.setitem(config.ISSUED_SETTINGS, "enabled", True)
+    assert ResultCache.from_config().stats()["disk_entries"] == 0
+    assert not os.path.exists(tmp_path / "result_cache")
+
+    monkeypatch.setitem(config.ISSUED_SETTINGS, "enabled", False)
+    assert ResultCache.from_config()._disk is not None
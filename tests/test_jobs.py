@@ -0,0 +1,104 @@
+"""
+异步任务队列：租约、重新排队和过期清理
+"""
+import asyncio
+import os
+import time
+
+import pytest
+
+from certificate.executor import RenderExecutor
+from certificate.jobs import DONE, QUEUED, RUNNING, JobStore, JobWorker
+from certificate.models import BatchCertificateRequest
+
+REQUEST = BatchCertificateRequest(studentNames=["Ada", "Alan"], ngoName="NGO", contents="Contents", date="2025")
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "jobs.sqlite3")
+
+
+def test_live_lease_is_not_requeued(db_path):
+    # 两个进程共用同一个数据库
+    first, second = JobStore(db_path), JobStore(db_path)
+    job_id = first.create(REQUEST, "zip")
+    assert first.claim_next("worker-a", lease=60)["id"] == job_id
+
+    assert second.requeue_expired() == 0
+    assert second.claim_next("worker-b", lease=60) is None
+    assert second.get(job_id)["owner"] == "worker-a"
+
+
+def test_expired_lease_is_requeued(db_path):
+    first, second = JobStore(db_path), JobStore(db_path)
+    job_id = first.create(REQUEST, "zip")
+    first.claim_next("worker-a", lease=0.01)
+    time.sleep(0.05)
+
+    assert second.requeue_expired() == 1
+    assert second.claim_next("worker-b", lease=60)["id"] == job_id
+    # 原持有者已失去租约，不能续期，也不能写入结果
+    assert not first.renew_lease(job_id, "worker-a", 60)
+    assert not first.finish(job_id, "/tmp/result.zip", "worker-a")
+    assert second.get(job_id)["status"] == RUNNING
+    assert second.finish(job_id, "/tmp/result.zip", "worker-b")
+    assert second.get(job_id)["status"] == DONE
+
+
+def test_release_requeues_own_jobs_only(db_path):
+    store = JobStore(db_path)
+    mine = store.create(REQUEST, "zip")
+    other = store.create(REQUEST, "zip")
+    store.claim_next("worker-a", lease=60)
+    store.claim_next("worker-b", lease=60)
+
+    assert store.release("worker-a") == 1
+    assert store.get(mine)["status"] == QUEUED
+    assert store.get(other)["status"] == RUNNING
+
+
+def test_cleanup_removes_expired_jobs_and_files(db_path, tmp_path):
+    result_dir = str(tmp_path / "results")
+    worker = JobWorker(JobStore(db_path), result_dir, executor=RenderExecutor(max_workers=1), result_ttl=60)
+    store = worker.store
+
+    old = store.create(REQUEST, "zip")
+    store.claim_next(worker.worker_id, lease=60)
+    old_path = worker.result_path(old, "zip")
+    open(old_path, "wb").close()
+    store.finish(old, old_path, worker.worker_id)
+
+    queued = store.create(REQUEST, "zip")
+    leftover = os.path.join(result_dir, "deadbeef.zip.tmp")
+    open(leftover, "wb").close()
+    active = os.path.join(result_dir, queued + ".zip.tmp")
+    open(active, "wb").close()
+    for path in (old_path, leftover, active):
+        os.utime(path, (0, 0))
+
+    assert worker.cleanup(now=time.time() + 120) == 2
+    assert store.get(old) is None
+    assert not os.path.exists(old_path) and not os.path.exists(leftover)
+    # 排队中任务的文件保留
+    assert store.get(queued)["status"] == QUEUED
+    assert os.path.exists(active)
+
+
+def test_worker_runs_job_and_releases_on_stop(db_path, tmp_path, font_path):
+    async def scenario():
+        executor = RenderExecutor(max_workers=2)
+        worker = JobWorker(JobStore(db_path), str(tmp_path / "results"), executor=executor, poll_interval=0.05)
+        worker.start()
+        job_id = await worker.submit(REQUEST, "zip")
+        for _ in range(200):
+            if worker.store.get(job_id)["status"] == DONE:
+                break
+            await asyncio.sleep(0.05)
+        await worker.stop()
+        executor.shutdown()
+        return worker.store.get(job_id)
+
+    job = asyncio.run(scenario())
+    assert job["status"] == DONE and job["rendered"] == 2
+    assert job["owner"] is None and os.path.isfile(job["result_path"])
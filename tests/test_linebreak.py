@@ -0,0 +1,86 @@
+"""
+文本换行：中文按字符断行并遵守行首/行尾禁则，西文按单词断行
+"""
+import pytest
+
+from certificate.linebreak import NO_LINE_END, NO_LINE_START, clear_advance_cache, wrap_lines
+
+
+class _MonoFont:
+    """每个字符宽10px的等宽字体，结果不依赖系统字体"""
+
+    def getlength(self, text):
+        return 10.0 * len(text)
+
+
+FONT = _MonoFont()
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    clear_advance_cache()
+    yield
+    clear_advance_cache()
+
+
+def assert_valid(lines, max_width):
+    for line in lines:
+        assert FONT.getlength(line) <= max_width
+        assert line[0] not in NO_LINE_START, line
+        assert line[-1] not in NO_LINE_END, line
+
+
+def test_cjk_breaks_between_characters():
+    assert wrap_lines("一二三四五六七", FONT, 30) == ["一二三", "四五六", "七"]
+
+
+def test_no_line_start_punctuation_moves_previous_character():
+    # 直接按宽度断行会得到以“。”开头的第二行
+    lines = wrap_lines("一二三四。五", FONT, 40)
+    assert lines == ["一二三", "四。五"]
+    assert_valid(lines, 40)
+
+
+def test_consecutive_closing_punctuation_stays_together():
+    lines = wrap_lines("一二三四」。五", FONT, 40)
+    assert lines == ["一二三", "四」。五"]
+    assert_valid(lines, 40)
+
+
+def test_no_line_end_punctuation_moves_to_next_line():
+    # 直接按宽度断行会得到以“「”结尾的第一行
+    lines = wrap_lines("一二三「四五」", FONT, 40)
+    assert lines == ["一二三", "「四五」"]
+    assert_valid(lines, 40)
+
+
+def test_mixed_latin_and_cjk():
+    # 西文单词不拆开，与相邻汉字之间不插入空格
+    lines = wrap_lines("Hello世界 and more", FONT, 80)
+    assert lines == ["Hello世界", "and more"]
+    assert wrap_lines("感谢Alice的参与", FONT, 70) == ["感谢Alice", "的参与"]
+
+
+def test_spaces_at_line_edges_are_dropped():
+    assert wrap_lines("  aa   bb  ", FONT, 30) == ["aa", "bb"]
+
+
+def test_overlong_word_is_split_by_character():
+    lines = wrap_lines("internationalization is", FONT, 100)
+    assert lines == ["internatio", "nalization", "is"]
+
+
+def test_overlong_token_after_cjk():
+    lines = wrap_lines("证书ABCDEFGHIJKLMNOP。", FONT, 60)
+    assert lines == ["证书", "ABCDEF", "GHIJKL", "MNOP。"]
+    assert all(FONT.getlength(line) <= 60 for line in lines)
+
+
+def test_newlines_force_breaks():
+    assert wrap_lines("一二\n三四五六", FONT, 30) == ["一二", "三四五", "六"]
+
+
+def test_cached_result_is_a_copy():
+    lines = wrap_lines("一二三四", FONT, 20)
+    lines.append("changed")
+    assert wrap_lines("一二三四", FONT, 20) == ["一二", "三四"]
@@ -0,0 +1,35 @@
+"""
+合并PDF：所有页面共享一个背景图像对象，页面尺寸与单张证书相同
+"""
+import re
+from io import BytesIO
+
+import pytest
+
+import config
+from certificate.generator import generate_certificate, generate_merged_certificates
+
+RECORD = {"ngo_name": "NGO", "contents": "Contents", "date": "2025"}
+
+
+def media_boxes(pdf: bytes):
+    return [tuple(round(float(v), 1) for v in box)
+            for box in re.findall(rb"/MediaBox \[\s*0 0 ([\d.]+) ([\d.]+)\s*\]", pdf)]
+
+
+@pytest.mark.parametrize("base_dpi", [100.0, 200.0])
+def test_pages_share_one_background(font_path, monkeypatch, base_dpi):
+    monkeypatch.setitem(config.OUTPUT_SETTINGS, "base_dpi", base_dpi)
+    names = ["Ada", "Alan", "Grace"]
+    merged = BytesIO()
+    assert generate_merged_certificates([dict(RECORD, student_name=name) for name in names], merged) == 3
+    pdf = merged.getvalue()
+
+    # 背景JPEG只嵌入一次，每页都引用同一个对象
+    assert pdf.count(b"/Filter /DCTDecode") == 1
+    backgrounds = re.findall(rb"/Bg (\d+) 0 R", pdf)
+    assert len(backgrounds) == 3 and len(set(backgrounds)) == 1
+
+    single = BytesIO()
+    generate_certificate(student_name="Ada", output=single, engine="raster", output_format="pdf", **RECORD)
+    assert media_boxes(pdf) == media_boxes(single.getvalue()) * 3
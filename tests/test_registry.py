@@ -0,0 +1,63 @@
+"""
+模板注册表：后台检查与布局校验
+"""
+import json
+import os
+import time
+
+from PIL import Image
+
+import config
+from certificate.registry import TemplateRegistry
+
+with open(os.path.join(config.TEMPLATE_DIR, "certificate_template.json"), encoding="utf-8") as f:
+    SMALL_LAYOUT = json.load(f)
+
+
+def write_template(directory, template_id="small", size=(842, 595), layout=None):
+    Image.new("RGB", size, "white").save(os.path.join(directory, f"{template_id}.png"))
+    layout = dict(SMALL_LAYOUT, **(layout or {}))
+    with open(os.path.join(directory, f"{template_id}.json"), "w", encoding="utf-8") as f:
+        json.dump(layout, f)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_get_reads_snapshot_without_checking_files(tmp_path, monkeypatch):
+    write_template(str(tmp_path))
+    registry = TemplateRegistry(str(tmp_path), poll_interval=0.01)
+    assert registry.get("small") is not None
+
+    def fail_refresh(*args, **kwargs):
+        raise AssertionError("请求处理中不应检查模板文件")
+
+    monkeypatch.setattr(registry, "refresh", fail_refresh)
+    time.sleep(0.05)
+    assert registry.get("small") is not None
+    assert [spec.template_id for spec in registry.list()] == ["default", "small"]
+
+
+def test_background_thread_reloads_changes(tmp_path):
+    write_template(str(tmp_path))
+    registry = TemplateRegistry(str(tmp_path), poll_interval=0.05)
+    registry.refresh()
+    registry.start()
+    try:
+        write_template(str(tmp_path), layout={"student_name": {"position": [100, 100], "font_size": 30}})
+        # 修改时间的精度可能较粗，确保签名变化
+        layout_path = os.path.join(str(tmp_path), "small.json")
+        os.utime(layout_path, (time.time() + 10, time.time() + 10))
+        assert wait_for(lambda: registry.get("small").layout["student_name"]["position"] == (100, 100))
+
+        write_template(str(tmp_path), template_id="added")
+        assert wait_for(lambda: registry.get("added") is not None)
+    finally:
+        registry.stop()
+    assert registry._poller is None
@@ -0,0 +1,104 @@
+"""
+结果缓存：并发的相同请求只渲染一次，内存层和磁盘层按字节数淘汰
+"""
+import asyncio
+
+import pytest
+
+from certificate.result_cache import DiskTier, ResultCache
+
+
+def counting_render(data, delay=0.05):
+    calls = []
+
+    async def render():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return data
+
+    return render, calls
+
+
+@pytest.mark.parametrize("with_disk", [False, True])
+def test_concurrent_same_key_renders_once(tmp_path, with_disk):
+    cache = ResultCache(1 << 20, str(tmp_path / "disk") if with_disk else None, 1 << 20)
+    render, calls = counting_render(b"certificate")
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_render("key", render) for _ in range(10)))
+
+    assert asyncio.run(scenario()) == [b"certificate"] * 10
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"]) == (1, 9)
+
+    # 完成后的请求命中内存层
+    assert asyncio.run(cache.get_or_render("key", render)) == b"certificate"
+    assert len(calls) == 1 and cache.stats()["memory_hits"] == 1
+
+
+def test_failure_reaches_all_waiters_and_is_not_cached():
+    cache = ResultCache(1 << 20)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        raise RuntimeError("render failed")
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_render("key", failing) for _ in range(3)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(calls) == 1
+    render, _ = counting_render(b"ok", delay=0)
+    assert asyncio.run(cache.get_or_render("key", render)) == b"ok"
+
+
+def test_memory_tier_evicts_least_recently_used_by_bytes():
+    cache = ResultCache(memory_bytes=100)
+
+    async def scenario():
+        for key in ("a", "b"):
+            await cache.get_or_render(key, counting_render(key.encode() * 40, delay=0)[0])
+        # 使用过的 a 保留，最久未使用的 b 被淘汰
+        await cache.get_or_render("a", counting_render(b"", delay=0)[0])
+        await cache.get_or_render("c", counting_render(b"c" * 40, delay=0)[0])
+
+    asyncio.run(scenario())
+    stats = cache.stats()
+    assert stats["memory_bytes"] <= 100 and stats["memory_entries"] == 2
+    assert cache._memory.get("a") == b"a" * 40
+    assert cache._memory.get("b") is None
+
+
+def test_disk_tier_evicts_by_bytes_and_restores_order(tmp_path):
+    directory = str(tmp_path / "disk")
+    disk = DiskTier(directory, max_bytes=100)
+    disk.put("k1", b"1" * 40)
+    disk.put("k2", b"2" * 40)
+    assert disk.get("k1") == b"1" * 40
+    disk.put("k3", b"3" * 40)
+
+    assert disk.get("k2") is None
+    assert len(disk) == 2 and disk.total_bytes == 80
+
+    # 重启后按文件的使用时间恢复，总大小仍受上限约束
+    reopened = DiskTier(directory, max_bytes=40)
+    assert len(reopened) == 1
+    assert reopened.get("k3") == b"3" * 40
+
+
+def test_disk_hit_after_memory_eviction(tmp_path):
+    cache = ResultCache(memory_bytes=50, disk_dir=str(tmp_path / "disk"), disk_bytes=1 << 20)
+    render_a, calls = counting_render(b"a" * 40, delay=0)
+
+    async def scenario():
+        await cache.get_or_render("a", render_a)
+        await cache.get_or_render("b", counting_render(b"b" * 40, delay=0)[0])
+        return await cache.get_or_render("a", render_a)
+
+    assert asyncio.run(scenario()) == b"a" * 40
+    assert len(calls) == 1 and cache.stats()["disk_hits"] == 1
@@ -0,0 +1,58 @@
+"""
+已注册签名的保存：过期和超过总大小上限的签名被清理
+"""
+import os
+import time
+
+import pytest
+
+from certificate import signatures
+from certificate.signatures import SignatureError, SignatureStore, check_signature_reference
+from certificate.storage import StorageJanitor
+from conftest import make_png
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = SignatureStore(str(tmp_path / "signatures"))
+    monkeypatch.setattr(signatures, "_store", store)
+    return store
+
+
+def test_expired_signature_is_removed(store):
+    sig_id = store.put(make_png())
+    check_signature_reference("signature:" + sig_id)
+
+    janitor = StorageJanitor(store.storage, ttl=60, max_bytes=0)
+    assert janitor.sweep(now=time.time())["expired"] == 0
+    assert janitor.sweep(now=time.time() + 120)["expired"] == 1
+    assert not store.exists(sig_id)
+    with pytest.raises(SignatureError):
+        store.get(sig_id)
+    with pytest.raises(SignatureError):
+        check_signature_reference("signature:" + sig_id)
+
+
+def test_reregistering_restarts_ttl(store):
+    data = make_png()
+    sig_id = store.put(data)
+    os.utime(store.storage.local_path(sig_id), (0, 0))
+    assert store.put(data) == sig_id
+
+    janitor = StorageJanitor(store.storage, ttl=60, max_bytes=0)
+    assert janitor.sweep()["expired"] == 0
+    assert store.get(sig_id) == data
+
+
+def test_total_size_is_capped(store):
+    ids = []
+    for i in range(5):
+        ids.append(store.put(make_png(color=(i, 0, 0, 255))))
+        os.utime(store.storage.local_path(ids[-1]), (1000 + i, 1000 + i))
+    max_bytes = sum(store.storage.stat(sig_id).size for sig_id in ids[-2:])
+
+    result = StorageJanitor(store.storage, ttl=0, max_bytes=max_bytes).sweep()
+    assert result["evicted"] == 3
+    # 最久未注册的先删除
+    assert [store.exists(sig_id) for sig_id in ids] == [False, False, False, True, True]
+
@@ -0,0 +1,115 @@
+"""
+签名图片下载：使用本地 http.server 作为签名图片服务器
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import config
+from certificate import signatures
+from certificate.signatures import SignatureError, get_signature_image
+from conftest import make_png
+
+PNG = make_png()
+ETAG = '"sig-v1"'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        _Handler.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.path == "/sig.png":
+            if self.headers.get("If-None-Match") == ETAG:
+                self.send_response(304)
+                self.send_header("ETag", ETAG)
+                self.end_headers()
+                return
+            self._send(PNG, {"ETag": ETAG})
+        elif self.path == "/big.png":
+            self._send(b"x" * 4096)
+        elif self.path == "/chunked.png":
+            # 不带 Content-Length，边读边检查大小
+            self.send_response(200)
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for _ in range(8):
+                self.wfile.write(b"x" * 1024)
+        elif self.path == "/slow.png":
+            time.sleep(1.0)
+            self._send(PNG)
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def _send(self, body, headers=None):
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端超时或超过大小上限时主动断开连接，忽略写入失败
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = _Server(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    _Handler.requests = []
+    signatures.clear_signature_cache()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+    signatures.clear_signature_cache()
+
+
+def test_download_and_cache(server):
+    image = get_signature_image(f"{server}/sig.png", (300, 150))
+    assert image.size == (300, 150)
+    # 在 revalidate_after 内直接使用缓存，不再请求
+    assert get_signature_image(f"{server}/sig.png", (300, 150)) is image
+    assert len(_Handler.requests) == 1
+
+
+def test_revalidate_with_304(server, monkeypatch):
+    monkeypatch.setitem(config.SIGNATURE_SETTINGS, "revalidate_after", 0)
+    image = get_signature_image(f"{server}/sig.png", (300, 150))
+    assert get_signature_image(f"{server}/sig.png", (300, 150)) is image
+    assert _Handler.requests == [("/sig.png", None), ("/sig.png", ETAG)]
+
+
+def test_size_limit(server, monkeypatch):
+    monkeypatch.setitem(config.API_SETTINGS, "max_upload_size", 2048)
+    with pytest.raises(SignatureError, match="过大"):
+        get_signature_image(f"{server}/big.png", (300, 150))
+    with pytest.raises(SignatureError, match="大小上限"):
+        get_signature_image(f"{server}/chunked.png", (300, 150))
+
+
+def test_read_timeout(server, monkeypatch):
+    monkeypatch.setitem(config.SIGNATURE_SETTINGS, "read_timeout", 0.2)
+    started = time.monotonic()
+    with pytest.raises(SignatureError, match="无法下载图片"):
+        get_signature_image(f"{server}/slow.png", (300, 150))
+    assert time.monotonic() - started < 1.0
+
+
+def test_http_error(server):
+    with pytest.raises(SignatureError, match="404"):
+        get_signature_image(f"{server}/missing.png", (300, 150))
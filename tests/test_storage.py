@@ -0,0 +1,130 @@
+"""
+渲染结果存储：本地目录和对象存储后端的读写、删除和后台清理
+"""
+import errno
+import os
+import time
+
+import pytest
+
+from certificate import storage as storage_module
+from certificate.issued import IssuedStore
+from certificate.storage import LocalStorage, MemoryObjectClient, ObjectStorage, StorageJanitor, object_group
+
+
+@pytest.fixture(params=["local", "object"])
+def storage(request, tmp_path):
+    if request.param == "local":
+        return LocalStorage(str(tmp_path / "storage"))
+    return ObjectStorage(MemoryObjectClient(), "bucket", "prefix")
+
+
+def test_put_get_exists_delete(storage):
+    assert not storage.exists("a/b.pdf")
+    assert storage.get("a/b.pdf") is None and storage.stat("a/b.pdf") is None
+
+    assert storage.put("a/b.pdf", b"0123456789")
+    assert storage.exists("a/b.pdf")
+    assert storage.get("a/b.pdf") == b"0123456789"
+    assert storage.get_range("a/b.pdf", 2, 5) == b"2345"
+    assert storage.stat("a/b.pdf").size == 10
+    assert [item.key for item in storage.iter_objects()] == ["a/b.pdf"]
+
+    storage.delete("a/b.pdf")
+    assert not storage.exists("a/b.pdf") and storage.get("a/b.pdf") is None
+    # 删除不存在的对象不报错
+    storage.delete("a/b.pdf")
+
+
+def test_put_without_overwrite_keeps_first(storage):
+    assert storage.put("key", b"first", overwrite=False)
+    assert not storage.put("key", b"second", overwrite=False)
+    assert storage.get("key") == b"first"
+    assert storage.put("key", b"second")
+    assert storage.get("key") == b"second"
+
+
+def test_invalid_keys_are_rejected(storage):
+    for key in ("", "../x", "a//b", "a b"):
+        with pytest.raises(ValueError):
+            storage.put(key, b"x")
+
+
+def test_janitor_expires_old_objects(storage):
+    storage.put("old", b"x" * 10)
+    storage.put("new", b"y" * 10)
+    janitor = StorageJanitor(storage, ttl=60, max_bytes=0)
+
+    assert janitor.sweep()["expired"] == 0
+    result = janitor.sweep(now=time.time() + 120)
+    assert result == {"expired": 2, "evicted": 0, "total_bytes": 0}
+    assert not storage.exists("old") and not storage.exists("new")
+
+
+def test_janitor_caps_total_size(storage):
+    for i in range(4):
+        storage.put(f"item-{i}", b"x" * 100)
+    result = StorageJanitor(storage, ttl=0, max_bytes=250).sweep()
+    assert result == {"expired": 0, "evicted": 2, "total_bytes": 200}
+    assert len(list(storage.iter_objects())) == 2
+
+
+def test_janitor_evicts_oldest_first(tmp_path):
+    storage = LocalStorage(str(tmp_path / "storage"))
+    for i in range(3):
+        storage.put(f"item-{i}", b"x" * 100)
+        os.utime(storage.local_path(f"item-{i}"), (1000 + i, 1000 + i))
+    StorageJanitor(storage, ttl=0, max_bytes=100).sweep()
+    assert [storage.exists(f"item-{i}") for i in range(3)] == [False, False, True]
+
+
+def test_janitor_discards_interrupted_writes(tmp_path):
+    storage = LocalStorage(str(tmp_path / "storage"))
+    storage.put("done", b"x")
+    leftover = storage.local_path("partial") + ".123.456.tmp"
+    os.makedirs(os.path.dirname(leftover), exist_ok=True)
+    open(leftover, "wb").close()
+    os.utime(leftover, (0, 0))
+
+    StorageJanitor(storage, ttl=0, max_bytes=0).sweep()
+    assert not os.path.exists(leftover)
+    assert [item.key for item in storage.iter_objects()] == ["done"]
+
+
+def test_exclusive_put_without_hard_links(tmp_path, monkeypatch):
+    def no_link(src, dst):
+        raise PermissionError(errno.EPERM, "hard links not supported")
+
+    monkeypatch.setattr(storage_module.os, "link", no_link)
+    storage = LocalStorage(str(tmp_path / "storage"))
+    assert storage.put("key", b"first", overwrite=False)
+    assert not storage.put("key", b"second", overwrite=False)
+    assert storage.get("key") == b"first"
+    # 临时文件已删除
+    assert [item.key for item in storage.iter_objects()] == ["key"]
+    assert storage.discard_incomplete(time.time() + 1) == 0
+
+
+def test_janitor_deletes_issued_metadata_and_content_together(storage):
+    issued = IssuedStore(storage)
+    first = issued.put("a" * 32, b"x" * 100, "pdf")
+    issued.put("b" * 32, b"y" * 100, "pdf")
+    # 按最新写入时间整体计算：元数据较新时内容也保留
+    if isinstance(storage, LocalStorage):
+        os.utime(storage.local_path(first.key), (0, 0))
+    assert StorageJanitor(storage, ttl=3600, max_bytes=0).sweep()["expired"] == 0
+    assert issued.get("a" * 32) is not None
+
+    total = sum(item.size for item in storage.iter_objects())
+    result = StorageJanitor(storage, ttl=0, max_bytes=total - 1).sweep()
+    assert result["evicted"] == 2
+    keys = sorted(item.key for item in storage.iter_objects())
+    # 只剩一张完整的证书：元数据和内容各一个
+    assert len(keys) == 2 and len({key.split(".", 1)[0] for key in keys}) == 1
+    assert sum(issued.get(cert_id * 32) is not None for cert_id in "ab") == 1
+
+
+def test_object_group():
+    assert object_group("issued/abc.json") == object_group("issued/abc.0123.pdf") == "issued/abc"
+    assert object_group("certificates/certificate_1.pdf") != object_group("certificates/certificate_2.pdf")
+    assert object_group("abc") == "abc"
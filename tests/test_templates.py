@@ -0,0 +1,36 @@
+"""
+模板缓存：按请求尺寸缓存的内容有上限
+"""
+from PIL import Image
+
+import config
+from certificate import templates
+
+
+def test_jpeg_cache_is_bounded_for_client_sizes(tmp_path):
+    path = str(tmp_path / "template.png")
+    Image.new("RGB", (400, 300), "white").save(path)
+    templates.clear_template_cache()
+    try:
+        # 每个不同的 width 对应一个尺寸
+        for width in range(100, 140):
+            data = templates.get_template_jpeg(path, size=(width, width * 3 // 4))
+            assert data.startswith(b"\xff\xd8")
+        assert len(templates._jpeg_cache) <= config.OUTPUT_SETTINGS["template_jpeg_cache_size"]
+        assert len(templates._scaled_cache) <= config.OUTPUT_SETTINGS["scaled_template_cache_size"]
+        # 最近使用的尺寸仍在缓存中
+        assert templates.get_template_jpeg(path, size=(139, 104)) is templates.get_template_jpeg(path, size=(139, 104))
+    finally:
+        templates.clear_template_cache()
+
+
+def test_jpeg_cache_follows_template_changes(tmp_path):
+    path = str(tmp_path / "template.png")
+    Image.new("RGB", (400, 300), "white").save(path)
+    templates.clear_template_cache()
+    try:
+        first = templates.get_template_jpeg(path, signature=(1, 1))
+        Image.new("RGB", (400, 300), "black").save(path)
+        assert templates.get_template_jpeg(path, signature=(2, 2)) != first
+    finally:
+        templates.clear_template_cache()
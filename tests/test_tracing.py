@@ -0,0 +1,66 @@
+"""
+请求级追踪：并发请求和跨线程池/进程池执行时，事件只记录到各自的追踪中
+"""
+import asyncio
+import os
+
+import pytest
+
+from certificate import generator, tracing
+from certificate.executor import RenderExecutor
+from certificate.storage import LocalStorage
+
+RECORD = {"ngo_name": "NGO", "contents": "Contents", "date": "2025"}
+
+
+def render_step(name):
+    """在执行器中运行的渲染步骤"""
+    tracing.event("render_step", request=name)
+    return name
+
+
+async def handle(executor, name, traced):
+    """模拟一个请求：开启追踪（或不开启），在事件循环和执行器中各记录事件"""
+    if not traced:
+        await asyncio.sleep(0.01)
+        result = await executor.run(render_step, name)
+        assert tracing.current_trace() is None
+        return result, None
+    with tracing.start_trace() as trace:
+        tracing.event("request", request=name)
+        await asyncio.sleep(0.01)
+        await executor.run(render_step, name)
+    return name, trace
+
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_concurrent_traces_are_isolated(kind):
+    executor = RenderExecutor(kind=kind, max_workers=2, max_queue=16)
+    names = [f"req-{i}" for i in range(6)]
+
+    async def scenario():
+        return await asyncio.gather(*(handle(executor, name, traced=i % 3 != 2) for i, name in enumerate(names)))
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+    for name, trace in results:
+        if trace is None:
+            continue
+        events = [(entry["event"], entry.get("request")) for entry in trace.timeline()]
+        assert ("request", name) in events and ("render_step", name) in events
+        # 只包含本请求的事件
+        assert {entry.get("request") for entry in trace.events if "request" in entry} == {name}
+    assert tracing.current_trace() is None
+
+
+def test_generate_to_storage_emits_one_certificate_event(tmp_path, monkeypatch, font_path):
+    storage = LocalStorage(str(tmp_path / "storage"))
+    monkeypatch.setattr(generator, "get_storage", lambda: storage)
+
+    with tracing.start_trace() as trace:
+        path = generator.generate_certificate(student_name="Ada", output_format="png", **RECORD)
+    assert os.path.isfile(path) and path.startswith(str(tmp_path))
+    assert [entry["event"] for entry in trace.events].count("certificate") == 1
@@ -0,0 +1,58 @@
+"""
+矢量引擎：字体子集的复用与嵌入
+"""
+from io import BytesIO
+
+import pytest
+
+from certificate import vector
+from certificate.generator import generate_certificate
+
+pytestmark = pytest.mark.skipif(not vector.is_available(), reason="需要 fonttools")
+
+
+@pytest.fixture
+def subset_builds(monkeypatch, font_path):
+    vector.clear_subset_cache()
+    builds = []
+    build = vector._build_font_subset
+
+    def counting_build(path, index, chars):
+        builds.append(chars)
+        return build(path, index, chars)
+
+    monkeypatch.setattr(vector, "_build_font_subset", counting_build)
+    yield builds
+    vector.clear_subset_cache()
+
+
+def render(name: str) -> bytes:
+    output = BytesIO()
+    generate_certificate(name, "NGO", "Certificate contents", "2025-01-01", output=output, engine="vector")
+    return output.getvalue()
+
+
+def test_one_font_object_per_face(subset_builds):
+    data = render("Ada Lovelace")
+    # 姓名、组织、内容、日期使用同一个字体，只嵌入一个子集
+    assert data.count(b"/Subtype /Type0") == 1
+    assert len(subset_builds) == 1
+
+
+def test_subset_reused_for_covered_names(subset_builds):
+    render("Ada Lovelace")
+    render("Ada Lovelace Byron")
+    builds = len(subset_builds)
+    # 字符都已包含在共用字符集中，不再生成子集
+    render("Lyla Breen")
+    render("Anya Lee")
+    assert len(subset_builds) == builds
+    assert set("Ada Lovelace Byron").issubset(subset_builds[-1])
+
+
+def test_charset_limit(subset_builds, monkeypatch):
+    monkeypatch.setitem(vector.config.VECTOR_SETTINGS, "subset_max_chars", 30)
+    render("Ada Lovelace")
+    render("Quentin Wyatt Jorg")
+    # 并集超过上限时只包含本次证书的字符
+    assert "A" not in subset_builds[-1] and "Q" in subset_builds[-1]